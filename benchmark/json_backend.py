@@ -0,0 +1,72 @@
+"""
+
+JSON后端性能对比：stdlib vs orjson vs ujson(未安装的后端会被跳过)
+
+运行方式::
+
+    python benchmark/json_backend.py
+
+使用三种有代表性的数据：小对象(单条接口响应)，带日期字段的数据库查询结果(1000行)和嵌套较深的配置文档，
+分别统计dumpb(写入响应)和loads(解析请求体)的平均耗时
+
+"""
+import os
+import sys
+import timeit
+import datetime
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from ancient.rig import jsonBackend  # noqa: E402
+
+
+def build_payloads():
+    now = datetime.datetime(2020, 5, 1, 12, 30)
+    rows = [{
+        "id": i,
+        "name": "用户{}".format(i),
+        "email": "user{}@example.com".format(i),
+        "score": i * 1.5,
+        "active": i % 3 == 0,
+        "created": now + datetime.timedelta(minutes=i),
+        "birthday": datetime.date(1990, 1, 1) + datetime.timedelta(days=i),
+    } for i in range(1000)]
+    document = {"level{}".format(i): {"items": list(range(20)), "tags": ["a", "b", "c"], "meta": {"deep": {"x": i}}}
+                for i in range(200)}
+    return {
+        "small object": ({"status": "success", "description": "ok", "message": "", "data": {"id": 1}}, False),
+        "1000 rows+dates": (rows, True),
+        "nested document": (document, False),
+    }
+
+
+def main():
+    payloads = build_payloads()
+    names = []
+    for name in ("stdlib", "orjson", "ujson"):
+        try:
+            jsonBackend.load_backend(name)
+            names.append(name)
+        except ImportError:
+            print("skip {}: not installed".format(name))
+
+    reference = {}
+    print("{:<16} {:<8} {:>12} {:>12} {:>9}".format("payload", "backend", "dumpb(us)", "loads(us)", "bytes"))
+    for payload_name, (data, encode_date) in payloads.items():
+        number = 20000 if payload_name == "small object" else 100
+        for name in names:
+            jsonBackend.use(name)
+            encoded = jsonBackend.dumpb(data, encode_date)
+            decoded = jsonBackend.loads(encoded)
+            # 所有后端解析后的内容必须一致
+            reference.setdefault(payload_name, decoded)
+            assert decoded == reference[payload_name], (payload_name, name)
+            t_dump = timeit.timeit(lambda: jsonBackend.dumpb(data, encode_date), number=number) / number * 1e6
+            t_load = timeit.timeit(lambda: jsonBackend.loads(encoded), number=number) / number * 1e6
+            print("{:<16} {:<8} {:>12.1f} {:>12.1f} {:>9}".format(payload_name, name, t_dump, t_load, len(encoded)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+
+代理响应流式转发性能对比：每块写出并flush vs 合并小块并等待客户端接收(反压)
+
+运行方式::
+
+    python benchmark/proxy_stream.py
+
+上游服务运行在独立的进程中，提供两种响应：
+
+    small chunks: 20000个256字节的块，每块单独flush，模拟日志流和SSE等逐条输出的接口
+    bulk: 64MB的文件，每次写64KB
+
+分别统计通过代理下载的耗时，吞吐量以及客户端收到的块数(近似写给客户端的次数)
+
+"""
+import os
+import sys
+import time
+import multiprocessing
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest  # noqa: E402
+from tornado.httpserver import HTTPServer  # noqa: E402
+from tornado.ioloop import IOLoop  # noqa: E402
+from tornado.netutil import bind_sockets  # noqa: E402
+from tornado.web import Application, RequestHandler  # noqa: E402
+
+from ancient.handlers.dealHandler import ProxyHandler  # noqa: E402
+
+SMALL_CHUNKS = 20000
+SMALL_SIZE = 256
+BULK_BYTES = 64 * 1024 * 1024
+BULK_SIZE = 64 * 1024
+ROUNDS = 3
+
+
+class SmallChunkHandler(RequestHandler):
+    async def get(self):
+        line = b"x" * (SMALL_SIZE - 1) + b"\n"
+        for _ in range(SMALL_CHUNKS):
+            self.write(line)
+            await self.flush()
+
+
+class BulkHandler(RequestHandler):
+    async def get(self):
+        block = b"b" * BULK_SIZE
+        for _ in range(BULK_BYTES // BULK_SIZE):
+            self.write(block)
+            await self.flush()
+
+
+class LegacyProxyHandler(ProxyHandler):
+    """
+    合并之前的行为：每收到一块就写出并flush，不等待客户端
+    """
+
+    def proxy_received_body(self, chunk):
+        self.write(chunk)
+        self.flush()
+
+
+def run_upstream(sockets):
+    server = HTTPServer(Application([(r"/small", SmallChunkHandler), (r"/bulk", BulkHandler)]))
+    server.add_sockets(sockets)
+    IOLoop.current().start()
+
+
+async def download(url):
+    chunks = []
+
+    def on_chunk(chunk):
+        chunks.append(len(chunk))
+
+    start = time.perf_counter()
+    await AsyncHTTPClient().fetch(HTTPRequest(url, streaming_callback=on_chunk, request_timeout=300))
+    return time.perf_counter() - start, sum(chunks), len(chunks)
+
+
+async def main(upstream_port):
+    address = "http://127.0.0.1:{}".format(upstream_port)
+
+    def option(alias):
+        return {"proxy_option": {"instead": "/" + alias, "address": address,
+                                 "host": "127.0.0.1:{}".format(upstream_port), "upstream": alias}}
+
+    app = Application([
+        (r"/legacy/.*", LegacyProxyHandler, option("legacy")),
+        (r"/coalesced/.*", ProxyHandler, option("coalesced")),
+    ])
+    sockets = bind_sockets(0, "127.0.0.1")
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+    port = sockets[0].getsockname()[1]
+
+    print("{:<14} {:<10} {:>10} {:>10} {:>12}".format("upstream", "proxy", "time(s)", "MB/s", "client chunks"))
+    for path in ("small", "bulk"):
+        for mode in ("legacy", "coalesced"):
+            best = None
+            for _ in range(ROUNDS):
+                result = await download("http://127.0.0.1:{}/{}/{}".format(port, mode, path))
+                if best is None or result[0] < best[0]:
+                    best = result
+            elapsed, size, count = best
+            print("{:<14} {:<10} {:>10.3f} {:>10.1f} {:>12}".format(
+                path, mode, elapsed, size / elapsed / 1024 / 1024, count))
+    server.stop()
+
+
+if __name__ == "__main__":
+    upstream_sockets = bind_sockets(0, "127.0.0.1")
+    upstream = multiprocessing.Process(target=run_upstream, args=(upstream_sockets,), daemon=True)
+    upstream.start()
+    try:
+        IOLoop.current().run_sync(lambda: main(upstream_sockets[0].getsockname()[1]))
+    finally:
+        upstream.terminate()
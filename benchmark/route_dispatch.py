@@ -0,0 +1,81 @@
+"""
+
+路由分发性能对比：tornado默认的逐条正则扫描 vs 前缀树路由分发器Dispatcher
+
+运行方式::
+
+    python benchmark/route_dispatch.py
+
+分别注册10/100/1000条路由(纯文本路由、RESTful路由、带前缀的静态路由以及最后的兜底静态路由)，
+统计命中靠后路由、命中RESTful路由和未命中任何动态路由(落入兜底静态路由)三种请求的平均分发耗时
+
+"""
+import os
+import sys
+import timeit
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.httputil import HTTPServerRequest  # noqa: E402
+from tornado.web import Application, RequestHandler  # noqa: E402
+
+from ancient.rig import register  # noqa: E402
+from ancient.rig.dispatcher import Dispatcher  # noqa: E402
+
+
+class NullHandler(RequestHandler):
+    pass
+
+
+class StaticNullHandler(RequestHandler):
+    pass
+
+
+def build_routes(total):
+    rf = register.RESTful()
+    routes = []
+    for i in range(total):
+        if i % 2:
+            routes.append((rf.e("zoos{}".format(i)).e("animals").url, NullHandler))
+        else:
+            routes.append(("/v1/api/route_{}".format(i), NullHandler))
+    routes.append((r"/s/(.*)", StaticNullHandler, {}))
+    routes.append((r"/(.*)", StaticNullHandler, {}))
+    return routes
+
+
+def build_requests(total):
+    last_literal = (total - 1) if (total - 1) % 2 == 0 else total - 2
+    last_restful = (total - 1) if (total - 1) % 2 else total - 2
+    return {
+        "late literal": HTTPServerRequest(uri="/v1/api/route_{}".format(last_literal)),
+        "late RESTful": HTTPServerRequest(uri="/zoos{}/12/animals/3".format(last_restful)),
+        "static miss": HTTPServerRequest(uri="/js/app.js"),
+    }
+
+
+def target_of(router, request):
+    delegate = router.find_handler(request)
+    return delegate.handler_class
+
+
+def main():
+    number = 2000
+    print("{:>6} {:<14} {:>14} {:>14} {:>8}".format("routes", "request", "linear(us)", "trie(us)", "speedup"))
+    for total in (10, 100, 1000):
+        routes = build_routes(total)
+        app = Application(routes)
+        linear = app.wildcard_router
+        trie = Dispatcher(app, routes)
+        for name, request in build_requests(total).items():
+            assert target_of(linear, request) is target_of(trie, request), name
+            t_linear = timeit.timeit(lambda: linear.find_handler(request), number=number) / number * 1e6
+            t_trie = timeit.timeit(lambda: trie.find_handler(request), number=number) / number * 1e6
+            print("{:>6} {:<14} {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+                total, name, t_linear, t_trie, t_linear / t_trie))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+
+SPA前端路由(深链接)性能对比：查找文件失败后再返回SPA页面 vs 静态目录文件索引
+
+运行方式::
+
+    python benchmark/spa_fallback.py
+
+在临时目录中生成一个包含index.html和若干js/css文件的前端项目，启动一个只有静态路由的服务，
+通过同一个keep-alive连接依次请求前端路由(/user/12/profile等，不存在的文件)和真实存在的静态文件，
+分别统计未开启和开启静态文件缓存(cache_bytes)时每个请求的平均耗时
+
+"""
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.httpserver import HTTPServer  # noqa: E402
+from tornado.ioloop import IOLoop  # noqa: E402
+from tornado.iostream import IOStream  # noqa: E402
+from tornado.netutil import bind_sockets  # noqa: E402
+from tornado.web import Application, HTTPError  # noqa: E402
+
+from ancient.handlers.dealHandler import StaticHandler  # noqa: E402
+from ancient.rig import staticCache  # noqa: E402
+
+REQUESTS = 2000
+
+
+class LegacySpaHandler(StaticHandler):
+    """
+    加入文件索引之前的行为：每个前端路由先查找文件，抛出404后再查找SPA页面
+    """
+
+    async def get(self, path, include_body=True):
+        try:
+            await self.serve_file(path, include_body)
+        except HTTPError:
+            await self.serve_file(self.spa_page, include_body)
+
+
+def build_project(root):
+    with open(os.path.join(root, "index.html"), "w") as fp:
+        fp.write("<!DOCTYPE html><html><body><div id='app'></div>" + "<!-- shell -->" * 200 + "</body></html>")
+    for directory in ("js", "css", "img/icons"):
+        os.makedirs(os.path.join(root, directory))
+    for i in range(50):
+        with open(os.path.join(root, "js", "chunk{}.js".format(i)), "w") as fp:
+            fp.write("console.log({});".format(i) * 100)
+        with open(os.path.join(root, "css", "page{}.css".format(i)), "w") as fp:
+            fp.write(".page{} {{ color: red; }}".format(i) * 50)
+
+
+async def fetch(stream, path):
+    await stream.write("GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n".format(path).encode())
+    head = await stream.read_until(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    if length:
+        await stream.read_bytes(length)
+    return int(head.split(b" ")[1])
+
+
+async def run(port, paths):
+    stream = IOStream(socket.socket())
+    await stream.connect(("127.0.0.1", port))
+    for path in paths[:100]:
+        assert await fetch(stream, path) == 200, path
+    start = time.perf_counter()
+    for path in paths:
+        await fetch(stream, path)
+    elapsed = time.perf_counter() - start
+    stream.close()
+    return elapsed / len(paths) * 1e6
+
+
+async def main():
+    root = tempfile.mkdtemp()
+    try:
+        build_project(root)
+        option = {"path": root, "default_filename": "index.html", "spa_page": "index.html"}
+        app = Application([
+            (r"/legacy/(.*)", LegacySpaHandler, option),
+            (r"/index/(.*)", StaticHandler, option),
+        ])
+        sockets = bind_sockets(0, "127.0.0.1")
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+
+        traffic = {
+            "deep link": ["/user/{}/orders/{}".format(i % 97, i) for i in range(REQUESTS)],
+            "asset": ["/js/chunk{}.js".format(i % 50) for i in range(REQUESTS)],
+        }
+        print("{:<12} {:<10} {:>14} {:>14} {:>9}".format("traffic", "cache", "legacy(us)", "index(us)", "speedup"))
+        for cache_name in ("off", "on"):
+            if cache_name == "on":
+                staticCache._static_cache = staticCache.StaticCache(64 * 1024 * 1024, 1024 * 1024)
+            for traffic_name, paths in traffic.items():
+                legacy = await run(port, ["/legacy" + path for path in paths])
+                index = await run(port, ["/index" + path for path in paths])
+                print("{:<12} {:<10} {:>14.1f} {:>14.1f} {:>8.2f}x".format(
+                    traffic_name, cache_name, legacy, index, legacy / index))
+        server.stop()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    IOLoop.current().run_sync(main)
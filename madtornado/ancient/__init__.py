@@ -3,6 +3,9 @@ import os
 from .custom import uiMethod, uiModule
 from .handlers import dealHandler
 from .rig.register import register_route, end_register_route
+from .rig.dispatcher import Dispatcher
+from .rig.compress import CompressTransform
+from .rig import proxyClient
 
 from .boot import boot
 from .conf import parser
@@ -11,6 +14,9 @@ __all__ = [
     "uiMethod", "uiModule",
     "dealHandler",
     "register_route",
+    "Dispatcher",
+    "CompressTransform",
+    "proxyClient",
 ]
 
 
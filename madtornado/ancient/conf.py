@@ -1,20 +1,322 @@
+"""
+
+conf模块读取config/tornado.cfg，按照SCHEMA转换成带类型的只读快照
+
+任意配置项都可以通过环境变量覆盖，格式为 MAD_节名称__配置项，节名称不区分大小写，
+环境变量名称中只能使用字母，数字和下划线，节名称中的其它字符按下面的规则转义::
+
+    -   写成 _       MAD_TORNADO_SERVER__PORT=8080        -> [tornado-server] port
+    :   写成 _3A_    MAD_DB_3A_REPLICA1__HOST=10.0.0.2    -> [db:replica1] host
+    _   写成 _5F_    MAD_DB_3A_ORDER_5F_DB__HOST=10.0.0.3 -> [db:order_db] host
+
+配置项名称原样转换为小写，不需要转义，如MAD_TORNADO_SERVER__DRAIN_TIMEOUT=10
+
+"""
 import configparser
+import json
+import os
+import re
+from types import MappingProxyType
 
 # 配置文件所在路径，相对于主程序入口server.py
 CONF_PATH = "config/tornado.cfg"
+# 环境变量覆盖配置项的前缀，格式为 MAD_节名称__配置项，节名称的转义规则见模块说明
+ENV_PREFIX = "MAD_"
+# 环境变量中节名称的转义，_3A_代表:，_5F_代表_，其余的_代表-
+ENV_ESCAPES = {"_3a_": ":", "_5f_": "_"}
+
+
+class ConfigError(ValueError):
+    """
+
+    配置文件内容无法按照声明的类型解析时抛出的异常，启动时一次性列出所有错误的配置项
+
+    """
+
+
+def to_bool(value):
+    value = value.strip().lower()
+    if value in ("true", "1", "yes", "on"):
+        return True
+    if value in ("false", "0", "no", "off", ""):
+        return False
+    raise ValueError("not a boolean")
+
+
+def to_int(value):
+    return int(value.strip())
+
+
+def to_json(value):
+    return freeze(json.loads(value))
+
+
+def to_list(value):
+    result = json.loads(value)
+    if not isinstance(result, list):
+        raise ValueError("not a JSON list")
+    return freeze(result)
+
+
+def to_choice(*choices):
+    def convert(value):
+        value = value.strip()
+        if value not in choices:
+            raise ValueError("must be one of {}".format(", ".join(choices)))
+        return value
+
+    return convert
+
+
+def to_workers(value):
+    value = value.strip()
+    if value == "auto":
+        return value
+    if int(value) < 1:
+        raise ValueError("must be a positive integer or auto")
+    return int(value)
+
+
+def freeze(value):
+    """
+
+    将json解析后的对象转换成不可变对象，list转换成tuple，dict转换成只读映射
+
+    :param value: json解析后的对象
+    :return: 不可变对象
+
+    """
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return MappingProxyType(dict((k, freeze(v)) for k, v in value.items()))
+    return value
+
 
-c_parser = configparser.ConfigParser()
-c_parser.read(CONF_PATH, encoding="utf-8-sig")
+# 配置项类型声明，格式为 {节名称: {配置项: (类型转换函数, 缺省时的默认值)}}，未声明的配置项保持字符串
+# 形如[db:名称]的节使用冒号前节名称的声明
+SCHEMA = {
+    "tornado": {
+        "release": (to_bool, "false"),
+        "json_backend": (to_choice("auto", "stdlib", "orjson", "ujson"), "auto"),
+    },
+    "tornado-server": {
+        "port": (to_int, "8095"),
+        "workers": (to_workers, "1"),
+        "max_restarts": (to_int, "100"),
+        "reuse_port": (to_bool, "false"),
+        "drain_timeout": (to_int, "30"),
+        "body_timeout": (to_int, "600"),
+    },
+    "tornado-secret": {
+        "xsrf_cookies": (to_bool, "false"),
+    },
+    "tornado-static": {
+        "url_prefix": (to_list, "[]"),
+        "cache_bytes": (to_int, "0"),
+        "cache_max_file": (to_int, "1048576"),
+        "cache_validate": (to_choice("mtime", "inotify"), "mtime"),
+        "spa_index": (to_bool, "true"),
+        "spa_index_interval": (to_int, "1"),
+    },
+    "tornado-compress": {
+        "compress": (to_bool, "false"),
+        "gzip": (to_bool, "true"),
+        "brotli": (to_bool, "true"),
+        "min_length": (to_int, "1024"),
+        "gzip_level": (to_int, "6"),
+        "brotli_quality": (to_int, "4"),
+        "precompressed": (to_bool, "true"),
+    },
+    "tornado-proxy": {
+        "xheaders": (to_bool, "false"),
+        "proxy_handler": (to_list, "[]"),
+        "client": (to_choice("auto", "simple", "curl"), "auto"),
+        "max_clients": (to_int, "1000"),
+        "connect_timeout": (to_int, "5"),
+        "request_timeout": (to_int, "10"),
+        "upload_timeout": (to_int, "900"),
+        "keep_alive": (to_bool, "true"),
+        "keep_alive_timeout": (to_int, "4"),
+        "max_idle": (to_int, "64"),
+        "upstream_option": (to_json, "{}"),
+        "max_body_size": (to_int, "0"),
+        "coalesce_bytes": (to_int, "65536"),
+        "coalesce_delay": (to_int, "10"),
+        "balance": (to_choice("round_robin", "least_conn", "hash"), "round_robin"),
+        "hash_header": (str.strip, ""),
+        "max_fails": (to_int, "3"),
+        "fail_timeout": (to_int, "10"),
+        "retries": (to_int, "1"),
+        "health_interval": (to_int, "0"),
+        "health_path": (str.strip, "/pong"),
+    },
+    "tornado-debug": {
+        "debug": (to_bool, "false"),
+        "autoreload": (to_bool, "false"),
+        "serve_traceback": (to_bool, "false"),
+        "compiled_template_cache": (to_bool, "true"),
+        "static_hash_cache": (to_bool, "true"),
+        "open_log": (to_bool, "false"),
+        "network_index": (to_int, "0"),
+    },
+    "token": {
+        "over_time": (to_int, "3600"),
+    },
+    "cache": {
+        "server_list": (to_list, "[]"),
+        "over_time": (to_int, "3600"),
+        "pool_size": (to_int, "16"),
+        "socket_timeout": (to_int, "3"),
+        "local_entries": (to_int, "0"),
+        "local_bytes": (to_int, "67108864"),
+        "local_ttl": (to_int, "60"),
+        "negative_ttl": (to_int, "5"),
+    },
+    "db": {
+        "max_connections": (to_int, "1024"),
+        "min_connections": (to_int, "0"),
+        "executor_workers": (to_int, "16"),
+        "idle_seconds": (to_int, "3600"),
+        "wait_connection_timeout": (to_int, "3"),
+        "port": (to_int, "3306"),
+        "autocommit": (to_bool, "true"),
+        "primary": (str.strip, ""),
+        "replicas": (to_list, "[]"),
+        "read_policy": (to_choice("round_robin", "least_busy"), "round_robin"),
+    },
+    "sqlite": {
+        "journal_mode": (to_choice("wal", "delete", "truncate", "persist", "memory", "off"), "wal"),
+        "synchronous": (to_choice("off", "normal", "full", "extra"), "normal"),
+        "cache_size": (to_int, "-65536"),
+        "mmap_size": (to_int, "268435456"),
+        "busy_timeout": (to_int, "5000"),
+        "executor_workers": (to_int, "4"),
+        "write_queue": (to_bool, "false"),
+        "write_batch": (to_int, "256"),
+        "write_delay": (to_int, "0"),
+    },
+}
+
+
+def read_config(path=CONF_PATH, environ=None):
+    """
+
+    读取配置文件并合并环境变量中的覆盖项
+
+    :param path: 配置文件路径
+    :param environ: 环境变量，默认为os.environ
+    :return: configparser.ConfigParser
+
+    """
+    raw = configparser.ConfigParser()
+    raw.read(path, encoding="utf-8-sig")
+    environ = os.environ if environ is None else environ
+    for key, value in environ.items():
+        if not key.startswith(ENV_PREFIX) or "__" not in key:
+            continue
+        section, opt = key[len(ENV_PREFIX):].split("__", 1)
+        section = re.sub(r"_(3a|5f)_|_", lambda m: ENV_ESCAPES.get(m.group(0), "-"), section.lower())
+        if not raw.has_section(section):
+            raw.add_section(section)
+        raw.set(section, opt.lower(), value)
+    return raw
+
+
+def build_snapshot(raw):
+    """
+
+    按照SCHEMA将原始配置转换成带类型的只读快照，所有无法转换的配置项汇总后抛出ConfigError
+
+    :param raw: configparser.ConfigParser
+    :return: {节名称: {配置项: 值}} 只读映射
+
+    """
+    errors = []
+    sections = {}
+    for section in set(raw.sections()) | set(SCHEMA):
+        base = section.split(":", 1)[0]
+        values = {}
+        if base != section and raw.has_section(base):
+            # [db:名称]这类节中未填写的配置项继承[db]节
+            values.update(raw.items(base))
+        if raw.has_section(section):
+            values.update(raw.items(section))
+        for opt, (convert, default) in SCHEMA.get(base, {}).items():
+            value = values.get(opt, default)
+            try:
+                values[opt] = convert(value)
+            except (ValueError, TypeError) as e:
+                errors.append("[{}] {} = {!r}: {}".format(section, opt, value, e))
+        sections[section] = MappingProxyType(values)
+
+    if not errors:
+        db = sections["db"]
+        for name in (db["primary"],) + db["replicas"]:
+            if name and name != "default" and "db:" + name not in sections:
+                errors.append("[db] refers to database {!r} but section [db:{}] is missing".format(name, name))
+    if errors:
+        raise ConfigError("Invalid configuration in {}:\n  {}".format(CONF_PATH, "\n  ".join(errors)))
+    return MappingProxyType(sections)
 
 
 class Parser:
+    """
+
+    配置解析器，启动时一次性读取并校验配置文件，生成带类型的只读快照，
+    之后获取配置不再进行字符串解析::
+
+        parser.section("db")["port"]  # int类型
+        parser.config["cache"]["server_list"]  # tuple类型
+
+    .. attribute:: config
+
+        当前生效的配置快照，reload()时整体替换，需要感知重新加载的地方不要长期持有该对象
+
+    """
+
+    def __init__(self):
+        self.config = build_snapshot(c_parser)
 
     @staticmethod
     def options(section):
+        """
+
+        获取原始字符串形式的配置内容，兼容旧版本，新代码请使用section方法
+
+        :param section: 节名称
+        :return: dict
+
+        """
         result = {}
         for opt in c_parser.options(section):
             result[opt] = c_parser.get(section, opt)
         return result
 
+    def section(self, section):
+        """
+
+        获取带类型的配置节
+
+        :param section: 节名称
+        :return: 只读映射
+
+        """
+        return self.config[section]
+
+    def reload(self):
+        """
+
+        重新读取配置文件，校验通过后替换当前快照，校验失败抛出ConfigError并保留原有配置
+
+        :return: None
+
+        """
+        global c_parser
+        raw = read_config()
+        self.config = build_snapshot(raw)
+        c_parser = raw
+
 
+c_parser = read_config()
 parser = Parser()
@@ -1,10 +1,14 @@
 from ..model.response import ResponseModel
+from ..rig import jsonBackend
 
-from tornado import escape
 from tornado.web import RequestHandler, HTTPError
+from tornado.escape import json_encode, utf8
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
 
 import time
-from json.decoder import JSONDecodeError
+import datetime
+import email.utils
 
 
 class BaseHandler(RequestHandler):
@@ -48,6 +52,9 @@ class BaseHandler(RequestHandler):
 
         self.cross_domain = None
 
+    # 响应缓存未命中时记录响应的responseCache.ResponseCapture，clear()在__init__中就会调用，因此定义为类属性
+    response_capture = None
+
     # @override
     def data_received(self, chunk):
         """
@@ -79,10 +86,93 @@ class BaseHandler(RequestHandler):
         不建议直接修改BaseHandler的该方法，应当继承BaseHandler后，重写该方法，并且之后拥有相同
         行为的Handler，继续继承同一个被改写prepare的Handler的类
 
+        请求方法被responseCache.cached装饰时在这里查找缓存，命中时直接finish()，请求方法不会执行，
+        重写该方法时需要调用super().prepare()才能使用响应缓存
+
         :return: None
 
         """
-        pass
+        method = getattr(self, self.request.method.lower(), None)
+        rule = getattr(method, "cache_rule", None)
+        if rule is not None and self.request.method in ("GET", "HEAD"):
+            try:
+                self.response_capture = await rule.serve(self)
+            except Exception as e:
+                app_log.warning("response cache lookup failed: %s", e)
+
+    # @override
+    def write(self, chunk):
+        """
+
+        ``重写方法`` 写入响应体，响应缓存未命中时同时记录写入的内容
+
+        :param chunk: str，bytes或dict
+        :return: None
+
+        """
+        super(BaseHandler, self).write(chunk)
+        if self.response_capture is not None:
+            if isinstance(chunk, dict):
+                chunk = json_encode(chunk)
+            self.response_capture.chunks.append(utf8(chunk))
+
+    # @override
+    def set_header(self, name, value):
+        super(BaseHandler, self).set_header(name, value)
+        if self.response_capture is not None:
+            self.response_capture.operations.append(("set_header", name, value))
+
+    # @override
+    def add_header(self, name, value):
+        super(BaseHandler, self).add_header(name, value)
+        if self.response_capture is not None:
+            self.response_capture.operations.append(("add_header", name, value))
+
+    # @override
+    def clear_header(self, name):
+        super(BaseHandler, self).clear_header(name)
+        if self.response_capture is not None:
+            self.response_capture.operations.append(("clear_header", name, None))
+
+    # @override
+    def set_cookie(self, name, value, *args, **kwargs):
+        super(BaseHandler, self).set_cookie(name, value, *args, **kwargs)
+        if self.response_capture is not None:
+            self.response_capture.cacheable = False
+
+    # @override
+    def clear(self):
+        super(BaseHandler, self).clear()
+        if self.response_capture is not None:
+            self.response_capture.cacheable = False
+
+    # @override
+    def flush(self, include_footers=False):
+        if self.response_capture is not None and not self.response_capture.finishing:
+            # 已经发送给客户端的响应不缓存，如write_array_stream
+            self.response_capture.cacheable = False
+        return super(BaseHandler, self).flush(include_footers)
+
+    # @override
+    def finish(self, chunk=None):
+        """
+
+        ``重写方法`` 完成响应，响应缓存未命中时保存记录的响应
+
+        :param chunk: 最后写入的内容
+        :return: Future
+
+        """
+        capture = self.response_capture
+        if capture is None:
+            return super(BaseHandler, self).finish(chunk)
+        capture.finishing = True
+        # If-None-Match匹配时finish()会把200改为304，保存之前的状态码
+        status = self.get_status()
+        future = super(BaseHandler, self).finish(chunk)
+        self.response_capture = None
+        IOLoop.current().spawn_callback(capture.rule.store, capture, status)
+        return future
 
     # @override
     def on_finish(self):
@@ -217,7 +307,8 @@ class BaseHandler(RequestHandler):
     def write_array(self, list_data, encode_date=False):
         """
 
-        返回JSON数据响应，对象数组
+        返回JSON数据响应，对象数组，GET请求在finish()时根据序列化后的内容自动计算强ETag，
+        If-None-Match匹配时返回304且不发送响应体
 
         :param list_data: 列表数据
         :param encode_date: 是否存在datetime类型的字段
@@ -225,7 +316,110 @@ class BaseHandler(RequestHandler):
 
         """
         self.set_header('Content-Type', "application/json; charset=UTF-8")
-        self.write(ResponseModel.dumps(list_data, encode_date))
+        self.write(jsonBackend.dumpb(list_data, encode_date))
+
+    async def write_array_stream(self, rows, chunk_rows=500, ndjson=False, encode_date=False, batched=False):
+        """
+
+        以流的方式返回JSON数组，每序列化chunk_rows行写入并flush一次，等待数据发送到客户端后再读取下一批，
+        内存占用只与chunk_rows有关，客户端可以立即开始接收数据::
+
+            await self.write_array_stream(row for row in huge_list)
+
+            async with asyncMysql.Component() as com:
+                await self.write_array_stream(com.iter_sql("select * from log"), batched=True)
+
+        响应头发送后出现的异常无法再返回错误状态码，客户端收到的是不完整的JSON
+
+        :param rows: 行的可迭代对象或异步可迭代对象
+        :param chunk_rows: 每次写入的行数
+        :param ndjson: 是否使用NDJSON格式(每行一个JSON对象)，否则为JSON数组
+        :param encode_date: 是否存在datetime类型的字段
+        :param batched: rows每次产生的是一批行，如asyncMysql的iter_sql
+        :return: None
+
+        """
+        if ndjson:
+            self.set_header('Content-Type', "application/x-ndjson; charset=UTF-8")
+        else:
+            self.set_header('Content-Type', "application/json; charset=UTF-8")
+            self.write(b"[")
+
+        first = True
+        chunk = []
+
+        async def emit():
+            nonlocal first
+            if ndjson:
+                self.write(b"".join(jsonBackend.dumpb(row, encode_date) + b"\n" for row in chunk))
+            else:
+                # 整批序列化成数组后去掉首尾的方括号，比逐行序列化少很多次函数调用
+                data = jsonBackend.dumpb(chunk, encode_date)[1:-1]
+                self.write(data if first else b"," + data)
+            first = False
+            chunk.clear()
+            await self.flush()
+
+        async def collect(item):
+            if batched:
+                chunk.extend(item)
+            else:
+                chunk.append(item)
+            if len(chunk) >= chunk_rows:
+                await emit()
+
+        if hasattr(rows, "__aiter__"):
+            async for item in rows:
+                await collect(item)
+        else:
+            for item in rows:
+                await collect(item)
+        if chunk:
+            await emit()
+        if not ndjson:
+            self.write(b"]")
+
+    def check_not_modified(self, modified=None, etag=None):
+        """
+
+        在生成响应之前检查客户端缓存是否仍然有效，适用于文件等能低成本获取修改时间或版本的资源，
+        返回True时状态码已设置为304，请求方法应直接返回，不再读取和序列化数据::
+
+            stat = os.stat(path)
+            if self.check_not_modified(stat.st_mtime):
+                return
+            self.write_dict(require(path))
+
+        未调用该方法的GET请求，tornado在finish()时根据响应体计算ETag并处理If-None-Match
+
+        :param modified: 最后修改时间，时间戳或UTC datetime，设置Last-Modified响应头
+        :param etag: 资源版本，设置为强ETag，设置后不再根据响应体计算ETag
+        :return: bool 客户端缓存有效时返回True
+
+        """
+        if etag is not None:
+            self.set_header("Etag", '"{}"'.format(etag))
+        if modified is not None:
+            if not isinstance(modified, datetime.datetime):
+                modified = datetime.datetime.fromtimestamp(modified, datetime.timezone.utc).replace(tzinfo=None)
+            modified = modified.replace(microsecond=0)
+            self.set_header("Last-Modified", modified)
+
+        # If-None-Match存在时优先于If-Modified-Since
+        if self.request.headers.get("If-None-Match"):
+            matched = etag is not None and self.check_etag_header()
+        else:
+            matched = False
+            since = self.request.headers.get("If-Modified-Since")
+            if since and modified is not None:
+                try:
+                    since = email.utils.parsedate_to_datetime(since).replace(tzinfo=None)
+                    matched = modified <= since
+                except (TypeError, ValueError):
+                    pass
+        if matched:
+            self.set_status(304)
+        return matched
 
     def write_jsonp(self, key, value):
         """
@@ -251,8 +445,8 @@ class BaseHandler(RequestHandler):
         """
         if type(self.json_body) is not dict:
             try:
-                self.json_body = escape.json_decode(self.request.body)
-            except JSONDecodeError as e:
+                self.json_body = jsonBackend.loads(self.request.body)
+            except ValueError:
                 self.json_body = {}
         return self.json_body
 
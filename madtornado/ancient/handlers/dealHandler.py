@@ -1,7 +1,19 @@
 from .inheritHandler import Base
-
-from tornado.httpclient import AsyncHTTPClient, HTTPClientError
-from tornado.web import StaticFileHandler, HTTPError
+from ..rig.compress import PRECOMPRESSED, accepted_encodings
+from ..rig.staticCache import StaticEntry, get_static_cache, get_shell_cache, get_static_index
+from ..rig.proxyClient import HOP_HEADERS, IDEMPOTENT_METHODS, get_upstream
+from ..conf import parser
+
+from tornado.httpclient import HTTPRequest
+from tornado.web import StaticFileHandler, HTTPError, stream_request_body
+from tornado.queues import Queue
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+from tornado import gen
+
+import os
+import sys
+import mimetypes
 
 """
 该模块下包含一些基类，可以通过配置文件控制这些基类的反应行为
@@ -13,12 +25,108 @@ class StaticHandler(StaticFileHandler, Base):
 
     继承 `StaticFileHandler` 和 `BaseHandler` ，用于处理静态文件访问控制的类，
 
+    开启precompressed时，如果客户端接受br或gzip且存在同名的.br或.gz文件(sea --build_precompress生成)，
+    直接返回预压缩文件，不再在每次请求时压缩
+
+    [tornado-static] cache_bytes大于0时，小于cache_max_file的文件连同ETag和响应头缓存在内存中(参考staticCache模块)，
+    带有Range请求头的请求不经过缓存
+
+    开启spa_page时通过静态目录的文件索引(staticCache.StaticIndex)判断请求的是文件还是前端路由，
+    前端路由直接返回缓存的SPA页面，SPA页面即使没有开启cache_bytes也会缓存
+
     """
 
-    def initialize(self, path: str, default_filename: str = None, spa_page: str = None) -> None:
+    def initialize(self, path: str, default_filename: str = None, spa_page: str = None,
+                   precompressed: bool = False) -> None:
         super(StaticHandler, self).initialize(path, default_filename)
         self.absolute_path = path  # 缺少这个属性web.py会报错，问题不大
         self.spa_page = spa_page
+        self.precompressed = precompressed
+        self.content_encoding = None
+        self.original_path = None
+        self.cache_entry = None
+
+    # @override
+    def validate_absolute_path(self, root, absolute_path):
+        """
+
+        ``重写方法`` 校验路径后查找客户端可以接受的预压缩文件，找到时以预压缩文件作为响应内容
+
+        :param root: 静态文件根目录
+        :param absolute_path: 请求文件的绝对路径
+        :return: 响应内容所在的绝对路径
+
+        """
+        absolute_path = super(StaticHandler, self).validate_absolute_path(root, absolute_path)
+        self.content_encoding = None
+        if not self.precompressed or absolute_path is None or "Range" in self.request.headers:
+            return absolute_path
+        accepted = accepted_encodings(self.request.headers.get("Accept-Encoding", ""))
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accepted and os.path.isfile(absolute_path + suffix):
+                self.content_encoding = encoding
+                self.original_path = absolute_path
+                # StaticFileHandler缓存了原文件的stat结果，大小和修改时间需要使用预压缩文件的
+                self._stat_result = os.stat(absolute_path + suffix)
+                return absolute_path + suffix
+        return absolute_path
+
+    def accepted_precompressed(self):
+        """
+
+        获取客户端接受的预压缩编码
+
+        :return: tuple 如("br", "gzip")，未开启precompressed时为空
+
+        """
+        if not self.precompressed:
+            return ()
+        accepted = accepted_encodings(self.request.headers.get("Accept-Encoding", ""))
+        return tuple(encoding for encoding, _ in PRECOMPRESSED if encoding in accepted)
+
+    # @override
+    def compute_etag(self):
+        """
+
+        ``重写方法`` 命中内存缓存时使用缓存中预先计算的ETag
+
+        :return: str
+
+        """
+        if self.cache_entry is not None:
+            return self.cache_entry.etag
+        return super(StaticHandler, self).compute_etag()
+
+    # @override
+    def get_content_type(self):
+        """
+
+        ``重写方法`` 返回预压缩文件时使用原文件的类型
+
+        :return: str
+
+        """
+        if self.cache_entry is not None:
+            return self.cache_entry.content_type
+        if self.content_encoding is None:
+            return super(StaticHandler, self).get_content_type()
+        mime_type, _ = mimetypes.guess_type(self.original_path)
+        return mime_type or "application/octet-stream"
+
+    # @override
+    def set_extra_headers(self, path):
+        """
+
+        ``重写方法`` 设置预压缩文件的Content-Encoding
+
+        :param path: 请求的相对路径
+        :return: None
+
+        """
+        if self.precompressed:
+            self.set_header("Vary", "Accept-Encoding")
+        if self.content_encoding is not None:
+            self.set_header("Content-Encoding", self.content_encoding)
 
     # @override
     async def get(self, path, include_body=True):
@@ -28,16 +136,69 @@ class StaticHandler(StaticFileHandler, Base):
 
         """
         if self.spa_page:
+            index = get_static_index(self.root)
+            if index is not None and not index.exists(path):
+                await self.serve_file(self.spa_page, include_body, shell=True)
+                return
             try:
-                await super(StaticHandler, self).get(path, include_body)
+                await self.serve_file(path, include_body)
                 return
             except HTTPError:
-                await super(StaticHandler, self).get(self.spa_page, include_body)
+                await self.serve_file(self.spa_page, include_body, shell=True)
                 return
         else:
+            await self.serve_file(path, include_body)
+
+    async def serve_file(self, path, include_body=True, shell=False):
+        """
+
+        返回静态文件，开启内存缓存时优先从缓存返回，否则等于StaticFileHandler.get()
+
+        :param path: 请求的相对路径
+        :param include_body: 是否返回内容，HEAD请求为False
+        :param shell: 是否为SPA页面，SPA页面总是缓存
+        :return: None
+
+        """
+        self.cache_entry = None
+        cache = get_shell_cache() if shell else get_static_cache()
+        if cache is None or "Range" in self.request.headers:
             await super(StaticHandler, self).get(path, include_body)
+            return
+        cache.watch(self.root)
+
+        self.path = self.parse_url_path(path)
+        absolute_path = self.get_absolute_path(self.root, self.path)
+        # 请求路径是否以/结尾会影响目录的重定向，需要区分缓存
+        key = (absolute_path, self.accepted_precompressed(), self.path.endswith("/"))
+        entry = cache.get(key)
+        if entry is None:
+            self.absolute_path = self.validate_absolute_path(self.root, absolute_path)
+            if self.absolute_path is None:
+                return
+            if self.get_content_size() > cache.max_file:
+                await super(StaticHandler, self).get(path, include_body)
+                return
+            with open(self.absolute_path, "rb") as fp:
+                content = fp.read()
+                stat = os.fstat(fp.fileno())
+            entry = StaticEntry(self.absolute_path, content, stat, self.get_content_type(), self.content_encoding)
+            cache.set(key, entry)
+
+        self.cache_entry = entry
+        self.absolute_path = entry.path
+        self.content_encoding = entry.encoding
+        self.modified = entry.modified
+        self.set_headers()
+        if self.should_return_304():
+            self.set_status(304)
+            return
+        self.set_header("Content-Length", len(entry.content))
+        if include_body:
+            self.write(entry.content)
 
 
+@stream_request_body
 class ProxyHandler(Base):
     """
 
@@ -61,9 +222,25 @@ class ProxyHandler(Base):
 
     代理路径是 http://你的域名/proxy_prefix/alias/要访问的路径
 
+    每个alias使用独立的上游客户端(参考proxyClient模块)，并发数，超时和连接复用在[tornado-proxy]中配置
+
+    请求体以流的方式转发，收到请求头后立即开始请求上游，每收到一块请求体就写给上游，
+    上一块写完之前不会读取下一块，上传大文件时内存占用与文件大小无关，
+    请求体大小限制为[tornado-proxy] max_body_size，为0时不限制(不受HTTPServer默认128MB的限制)
+
+    上游响应的小块合并到coalesce_bytes字节或等待coalesce_delay毫秒后再写给客户端，
+    写出后等待客户端接收完才继续读取上游，客户端接收慢时不会在内存中堆积上游的响应
+
+    alias可以对应一组后端，按[tornado-proxy] balance负载均衡，失败的后端会被暂时剔除::
+
+        proxy_handler = [["api", ["http://127.0.0.1:8001", "http://127.0.0.1:8002"]]]
+
+    幂等且没有请求体的请求在收到响应之前连接失败或超时时，换一个后端重试retries次，
+    最终失败时返回502，已经开始返回响应时断开客户端连接
+
     .. attribute:: proxy_address
 
-        代理地址关键信息，包含{instead, address, host}
+        代理地址关键信息，包含{instead, address, host, upstream, backends}
 
     """
 
@@ -73,6 +250,11 @@ class ProxyHandler(Base):
         self.is_status = True
         self.proxy_code = 200
         self.__proxy_option = self.__proxy_option or None
+        self.body_queue = Queue(maxsize=1)
+        self.upstream_future = None
+        self.body_chunks = []
+        self.body_buffered = 0
+        self.flush_timer = None
 
     # @override
     def initialize(self, **kwargs):
@@ -85,6 +267,9 @@ class ProxyHandler(Base):
 
         """
         self.__proxy_option = kwargs.get("proxy_option", None)
+        option = parser.section("tornado-proxy")
+        self.coalesce_bytes = option["coalesce_bytes"]
+        self.coalesce_delay = option["coalesce_delay"] / 1000
 
     # @override
     async def prepare(self):
@@ -97,6 +282,60 @@ class ProxyHandler(Base):
         """
         await super(ProxyHandler, self).prepare()
         self.set_access_headers()
+        max_body_size = parser.section("tornado-proxy")["max_body_size"]
+        self.request.connection.set_max_body_size(max_body_size or sys.maxsize)
+        headers = self.request.headers
+        has_body = int(headers.get("Content-Length", "0")) > 0 or "chunked" in headers.get("Transfer-Encoding", "")
+        if self.__proxy_option and has_body:
+            self.upstream_future = gen.convert_yielded(self.forward(self.produce_body))
+            self.upstream_future.add_done_callback(lambda _: self.drain_body())
+
+    # @override
+    async def data_received(self, chunk):
+        """
+
+        ``重写方法`` 收到一块请求体，等待上一块被上游读取后放入队列，形成反压
+
+        :param chunk: 请求体的一块
+        :return: None
+
+        """
+        if self.upstream_future is None or self.upstream_future.done():
+            return
+        await self.body_queue.put(chunk)
+
+    # @override
+    def on_connection_close(self):
+        """
+
+        ``重写方法`` 客户端在上传过程中断开连接时结束上游的请求体
+
+        :return: None
+
+        """
+        super(ProxyHandler, self).on_connection_close()
+        if self.upstream_future is not None and not self.upstream_future.done():
+            self.body_queue.put(None)
+
+    async def produce_body(self, write):
+        """
+
+        上游请求的body_producer，逐块写出请求体，None代表结束
+
+        :param write: 写入上游连接的方法，返回写完时完成的Future
+        :return: None
+
+        """
+        while True:
+            chunk = await self.body_queue.get()
+            if chunk is None:
+                return
+            await write(chunk)
+
+    def drain_body(self):
+        # 上游提前响应(如413)后不再读取请求体，释放等待放入队列的data_received
+        while self.body_queue.qsize():
+            self.body_queue.get_nowait()
 
     # @override
     async def options(self):
@@ -186,14 +425,37 @@ class ProxyHandler(Base):
     def proxy_received_body(self, chunk):
         """
 
-        处理收到的body信息
+        处理收到的body信息，合并到coalesce_bytes字节后立即写出，否则最多等待coalesce_delay毫秒
 
         :param chunk: 收到的body块
-        :return: None
+        :return: 写出时返回flush的Future，上游客户端等待其完成后再读取下一块，否则为None
 
         """
-        self.write(chunk)
-        self.flush()
+        self.body_chunks.append(chunk)
+        self.body_buffered += len(chunk)
+        if self.body_buffered >= self.coalesce_bytes or not self.coalesce_delay:
+            return self.flush_body()
+        if self.flush_timer is None:
+            self.flush_timer = IOLoop.current().call_later(self.coalesce_delay, self.flush_body)
+        return None
+
+    def flush_body(self):
+        """
+
+        把合并的body写给客户端
+
+        :return: flush的Future，没有待写出的内容时为None
+
+        """
+        if self.flush_timer is not None:
+            IOLoop.current().remove_timeout(self.flush_timer)
+            self.flush_timer = None
+        if not self.body_chunks:
+            return None
+        self.write(b"".join(self.body_chunks))
+        self.body_chunks = []
+        self.body_buffered = 0
+        return self.flush()
 
     async def proxy(self):
         """
@@ -204,26 +466,68 @@ class ProxyHandler(Base):
 
         :return:  None
 
+        """
+        if self.upstream_future is None:
+            await self.forward()
+            return
+        await self.body_queue.put(None)
+        await self.upstream_future
+
+    async def forward(self, body_producer=None):
+        """
+
+        请求上游并把响应流式返回给客户端
+
+        :param body_producer: 流式请求体，没有请求体时为None
+        :return: None
+
         """
         if not self.__proxy_option:
             self.throw(404)
             return
 
         opt = self.__proxy_option
+        upstream = get_upstream(opt["upstream"], opt.get("backends") or [opt["address"]])
 
-        req_uri = opt["address"] + self.request.uri.replace(opt["instead"], "")
-        body = self.request.body if self.request.body else None
+        path = self.request.uri.replace(opt["instead"], "")
         method = self.request.method
-        headers = self.request.headers
-        headers["Host"] = opt["host"]
+        headers = self.request.headers.copy()
+        for name in HOP_HEADERS:
+            headers.pop(name, None)
+        retries = upstream.retries if method in IDEMPOTENT_METHODS and body_producer is None else 0
+        # 流式请求体的上传时间取决于客户端，不能使用request_timeout
+        request_timeout = upstream.upload_timeout if body_producer is not None else None
+        tried = []
         try:
-            await AsyncHTTPClient().fetch(req_uri, method=method, body=body, headers=headers,
-                                          validate_cert=False, request_timeout=10,
-                                          header_callback=self.proxy_received_header,
-                                          streaming_callback=self.proxy_received_body)
-        except HTTPClientError as e:
-            if e.code > 555:
-                self.throw(e.code)
+            while True:
+                backend = upstream.select(self.request, tried)
+                tried.append(backend)
+                headers["Host"] = backend.host
+                request = HTTPRequest(backend.address + path, method=method, headers=headers.copy(),
+                                      body_producer=body_producer, request_timeout=request_timeout,
+                                      validate_cert=False,
+                                      allow_nonstandard_methods=True,
+                                      header_callback=self.proxy_received_header,
+                                      streaming_callback=self.proxy_received_body)
+                try:
+                    await upstream.fetch(request, backend)
+                    return
+                except Exception as e:
+                    # 连接失败，超时等任何错误都已经在upstream.fetch中记为后端失败，还没有收到响应时才能换一个后端重试
+                    if self.is_status and len(tried) <= retries:
+                        upstream.retried += 1
+                        continue
+                    message = "proxy {} backend {} failed: {!r}".format(upstream.name, backend.address, e)
+                    if self._headers_written:
+                        # 响应已经开始返回给客户端，只能断开连接，避免被截断的响应看起来是完整的
+                        app_log.warning("%s", message)
+                        self.request.connection.close()
+                        return
+                    self.body_chunks = []
+                    self.body_buffered = 0
+                    self.throw(502, log_message=message)
+        finally:
+            self.flush_body()
 
 
 class PongHandler(Base):
@@ -39,8 +39,9 @@ class CROSBaseHandler(BaseHandler):
 
     """
 
-    def prepare(self):
+    async def prepare(self):
         self.set_access_headers()
+        await super(CROSBaseHandler, self).prepare()
 
     def options(self, *args):
         self.set_access_headers()
@@ -1,3 +1,5 @@
+from ..rig import jsonBackend
+
 import json
 import datetime
 
@@ -46,14 +48,11 @@ class ResponseModel:
     def dumps(data, encode_date=False):
         """
 
-        json.dumps的别名，用于方便调用
+        jsonBackend.dumps的别名，用于方便调用，序列化后端由[tornado] json_backend配置
 
         :param data: 需要解析的数据对象
         :param encode_date: 对象中是否存在date或datetime对象
         :return: str
 
         """
-        if encode_date:
-            return json.dumps(data, cls=DateEncoder, ensure_ascii=False)
-        else:
-            return json.dumps(data)
+        return jsonBackend.dumps(data, encode_date)
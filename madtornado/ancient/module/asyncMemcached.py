@@ -0,0 +1,460 @@
+from ..conf import parser
+from ..rig.hashRing import HashRing
+from ..rig.localCache import MISSING, get_local_cache
+
+from tornado import gen, locks
+from tornado.tcpclient import TCPClient
+from tornado.tcpserver import TCPServer
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.log import app_log
+
+import time
+import pickle
+import collections
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+print("[asyncMemcached] is imported.")
+
+# 与python-memcached保持一致的flags，两个模块写入的缓存可以互相读取
+FLAG_PICKLE = 1 << 0
+FLAG_INTEGER = 1 << 1
+FLAG_LONG = 1 << 2
+FLAG_COMPRESSED = 1 << 3
+FLAG_TEXT = 1 << 4
+
+# 服务器出错后暂停使用的时间，单位秒
+DEAD_RETRY = 30
+
+_client = None  # type: Optional[Client]
+
+
+class MemcachedError(Exception):
+    """
+
+    memcached服务端返回了无法识别的响应
+
+    """
+
+
+def encode_key(key) -> bytes:
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    if len(key) > 250 or any(c <= 32 or c == 127 for c in key):
+        raise ValueError("Invalid memcached key: {!r}".format(key))
+    return key
+
+
+def encode_value(value) -> Tuple[int, bytes]:
+    """
+
+    将值转换成memcached存储格式，编码方式与python-memcached一致
+
+    :param value: 缓存值
+    :return: (flags, 字节内容)
+
+    """
+    value_type = type(value)
+    if value_type == bytes:
+        return 0, value
+    if value_type == str:
+        return FLAG_TEXT, value.encode("utf-8")
+    if value_type == int:
+        return FLAG_INTEGER, ("%d" % value).encode("ascii")
+    return FLAG_PICKLE, pickle.dumps(value, 0)
+
+
+def decode_value(flags: int, data: bytes):
+    if flags & FLAG_COMPRESSED:
+        import zlib
+        data = zlib.decompress(data)
+        flags &= ~FLAG_COMPRESSED
+    if flags == 0:
+        return data
+    if flags & FLAG_TEXT:
+        return data.decode("utf-8")
+    if flags & (FLAG_INTEGER | FLAG_LONG):
+        return int(data)
+    if flags & FLAG_PICKLE:
+        return pickle.loads(data)
+    raise MemcachedError("Unknown flags on get: {:x}".format(flags))
+
+
+class ServerPool:
+    """
+
+    单台memcached服务器的连接池，每个连接同一时间只处理一个请求
+
+    :param address: 服务器地址，格式为host:port
+    :param size: 最大连接数量
+    :param timeout: 连接和请求的超时时间，单位秒
+
+    """
+
+    def __init__(self, address: str, size: int = 16, timeout: float = 3):
+        host, _, port = address.rpartition(":")
+        self.address = address
+        self.host = host or address
+        self.port = int(port) if host else 11211
+        self.timeout = timedelta(seconds=timeout)
+        self.idle = collections.deque()
+        self.semaphore = locks.Semaphore(size)
+        self.dead_until = 0.0
+
+    def alive(self) -> bool:
+        return self.dead_until <= time.time()
+
+    async def request(self, func, *args):
+        """
+
+        取出一个连接执行func(stream, *args)，超时或出错的连接不会被放回连接池，服务器在DEAD_RETRY秒内不再被使用
+
+        :param func: 读写连接的协程函数
+        :param args: 函数参数
+        :return: func的返回值
+
+        """
+        async with self.semaphore:
+            stream = self.idle.pop() if self.idle else None
+            try:
+                if stream is None or stream.closed():
+                    stream = await gen.with_timeout(self.timeout, TCPClient().connect(self.host, self.port))
+                result = await gen.with_timeout(self.timeout, func(stream, *args))
+            except Exception as e:
+                if stream is not None:
+                    stream.close()
+                if not isinstance(e, MemcachedError):
+                    self.dead_until = time.time() + DEAD_RETRY
+                raise
+            self.idle.append(stream)
+            return result
+
+
+async def _get(stream: IOStream, keys: List[bytes]) -> Dict[bytes, Any]:
+    await stream.write(b"get " + b" ".join(keys) + b"\r\n")
+    result = {}
+    while True:
+        line = await stream.read_until(b"\r\n")
+        if line == b"END\r\n":
+            return result
+        parts = line.split()
+        if len(parts) < 4 or parts[0] != b"VALUE":
+            raise MemcachedError(line.strip().decode("utf-8", "replace"))
+        data = await stream.read_bytes(int(parts[3]) + 2)
+        result[parts[1]] = decode_value(int(parts[2]), data[:-2])
+
+
+async def _store(stream: IOStream, cmd: bytes, items: List[Tuple[bytes, Any]], expire: int) -> List[bytes]:
+    # 所有命令一次写出，再依次读取结果，一次往返完成多个设置
+    chunks = []
+    for key, value in items:
+        flags, data = encode_value(value)
+        chunks.append(b"%s %s %d %d %d\r\n%s\r\n" % (cmd, key, flags, expire, len(data), data))
+    await stream.write(b"".join(chunks))
+    failed = []
+    for key, _ in items:
+        line = await stream.read_until(b"\r\n")
+        if line != b"STORED\r\n":
+            if line not in (b"NOT_STORED\r\n", b"EXISTS\r\n", b"NOT_FOUND\r\n"):
+                raise MemcachedError(line.strip().decode("utf-8", "replace"))
+            failed.append(key)
+    return failed
+
+
+async def _delete(stream: IOStream, keys: List[bytes]) -> int:
+    await stream.write(b"".join(b"delete " + key + b"\r\n" for key in keys))
+    deleted = 0
+    for _ in keys:
+        line = await stream.read_until(b"\r\n")
+        if line == b"DELETED\r\n":
+            deleted += 1
+        elif line != b"NOT_FOUND\r\n":
+            raise MemcachedError(line.strip().decode("utf-8", "replace"))
+    return deleted
+
+
+class Client:
+    """
+
+    基于tornado IOStream的异步memcached客户端，每台服务器维护一个连接池，
+    通过一致性哈希分配key，服务器不可用时转移到哈希环上的下一台服务器
+
+    :param server_list: 服务器地址列表
+    :param pool_size: 每台服务器的最大连接数量
+    :param timeout: 连接和请求的超时时间，单位秒
+
+    """
+
+    def __init__(self, server_list: Iterable[str], pool_size: int = 16, timeout: float = 3):
+        self.servers = dict((s, ServerPool(s, pool_size, timeout)) for s in server_list)
+        self.ring = HashRing(list(self.servers))
+
+    def server(self, key: bytes) -> Optional[ServerPool]:
+        for node in self.ring.iter_nodes(key):
+            pool = self.servers[node]
+            if pool.alive():
+                return pool
+        return None
+
+    def group(self, keys: Iterable) -> Dict[ServerPool, List[bytes]]:
+        groups = collections.OrderedDict()
+        for key in keys:
+            key = encode_key(key)
+            pool = self.server(key)
+            if pool is not None:
+                groups.setdefault(pool, []).append(key)
+        return groups
+
+    async def call(self, pool: ServerPool, func, *args):
+        try:
+            return await pool.request(func, *args)
+        except (StreamClosedError, gen.TimeoutError, OSError, MemcachedError) as e:
+            app_log.warning("memcached %s failed: %s", pool.address, e)
+            return None
+
+    async def get(self, key):
+        """
+
+        获取缓存，未命中或服务器不可用时返回None
+
+        :param key: 缓存的key
+        :return: 缓存值
+
+        """
+        return (await self.get_multi([key])).get(key)
+
+    async def get_multi(self, keys: Iterable) -> Dict[Any, Any]:
+        """
+
+        批量获取缓存，每台服务器只发送一条get命令，多台服务器并发请求
+
+        :param keys: key列表
+        :return: 命中的{key: value}
+
+        """
+        keys = list(keys)
+        origin = dict((encode_key(k), k) for k in keys)
+        groups = self.group(keys)
+        results = await gen.multi([self.call(pool, _get, group) for pool, group in groups.items()])
+        found = {}
+        for result in results:
+            for key, value in (result or {}).items():
+                found[origin[key]] = value
+        return found
+
+    async def set(self, key, value, expire: int = 0) -> bool:
+        """
+
+        设置缓存
+
+        :param key: 缓存的key
+        :param value: 缓存值，支持bytes，str，int，其余类型使用pickle序列化
+        :param expire: 过期时间，单位秒，0代表不过期
+        :return: 是否设置成功
+
+        """
+        return not await self.set_multi({key: value}, expire)
+
+    async def set_multi(self, mapping: Dict[Any, Any], expire: int = 0, cmd: str = "set") -> List:
+        """
+
+        批量设置缓存，发往同一台服务器的命令合并为一次写出
+
+        :param mapping: {key: value}
+        :param expire: 过期时间，单位秒，0代表不过期
+        :param cmd: 存储命令，set，add或replace
+        :return: 设置失败的key列表
+
+        """
+        origin = dict((encode_key(k), k) for k in mapping)
+        groups = self.group(mapping)
+        unassigned = set(origin) - set(k for group in groups.values() for k in group)
+        tasks = []
+        for pool, group in groups.items():
+            items = [(k, mapping[origin[k]]) for k in group]
+            tasks.append(self.call(pool, _store, cmd.encode("ascii"), items, expire))
+        results = await gen.multi(tasks)
+        failed = [origin[k] for k in unassigned]
+        for group, result in zip(groups.values(), results):
+            failed.extend(origin[k] for k in (group if result is None else result))
+        return failed
+
+    async def add(self, key, value, expire: int = 0) -> bool:
+        return not await self.set_multi({key: value}, expire, "add")
+
+    async def delete(self, key) -> bool:
+        return bool(await self.delete_multi([key]))
+
+    async def delete_multi(self, keys: Iterable) -> int:
+        """
+
+        批量删除缓存
+
+        :param keys: key列表
+        :return: 删除成功的数量
+
+        """
+        groups = self.group(keys)
+        results = await gen.multi([self.call(pool, _delete, group) for pool, group in groups.items()])
+        return sum(r or 0 for r in results)
+
+
+def get_client() -> Client:
+    """
+
+    获取进程内共享的异步客户端，第一次调用时根据[cache]配置创建
+
+    :return: Client
+
+    """
+    global _client
+    if _client is None:
+        option = parser.section("cache")
+        _client = Client(option["server_list"], option["pool_size"], option["socket_timeout"])
+    return _client
+
+
+class Component:
+    """
+
+    异步memcached模块，所有Component共享进程内的客户端和连接池::
+
+        async with Component() as cache:
+            await cache.set("key", "value")
+            result = await cache.get_multi(["k1", "k2"])  # 每台服务器只需要一次往返
+
+    [cache] local_entries大于0时，读取先经过进程内的一级缓存(参考localCache模块)，
+    同一个key的并发未命中只向memcached请求一次
+
+    """
+
+    def __init__(self):
+        self.over_time = parser.section("cache")["over_time"]
+        self.client = None
+        self.local = get_local_cache()
+
+    async def __aenter__(self):
+        self.on()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.off()
+
+    def on(self) -> None:
+        self.client = get_client()
+
+    def off(self) -> None:
+        self.client = None
+
+    async def get(self, key):
+        if self.local is None:
+            return await self.client.get(key)
+        client = self.client
+        return await self.local.load_async(key, lambda: client.get(key), self.over_time)
+
+    async def get_multi(self, keys: Iterable) -> Dict[Any, Any]:
+        if self.local is None:
+            return await self.client.get_multi(keys)
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is MISSING:
+                missing.append(key)
+            elif value is not None:
+                found[key] = value
+        if missing:
+            loaded = await self.client.get_multi(missing)
+            for key in missing:
+                value = loaded.get(key)
+                self.local.set(key, value, self.over_time)
+                if value is not None:
+                    found[key] = value
+        return found
+
+    async def set(self, key, value, over_time: int = None) -> bool:
+        return not await self.set_multi({key: value}, over_time)
+
+    async def set_multi(self, mapping: Dict[Any, Any], over_time: int = None) -> List:
+        over_time = self.over_time if over_time is None else over_time
+        failed = await self.client.set_multi(mapping, over_time)
+        if self.local is not None:
+            for key, value in mapping.items():
+                if key in failed:
+                    self.local.delete(key)
+                else:
+                    self.local.set(key, value, over_time)
+        return failed
+
+    async def delete(self, key) -> bool:
+        return bool(await self.delete_multi([key]))
+
+    async def delete_multi(self, keys: Iterable) -> int:
+        keys = list(keys)
+        if self.local is not None:
+            for key in keys:
+                self.local.delete(key)
+        return await self.client.delete_multi(keys)
+
+
+class MemoryServer(TCPServer):
+    """
+
+    进程内的memcached替身服务器，实现get/gets/set/add/replace/delete/flush_all/version命令，
+    用于开发和测试环境，不需要安装memcached::
+
+        server = MemoryServer()
+        server.listen(11211)
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MemoryServer, self).__init__(*args, **kwargs)
+        self.data = {}  # type: Dict[bytes, Tuple[int, bytes, float]]
+
+    def lookup(self, key: bytes) -> Optional[Tuple[int, bytes, float]]:
+        item = self.data.get(key)
+        if item is not None and item[2] and item[2] <= time.time():
+            del self.data[key]
+            return None
+        return item
+
+    # @override
+    async def handle_stream(self, stream, address):
+        try:
+            while True:
+                line = await stream.read_until(b"\r\n")
+                await stream.write(await self.execute(stream, line.split()))
+        except StreamClosedError:
+            pass
+
+    async def execute(self, stream: IOStream, parts: List[bytes]) -> bytes:
+        if not parts:
+            return b"ERROR\r\n"
+        cmd = parts[0]
+        if cmd in (b"get", b"gets"):
+            out = []
+            for key in parts[1:]:
+                item = self.lookup(key)
+                if item is not None:
+                    out.append(b"VALUE %s %d %d\r\n%s\r\n" % (key, item[0], len(item[1]), item[1]))
+            return b"".join(out) + b"END\r\n"
+        if cmd in (b"set", b"add", b"replace"):
+            key, flags, expire, length = parts[1], int(parts[2]), int(parts[3]), int(parts[4])
+            data = (await stream.read_bytes(length + 2))[:-2]
+            exists = self.lookup(key) is not None
+            if (cmd == b"add" and exists) or (cmd == b"replace" and not exists):
+                return b"NOT_STORED\r\n"
+            self.data[key] = (flags, data, time.time() + expire if expire else 0)
+            return b"STORED\r\n"
+        if cmd == b"delete":
+            if self.lookup(parts[1]) is None:
+                return b"NOT_FOUND\r\n"
+            del self.data[parts[1]]
+            return b"DELETED\r\n"
+        if cmd == b"flush_all":
+            self.data.clear()
+            return b"OK\r\n"
+        if cmd == b"version":
+            return b"VERSION madtornado\r\n"
+        return b"ERROR\r\n"
@@ -1,20 +1,50 @@
 from ..rig import genSQL
-from ..conf import parser
+from ..rig.dbRoute import DEFAULT, balancer, db_option
 
 import tormysql
+from pymysql.constants import SERVER_STATUS
 
-from typing import List, Tuple, Dict, TypeVar, Any, overload
+import time
+from typing import List, Tuple, Dict, TypeVar, Any, Iterable, overload
 
 SQL_CONTENT = TypeVar("SQL_CONTENT", int, float, str, bool)
 
-option = parser.options("db")
+pools = {}  # type: Dict[str, tormysql.ConnectionPool]
 print("[asyncMysql] is imported.")
 
 
+def get_pool(name: str = DEFAULT) -> tormysql.ConnectionPool:
+    """
+
+    获取指定名称数据库的连接池，首次使用时根据[db:名称]节创建
+
+    :param name: 数据库名称，default代表[db]节
+    :return: tormysql.ConnectionPool
+
+    """
+    pool = pools.get(name)
+    if pool is None:
+        option = db_option(name)
+        pool = pools[name] = tormysql.ConnectionPool(
+            max_connections=option["max_connections"],
+            idle_seconds=option["idle_seconds"],
+            wait_connection_timeout=option["wait_connection_timeout"],
+            host=option["host"],
+            port=option["port"],
+            user=option["user"],
+            passwd=option["password"],
+            db=option["db"],
+            charset=option["charset"],
+            autocommit=option["autocommit"]
+        )
+    return pool
+
+
 class Component:
     """
 
-    该模块参数均来源与madtornado配置文件，并且不支持同时连接多个不同的数据库
+    该模块参数均来源与madtornado配置文件，支持通过[db:名称]节配置多个数据库，
+    配置了replicas时查询语句自动发往从库，写入语句发往primary，参考dbRoute模块
 
     异步mysql快速请求模块(基于tormysql)，示例::
 
@@ -23,31 +53,42 @@ class Component:
         result = await db.select_tcw("mt")  # 读取mt表下的所有内容并返回
         self.write(result) # 返回给前台页面显示
 
+        # 指定数据库，所有语句都发往该数据库，不再进行读写分离
+        db = asyncMysql().Component(using="replica1")
+
+        # 多条写入语句合并为一次提交，出现异常时全部回滚
+        async with db.transaction():
+            await db.insert_tc("order", {"id": 1})
+            await db.update_tcw("stock", {"count": 9}, "id=%s", [1])
+
+    读写分离时连接在第一次执行对应语句时才获取，conn和cur属性在第一次写入前为None，
+    主库连接处于事务中时查询语句也使用主库连接，保证能读到事务内的修改
+
     安全建议::
 
         永远不要相信用户输入内容，sql模块虽然对于value进行了预检测
         但是对于key部分还是无能为力，所以一定不要让用户对key的部分有
         任何操作，只基于用户提供value值的权限，这样做是安全的。
 
+    :param using: 数据库名称，指定后读写都使用该数据库
+
     """
 
-    sql_pool = tormysql.ConnectionPool(
-        max_connections=int(option["max_connections"]),
-        idle_seconds=int(option["idle_seconds"]),
-        wait_connection_timeout=int(option["wait_connection_timeout"]),
-        host=option["host"],
-        port=int(option["port"]),
-        user=option["user"],
-        passwd=option["password"],
-        db=option["db"],
-        charset=option["charset"]
-    )
-
-    def __init__(self):
+    sql_pool = get_pool(DEFAULT)
+
+    def __init__(self, using: str = None):
+        self.using = using
         self.conn = None
         self.cur = None
-        self.is_return_dict = False
+        self.conn_name = None
+        self.read_conn = None
+        self.read_cur = None
+        self.read_name = None
+        # 默认返回字典格式的数据，可以通过set_return_dict(False)改为元组
+        self.is_return_dict = True
         self.switch = False
+        self.stream = None
+        self.tx_depth = 0
 
     async def __aenter__(self):
         await self.on()
@@ -66,7 +107,21 @@ class Component:
 
         """
         self.is_return_dict = is_return_dict
-        self.cur = self.conn.cursor(tormysql.DictCursor if is_return_dict else None)
+        cursor_cls = tormysql.DictCursor if is_return_dict else None
+        if self.conn is not None:
+            self.cur = self.conn.cursor(cursor_cls)
+        if self.read_conn is not None:
+            self.read_cur = self.read_conn.cursor(cursor_cls)
+
+    def split(self) -> bool:
+        """
+
+        当前是否进行读写分离
+
+        :return: bool
+
+        """
+        return self.using is None and balancer.has_replicas()
 
     async def on(self) -> None:
         """
@@ -92,9 +147,51 @@ class Component:
         :return: None
 
         """
-        self.conn = await Component.sql_pool.Connection()
-        self.set_return_dict()
         self.switch = True
+        if not self.split():
+            await self.writer()
+
+    async def writer(self) -> Tuple:
+        """
+
+        获取写入语句使用的连接和游标，不存在时从primary或using指定的数据库获取
+
+        :return: (连接，游标)
+
+        """
+        if self.conn is None:
+            name = self.using or balancer.primary()
+            balancer.acquire(name)
+            try:
+                self.conn = await get_pool(name).Connection()
+            except Exception:
+                balancer.release(name)
+                raise
+            self.conn_name = name
+            self.cur = self.conn.cursor(tormysql.DictCursor if self.is_return_dict else None)
+        return self.conn, self.cur
+
+    async def reader(self) -> Tuple:
+        """
+
+        获取查询语句使用的连接和游标，不进行读写分离或主库连接处于事务中时返回主库连接
+
+        :return: (连接，游标)
+
+        """
+        if not self.split() or self.tx_depth or self.in_transaction():
+            return await self.writer()
+        if self.read_conn is None:
+            name = balancer.replica()
+            balancer.acquire(name)
+            try:
+                self.read_conn = await get_pool(name).Connection()
+            except Exception:
+                balancer.release(name)
+                raise
+            self.read_name = name
+            self.read_cur = self.read_conn.cursor(tormysql.DictCursor if self.is_return_dict else None)
+        return self.read_conn, self.read_cur
 
     async def off(self) -> None:
         """
@@ -106,8 +203,54 @@ class Component:
         """
         if self.switch:
             self.switch = False
-            await self.cur.close()
-            await self.conn.close()
+            if self.stream:
+                await self.stream.close()
+            self.tx_depth = 0
+            if self.conn is not None:
+                await self.cur.close()
+                if self.in_transaction():
+                    # 未结束的事务不能随连接回到连接池
+                    await self.conn.rollback()
+                await self.conn.close()
+                balancer.release(self.conn_name)
+                self.conn = self.cur = self.conn_name = None
+            if self.read_conn is not None:
+                await self.read_cur.close()
+                await self.read_conn.close()
+                balancer.release(self.read_name)
+                self.read_conn = self.read_cur = self.read_name = None
+
+    def in_transaction(self, conn=None) -> bool:
+        """
+
+        连接是否处于未提交的事务中，开启autocommit时单独执行的语句不会产生事务
+
+        :param conn: 数据库连接，默认为写入语句使用的连接
+        :return: bool
+
+        """
+        conn = self.conn if conn is None else conn
+        if conn is None:
+            return False
+        return bool(conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+    def transaction(self) -> "Transaction":
+        """
+
+        开启一个工作单元，其中的所有写入语句只在退出时提交一次，出现异常时全部回滚::
+
+            async with db.transaction():
+                await db.insert_tc("order", {"id": 1})
+                async with db.transaction():  # 嵌套时使用savepoint，只回滚内层的修改
+                    await db.delete_tw("cart", "uid=%s", [1])
+
+        工作单元中的语句执行失败时直接抛出异常而不是返回status为False的InputResult，
+        工作单元中的查询语句使用主库连接，保证能读到未提交的修改
+
+        :return: Transaction 异步上下文管理器
+
+        """
+        return Transaction(self)
 
     async def output_sql(
             self,
@@ -118,16 +261,50 @@ class Component:
 
         输出查询内容，直接传入select的sql语句，用于查询
 
+        查询语句不会开启事务时(autocommit模式)不再提交，节省一次与数据库的往返，读写分离时发往从库
+
         :param sql: select开头的sql语句
         :param arg_list: 预处理参数，如果需要预处理查询，需要在sql语句中使用%s作为占位符
         :return: 查询到的结果内容
 
         """
-        await self.cur.execute(sql, arg_list)
-        result = self.cur.fetchall()
-        await self.conn.commit()
+        conn, cur = await self.reader()
+        await cur.execute(sql, arg_list)
+        result = cur.fetchall()
+        if not self.tx_depth and self.in_transaction(conn):
+            await conn.commit()
         return result
 
+    def iter_sql(
+            self,
+            sql: str,
+            arg_list: List[SQL_CONTENT] = None,
+            batch_size: int = 1000
+    ) -> "SQLStream":
+        """
+
+        流式查询，使用不缓存结果的服务端游标，每次迭代返回batch_size行数据，内存占用与结果集大小无关::
+
+            async for rows in db.iter_sql("select * from big_table"):
+                for row in rows:
+                    ...
+
+            # 中途跳出循环时请使用async with，保证游标被关闭，连接可以继续使用
+            async with db.iter_sql("select * from big_table") as stream:
+                async for rows in stream:
+                    break
+
+        流读取完成之前该连接不能执行其它查询
+
+        :param sql: select开头的sql语句
+        :param arg_list: 预处理参数
+        :param batch_size: 每批返回的行数
+        :return: SQLStream 异步迭代器
+
+        """
+        self.stream = SQLStream(self, sql, arg_list, batch_size)
+        return self.stream
+
     @overload
     async def input_sql(
             self,
@@ -158,17 +335,28 @@ class Component:
 
         """
         ir = genSQL.InputResult()
+        await self.writer()
+        if self.tx_depth:
+            # 工作单元中由Transaction负责提交和回滚
+            ir.affect = await (self.cur.executemany if many else self.cur.execute)(sql, arg_list)
+            ir.last_rowid = self.cur.lastrowid
+            return ir
         try:
             if many:
+                # 多条语句放在同一个事务中，保证全部成功或全部回滚
+                if not self.in_transaction():
+                    await self.conn.begin()
                 affect = await self.cur.executemany(sql, arg_list)
             else:
                 affect = await self.cur.execute(sql, arg_list)
         except Exception as e:
-            await self.conn.rollback()
+            if self.in_transaction():
+                await self.conn.rollback()
             ir.status = False
             ir.err_info = e
         else:
-            await self.conn.commit()
+            if self.in_transaction():
+                await self.conn.commit()
             ir.affect = affect
             ir.last_rowid = self.cur.lastrowid
         return ir
@@ -291,6 +479,58 @@ class Component:
         ir = await self.input_sql(sql, content, many)
         return ir
 
+    async def bulk_insert(
+            self,
+            table: str,
+            rows: Iterable,
+            key: List[str] = None,
+            update: bool = False,
+            max_packet: int = None
+    ) -> genSQL.BulkResult:
+        """
+
+        批量插入数据，rows可以是生成器，按照max_allowed_packet将数据拆分成多行VALUES语句执行，
+        每条语句执行后提交，失败时停止并返回已经写入的行数，在工作单元中执行时由工作单元统一提交，失败时抛出异常
+
+        示例::
+
+            result = await db.bulk_insert("table", ([i, "name"] for i in range(5000000)))
+            print(result.rows, result.rate)  # 写入行数，每秒写入行数
+
+        :param table: 表格的名称
+        :param rows: 可迭代的行数据，每行是list/tuple或dict
+        :param key: 字段名称列表，dict类型的行默认取第一行的键
+        :param update: 是否使用插入即更新语句
+        :param max_packet: 单条语句的最大字节数，默认查询服务端的max_allowed_packet
+        :return: genSQL.BulkResult结果信息对象
+
+        """
+        conn, cur = await self.writer()
+        br = genSQL.BulkResult()
+        start = time.time()
+        try:
+            if max_packet is None:
+                await cur.execute("select @@max_allowed_packet as max_packet")
+                row = cur.fetchone()
+                max_packet = row["max_packet"] if isinstance(row, dict) else row[0]
+            for sql, arg_list, count in genSQL.insert_bulk(table, rows, key, update, max_packet=max_packet):
+                br.affect += await cur.execute(sql, arg_list)
+                if not self.tx_depth and self.in_transaction():
+                    await conn.commit()
+                br.rows += count
+                br.statements += 1
+        except Exception as e:
+            if self.tx_depth:
+                raise
+            if self.in_transaction():
+                await conn.rollback()
+            br.status = False
+            br.err_info = e
+        else:
+            br.last_rowid = cur.lastrowid
+        br.seconds = time.time() - start
+        return br
+
     async def update_tcw(
             self,
             table: str,
@@ -347,3 +587,104 @@ class Component:
         ir = await self.input_sql(code2)
         await self.input_sql(code3)
         return ir
+
+
+class SQLStream:
+    """
+
+    Component.iter_sql返回的异步迭代器，基于tormysql的SSCursor逐批读取结果
+
+    :param component: 所属的Component对象
+    :param sql: 查询语句
+    :param arg_list: 预处理参数
+    :param batch_size: 每批返回的行数
+
+    """
+
+    def __init__(self, component: Component, sql: str, arg_list: List[SQL_CONTENT] = None, batch_size: int = 1000):
+        self.component = component
+        self.sql = sql
+        self.arg_list = arg_list
+        self.batch_size = batch_size
+        self.conn = None
+        self.cur = None
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> List:
+        if self.done:
+            raise StopAsyncIteration
+        if self.cur is None:
+            cursor_cls = tormysql.SSDictCursor if self.component.is_return_dict else tormysql.SSCursor
+            self.conn, _ = await self.component.reader()
+            self.cur = self.conn.cursor(cursor_cls)
+            await self.cur.execute(self.sql, self.arg_list)
+        rows = await self.cur.fetchmany(self.batch_size)
+        if not rows:
+            await self.close()
+            raise StopAsyncIteration
+        return rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self) -> None:
+        """
+
+        关闭游标，未读取完的结果会被丢弃
+
+        :return: None
+
+        """
+        self.done = True
+        if self.cur is not None:
+            cur, self.cur = self.cur, None
+            await cur.close()
+            if not self.component.tx_depth and self.component.in_transaction(self.conn):
+                await self.conn.commit()
+        if self.component.stream is self:
+            self.component.stream = None
+
+
+class Transaction:
+    """
+
+    Component.transaction返回的异步上下文管理器，最外层使用begin/commit/rollback，
+    嵌套的内层使用savepoint，内层回滚不影响外层已经执行的语句
+
+    :param component: 所属的Component对象
+
+    """
+
+    def __init__(self, component: Component):
+        self.component = component
+        self.savepoint = None
+
+    async def __aenter__(self):
+        component = self.component
+        conn, cur = await component.writer()
+        if component.tx_depth:
+            self.savepoint = "mad_sp_{}".format(component.tx_depth)
+            await cur.execute("SAVEPOINT " + self.savepoint)
+        else:
+            await conn.begin()
+        component.tx_depth += 1
+        return component
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        component = self.component
+        component.tx_depth -= 1
+        if self.savepoint:
+            if exc_type is None:
+                await component.cur.execute("RELEASE SAVEPOINT " + self.savepoint)
+            else:
+                await component.cur.execute("ROLLBACK TO SAVEPOINT " + self.savepoint)
+        elif exc_type is None:
+            await component.conn.commit()
+        else:
+            await component.conn.rollback()
@@ -6,7 +6,6 @@ import uuid
 import hashlib
 from typing import Iterable, Tuple, Optional, Union
 
-option = parser.options("file")
 print("[syncFile] is imported.")
 
 """
@@ -26,7 +25,7 @@ class Component:
 
     def __init__(self, path="", top_path=None):
         if not top_path:
-            top_path = option["path"]
+            top_path = parser.section("file")["path"]
 
         self.root_path = self.ajoin(top_path, path)
         self.rel_root_path = self.join(top_path, path)
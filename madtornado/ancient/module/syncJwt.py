@@ -5,14 +5,14 @@ import jwt
 import time
 from typing import Optional, Dict
 
-option = parser.options("token")
 print("[syncJwt] is imported.")
 
 
 class Component:
 
     def __init__(self):
-        self.over_time = int(option["over_time"])
+        option = parser.section("token")
+        self.over_time = option["over_time"]
         self.secret = option["secret"]
         self.algorithm = option["algorithm"]
 
@@ -1,19 +1,85 @@
 from ..conf import parser
+from ..rig.hashRing import HashRing
+from ..rig.localCache import MISSING, get_local_cache
 
 import memcache
 
-import json
+import threading
+from typing import Any, Dict, List, Optional
 
-option = parser.options("cache")
 print("[syncMemcached] is imported.")
 
+_client = None  # type: Optional[RingClient]
+_lock = threading.Lock()
+
+
+class RingClient(memcache.Client):
+    """
+
+    使用一致性哈希分配服务器的memcache.Client，与asyncMemcached使用相同的哈希环，
+    服务器不可用时沿哈希环转移到下一台服务器
+
+    memcache.Client继承自threading.local，同一个对象在每个线程中持有各自的连接，可以在进程内共享
+
+    """
+
+    def __init__(self, servers, *args, **kwargs):
+        super(RingClient, self).__init__(servers, *args, **kwargs)
+        self.ring = HashRing([str(s) for s in servers])
+        self.hosts = dict(zip([str(s) for s in servers], self.servers))
+
+    # @override
+    def _get_server(self, key):
+        if isinstance(key, tuple):
+            serverhash, key = key
+            point = str(serverhash).encode("ascii")
+        else:
+            point = key if isinstance(key, bytes) else str(key).encode("utf-8")
+        for node in self.ring.iter_nodes(point):
+            server = self.hosts[node]
+            if server.connect():
+                return server, key
+        return None, None
+
+
+def get_client() -> RingClient:
+    """
+
+    获取进程内共享的memcached客户端，第一次调用时根据[cache]配置创建，连接在请求之间保持
+
+    :return: RingClient
+
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                option = parser.section("cache")
+                _client = RingClient(list(option["server_list"]), debug=False,
+                                     socket_timeout=option["socket_timeout"])
+    return _client
+
 
 class Component:
+    """
+
+    同步memcached模块，所有Component共享进程内的客户端，off()时不再断开连接::
+
+        with Component() as cache:
+            cache["key"] = "value"
+            cache.get_multi(["k1", "k2"])  # 每台服务器只需要一次往返
+
+    [cache] local_entries大于0时，读取先经过进程内的一级缓存(参考localCache模块)，
+    通过本进程写入和删除的key会同步更新一级缓存，统计信息通过get_local_cache().stats()获取
+
+    """
 
     def __init__(self):
+        option = parser.section("cache")
         self.memcachedClient = None
         self.over_time = option["over_time"]
-        self.server_list = json.loads(option["server_list"])
+        self.server_list = option["server_list"]
+        self.local = get_local_cache()
 
     def __enter__(self):
         self.on()
@@ -23,21 +89,78 @@ class Component:
         self.off()
 
     def __getitem__(self, item):
-        return self.memcachedClient.get(item)
+        if self.local is None:
+            return self.memcachedClient.get(item)
+        client = self.memcachedClient
+        return self.local.load(item, lambda: client.get(item), self.over_time)
 
     def __setitem__(self, key, value):
-        return self.memcachedClient.set(key, value, self.over_time)
+        return self.spe_set(key, value, self.over_time)
 
     def __delitem__(self, key):
+        if self.local is not None:
+            self.local.delete(key)
         return self.memcachedClient.delete(key)
 
     def on(self) -> None:
-        self.memcachedClient = memcache.Client(self.server_list, debug=False)
+        self.memcachedClient = get_client()
 
     def off(self) -> None:
-        if self.memcachedClient:
-            self.memcachedClient.disconnect_all()
-            self.memcachedClient = None
+        self.memcachedClient = None
 
     def spe_set(self, key: str, value: str, over_time: int) -> int:
-        return self.memcachedClient.set(key, value, over_time)
+        result = self.memcachedClient.set(key, value, over_time)
+        if self.local is not None:
+            if result:
+                self.local.set(key, value, over_time)
+            else:
+                self.local.delete(key)
+        return result
+
+    def get_multi(self, keys: List[str]) -> Dict[str, Any]:
+        """
+
+        批量获取缓存，按服务器分组后每台服务器只发送一次请求
+
+        :param keys: key列表
+        :return: 命中的{key: value}
+
+        """
+        if self.local is None:
+            return self.memcachedClient.get_multi(keys)
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is MISSING:
+                missing.append(key)
+            elif value is not None:
+                found[key] = value
+        if missing:
+            loaded = self.memcachedClient.get_multi(missing)
+            for key in missing:
+                value = loaded.get(key)
+                self.local.set(key, value, self.over_time)
+                if value is not None:
+                    found[key] = value
+        return found
+
+    def set_multi(self, mapping: Dict[str, Any], over_time: int = None) -> List[str]:
+        """
+
+        批量设置缓存
+
+        :param mapping: {key: value}
+        :param over_time: 过期时间，默认使用[cache] over_time
+        :return: 设置失败的key列表
+
+        """
+        over_time = self.over_time if over_time is None else over_time
+        failed = self.memcachedClient.set_multi(mapping, over_time)
+        if self.local is not None:
+            for key, value in mapping.items():
+                if key in failed:
+                    self.local.delete(key)
+                else:
+                    self.local.set(key, value, over_time)
+        return failed
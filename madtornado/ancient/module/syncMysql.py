@@ -1,20 +1,221 @@
 from ..rig import genSQL
+from ..rig.dbRoute import DEFAULT, balancer, db_option
 from ..conf import parser
 
 import pymysql
+from pymysql.constants import SERVER_STATUS
+from tornado.ioloop import IOLoop
 
-from typing import List, Tuple, Dict, TypeVar, Any, overload
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, TypeVar, Any, Callable, Iterable, overload
 
 SQL_CONTENT = TypeVar("SQL_CONTENT", int, float, str, bool)
 
-option = parser.options("db")
 print("[syncMysql] is imported.")
 
 
+class PoolTimeoutError(Exception):
+    """
+
+    连接池中的连接全部被占用，并且在等待时间内没有连接被归还
+
+    """
+
+
+class ConnectionPool:
+    """
+
+    线程安全的有界连接池，连接用完后归还而不是关闭，避免每次请求都进行TCP连接和认证握手
+
+    空闲超过idle_seconds的连接会被回收(至少保留min_size个)，被保留下来的空闲连接在取出时先进行ping检测，
+    防止使用已经被mysql服务端因wait_timeout断开的连接
+
+    :param creator: 创建新连接的函数
+    :param min_size: 保留的最少空闲连接数量
+    :param max_size: 最大连接数量
+    :param idle_seconds: 连接空闲多久后被回收或需要检测，单位秒
+    :param wait_timeout: 连接耗尽时获取连接的最长等待时间，单位秒
+
+    """
+
+    def __init__(self, creator: Callable[[], Any], min_size: int = 0, max_size: int = 16,
+                 idle_seconds: int = 3600, wait_timeout: float = 3):
+        self.creator = creator
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.wait_timeout = wait_timeout
+
+        self.size = 0
+        self.idle = collections.deque()
+        self.cond = threading.Condition()
+
+    def reap(self) -> None:
+        """
+
+        关闭空闲过久的连接，调用前需持有cond锁
+
+        :return: None
+
+        """
+        expire = time.time() - self.idle_seconds
+        while self.idle and self.size > self.min_size and self.idle[0][1] < expire:
+            conn, _ = self.idle.popleft()
+            self.size -= 1
+            self.close(conn)
+
+    @staticmethod
+    def close(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get(self):
+        """
+
+        从连接池中取出一个连接，连接耗尽时最多等待wait_timeout秒
+
+        :return: 数据库连接
+
+        """
+        deadline = time.time() + self.wait_timeout
+        conn = last_used = None
+        with self.cond:
+            while True:
+                self.reap()
+                if self.idle:
+                    # 后进先出，优先复用最近使用过的连接，让多余的连接自然空闲并被回收
+                    conn, last_used = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeoutError("No connection available in {} seconds".format(self.wait_timeout))
+                self.cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self.creator()
+            elif time.time() - last_used > self.idle_seconds:
+                conn.ping(reconnect=True)
+        except Exception:
+            self.discard(conn)
+            raise
+        return conn
+
+    def put(self, conn) -> None:
+        """
+
+        归还连接，连接处于未提交的事务中时先进行回滚，已断开或回滚失败的连接直接丢弃
+
+        :param conn: 数据库连接
+        :return: None
+
+        """
+        try:
+            if not conn.open:
+                raise pymysql.err.InterfaceError("Connection is closed")
+            if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                conn.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+        with self.cond:
+            self.idle.append((conn, time.time()))
+            self.cond.notify()
+
+    def discard(self, conn) -> None:
+        """
+
+        丢弃一个已经取出的连接，释放连接数量名额
+
+        :param conn: 数据库连接，可以为None
+        :return: None
+
+        """
+        if conn is not None:
+            self.close(conn)
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+
+def connect(name: str = DEFAULT):
+    option = db_option(name)
+    return pymysql.connect(host=option["host"], db=option["db"],
+                           user=option["user"], password=option["password"],
+                           port=option["port"], charset=option["charset"])
+
+
+_pools = {}  # type: Dict[str, ConnectionPool]
+_executor = None  # type: ThreadPoolExecutor | None
+_lock = threading.Lock()
+
+
+def get_pool(name: str = DEFAULT) -> ConnectionPool:
+    """
+
+    获取进程内共享的连接池，每个数据库一个，第一次调用时根据[db:名称]配置创建
+
+    :param name: 数据库名称，default代表[db]节
+    :return: ConnectionPool
+
+    """
+    pool = _pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(name)
+            if pool is None:
+                option = db_option(name)
+                pool = _pools[name] = ConnectionPool(lambda: connect(name), min_size=option["min_connections"],
+                                                     max_size=option["max_connections"],
+                                                     idle_seconds=option["idle_seconds"],
+                                                     wait_timeout=option["wait_connection_timeout"])
+    return pool
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+
+    获取执行sql语句的线程池，线程数量由[db] executor_workers配置
+
+    :return: ThreadPoolExecutor
+
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(parser.section("db")["executor_workers"])
+    return _executor
+
+
 class Component:
     """
 
-    该模块参数均来源与madtornado配置文件，并且不支持同时连接多个不同的数据库
+    该模块参数均来源与madtornado配置文件，支持通过[db:名称]节配置多个数据库，
+    配置了replicas时查询语句自动发往从库，写入语句发往primary，参考dbRoute模块
+
+    连接从进程内共享的连接池中获取，off()时归还连接池而不是断开连接，
+    读写分离时连接在第一次执行对应语句时才获取，主库连接处于事务中时查询语句也使用主库连接
+
+    指定数据库::
+
+        # 所有语句都发往replica1，不再进行读写分离
+        with Component(using="replica1") as db:
+            db.select_tcw("table")
+
+    executor模式::
+
+        # 开启executor模式后，sql语句在线程池中执行，所有查询方法返回可等待对象，不会阻塞IOLoop
+        async with Component(executor=True) as db:
+            result = await db.select_tcw("table")
 
     安全建议::
 
@@ -22,13 +223,25 @@ class Component:
         但是对于key部分还是无能为力，所以一定不要让用户对key的部分有
         任何操作，只基于用户提供value值的权限，这样做是安全的。
 
+    :param executor: 是否在线程池中执行sql语句并返回可等待对象
+    :param using: 数据库名称，指定后读写都使用该数据库
+
     """
 
-    def __init__(self):
+    def __init__(self, executor: bool = False, using: str = None):
+        self.using = using
         self.conn = None
         self.cur = None
-        self.is_return_dict = False
+        self.conn_name = None
+        self.read_conn = None
+        self.read_cur = None
+        self.read_name = None
+        # 默认返回字典格式的数据，可以通过set_cursor_dict(False)改为元组
+        self.is_return_dict = True
         self.switch = False
+        self.executor = executor
+        # 同一个连接不能被多个线程同时使用，executor模式下并发调用时串行执行
+        self.lock = threading.Lock()
 
     def __enter__(self):
         self.on()
@@ -37,6 +250,31 @@ class Component:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.off()
 
+    async def __aenter__(self):
+        await IOLoop.current().run_in_executor(get_executor(), self.on)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await IOLoop.current().run_in_executor(get_executor(), self.off)
+
+    def run(self, func, *args):
+        """
+
+        执行查询函数，executor模式下提交到线程池并返回可等待对象，否则直接执行返回结果
+
+        :param func: 查询函数
+        :param args: 查询函数参数
+        :return: 查询结果或可等待对象
+
+        """
+        if self.executor:
+            return IOLoop.current().run_in_executor(get_executor(), self.locked, func, *args)
+        return func(*args)
+
+    def locked(self, func, *args):
+        with self.lock:
+            return func(*args)
+
     def set_cursor_dict(self, is_return_dict: bool = True) -> None:
         """
 
@@ -47,7 +285,64 @@ class Component:
 
         """
         self.is_return_dict = is_return_dict
-        self.cur = self.conn.cursor(pymysql.cursors.DictCursor if is_return_dict else None)
+        cursor_cls = pymysql.cursors.DictCursor if is_return_dict else None
+        if self.conn is not None:
+            self.cur = self.conn.cursor(cursor_cls)
+        if self.read_conn is not None:
+            self.read_cur = self.read_conn.cursor(cursor_cls)
+
+    def split(self) -> bool:
+        """
+
+        当前是否进行读写分离
+
+        :return: bool
+
+        """
+        return self.using is None and balancer.has_replicas()
+
+    def writer(self) -> Tuple:
+        """
+
+        获取写入语句使用的连接和游标，不存在时从primary或using指定的数据库获取
+
+        :return: (连接，游标)
+
+        """
+        if self.conn is None:
+            name = self.using or balancer.primary()
+            balancer.acquire(name)
+            try:
+                self.conn = get_pool(name).get()
+            except Exception:
+                balancer.release(name)
+                raise
+            self.conn_name = name
+            self.cur = self.conn.cursor(pymysql.cursors.DictCursor if self.is_return_dict else None)
+        return self.conn, self.cur
+
+    def reader(self) -> Tuple:
+        """
+
+        获取查询语句使用的连接和游标，不进行读写分离或主库连接处于事务中时返回主库连接
+
+        :return: (连接，游标)
+
+        """
+        in_trans = self.conn is not None and self.conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        if not self.split() or in_trans:
+            return self.writer()
+        if self.read_conn is None:
+            name = balancer.replica()
+            balancer.acquire(name)
+            try:
+                self.read_conn = get_pool(name).get()
+            except Exception:
+                balancer.release(name)
+                raise
+            self.read_name = name
+            self.read_cur = self.read_conn.cursor(pymysql.cursors.DictCursor if self.is_return_dict else None)
+        return self.read_conn, self.read_cur
 
     def on(self) -> None:
         """
@@ -69,11 +364,9 @@ class Component:
         :return: None
 
         """
-        self.conn = pymysql.connect(host=option["host"], db=option["db"],
-                                    user=option["user"], password=option["password"],
-                                    port=int(option["port"]), charset=option["charset"])
-        self.set_cursor_dict()
         self.switch = True
+        if not self.split():
+            self.writer()
 
     def off(self) -> None:
         """
@@ -85,8 +378,16 @@ class Component:
         """
         if self.switch:
             self.switch = False
-            self.cur.close()
-            self.conn.close()
+            if self.conn is not None:
+                self.cur.close()
+                get_pool(self.conn_name).put(self.conn)
+                balancer.release(self.conn_name)
+                self.conn = self.cur = self.conn_name = None
+            if self.read_conn is not None:
+                self.read_cur.close()
+                get_pool(self.read_name).put(self.read_conn)
+                balancer.release(self.read_name)
+                self.read_conn = self.read_cur = self.read_name = None
 
     def output_sql(
             self,
@@ -99,12 +400,16 @@ class Component:
 
         :param sql: select开头的sql语句
         :param arg_list: 预处理参数，如果需要预处理查询，需要在sql语句中使用%s作为占位符
-        :return: 查询到的结果内容
+        :return: 查询到的结果内容，读写分离时发往从库，executor模式下返回可等待对象
 
         """
-        self.cur.execute(sql, arg_list)
-        result = self.cur.fetchall()
-        self.conn.commit()
+        return self.run(self.__output_sql, sql, arg_list)
+
+    def __output_sql(self, sql, arg_list):
+        conn, cur = self.reader()
+        cur.execute(sql, arg_list)
+        result = cur.fetchall()
+        conn.commit()
         return result
 
     @overload
@@ -133,10 +438,14 @@ class Component:
         :param sql: 输入系列的sql语句
         :param arg_list: 预处理参数列表，可以是二维数组代表多行插入前提需要设置many参数
         :param many: 是否启用多行输入
-        :return: genSQL.InputResult 输入语句查询信息
+        :return: genSQL.InputResult 输入语句查询信息，executor模式下返回可等待对象
 
         """
+        return self.run(self.__input_sql, sql, arg_list, many)
+
+    def __input_sql(self, sql, arg_list=None, many=False):
         ir = genSQL.InputResult()
+        self.writer()
         try:
             if many:
                 affect = self.cur.executemany(sql, arg_list)
@@ -268,6 +577,57 @@ class Component:
         sql, content = genSQL.insert_update_tc(table, content, many)
         return self.input_sql(sql, content, many)
 
+    def bulk_insert(
+            self,
+            table: str,
+            rows: Iterable,
+            key: List[str] = None,
+            update: bool = False,
+            max_packet: int = None
+    ) -> genSQL.BulkResult:
+        """
+
+        批量插入数据，rows可以是生成器，按照max_allowed_packet将数据拆分成多行VALUES语句执行，
+        每条语句执行后提交，失败时停止并返回已经写入的行数
+
+        示例::
+
+            result = db.bulk_insert("table", ([i, "name"] for i in range(5000000)))
+            print(result.rows, result.rate)  # 写入行数，每秒写入行数
+
+        :param table: 表格的名称
+        :param rows: 可迭代的行数据，每行是list/tuple或dict
+        :param key: 字段名称列表，dict类型的行默认取第一行的键
+        :param update: 是否使用插入即更新语句
+        :param max_packet: 单条语句的最大字节数，默认查询服务端的max_allowed_packet
+        :return: genSQL.BulkResult结果信息对象，executor模式下返回可等待对象
+
+        """
+        return self.run(self.__bulk_insert, table, rows, key, update, max_packet)
+
+    def __bulk_insert(self, table, rows, key, update, max_packet):
+        conn, cur = self.writer()
+        br = genSQL.BulkResult()
+        start = time.time()
+        try:
+            if max_packet is None:
+                cur.execute("select @@max_allowed_packet as max_packet")
+                row = cur.fetchone()
+                max_packet = row["max_packet"] if isinstance(row, dict) else row[0]
+            for sql, arg_list, count in genSQL.insert_bulk(table, rows, key, update, max_packet=max_packet):
+                br.affect += cur.execute(sql, arg_list)
+                conn.commit()
+                br.rows += count
+                br.statements += 1
+        except Exception as e:
+            conn.rollback()
+            br.status = False
+            br.err_info = e
+        else:
+            br.last_rowid = cur.lastrowid
+        br.seconds = time.time() - start
+        return br
+
     def update_tcw(
             self,
             table: str,
@@ -317,8 +677,11 @@ class Component:
         :return: genSQL.InputResult结果信息对象
 
         """
+        return self.run(self.__truncate_t, table)
+
+    def __truncate_t(self, table):
         code1, code2, code3 = genSQL.truncate_t(table)
-        self.input_sql(code1)
-        ir = self.input_sql(code2)
-        self.input_sql(code3)
+        self.__input_sql(code1)
+        ir = self.__input_sql(code2)
+        self.__input_sql(code3)
         return ir
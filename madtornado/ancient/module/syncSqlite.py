@@ -2,14 +2,29 @@ from ..rig import genSQL
 from ..conf import parser
 
 import sqlite3
+from tornado.ioloop import IOLoop
 
-from typing import List, Tuple, Dict, TypeVar, Any, overload
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Tuple, Dict, TypeVar, Any, Iterable, overload
 
 SQL_CONTENT = TypeVar("SQL_CONTENT", int, float, str, bool)
 
-option = parser.options("db")
+# sqlite单条语句的参数数量上限，3.32.0之前为999
+MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+# sqlite单条语句的长度上限(SQLITE_MAX_SQL_LENGTH默认值)
+MAX_SQL_LENGTH = 1000000000
+
 print("[syncSqlite] is imported.")
 
+_local = threading.local()
+_executor = None  # type: ThreadPoolExecutor | None
+_writers = {}  # type: Dict[str, WriteQueue]
+_lock = threading.Lock()
+
 
 def dict_factory(cursor, row):
     d = {}
@@ -18,24 +33,295 @@ def dict_factory(cursor, row):
     return d
 
 
+def to_dict(cursor, rows) -> List[Dict]:
+    """
+
+    将查询结果转换成字典，字段名称只从cursor.description中读取一次，而不是每行读取一次
+
+    :param cursor: 执行查询的游标
+    :param rows: 查询结果
+    :return: 字典列表
+
+    """
+    names = tuple(col[0] for col in cursor.description)
+    return [dict(zip(names, row)) for row in rows]
+
+
+def db_path() -> str:
+    return "./data/{}.db".format(parser.section("db")["db"])
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+
+    创建sqlite连接并按照[sqlite]配置设置pragma
+
+    :param path: 数据库文件路径
+    :return: sqlite3.Connection
+
+    """
+    option = parser.section("sqlite")
+    conn = sqlite3.connect(path, timeout=option["busy_timeout"] / 1000)
+    conn.execute("pragma journal_mode={}".format(option["journal_mode"]))
+    conn.execute("pragma synchronous={}".format(option["synchronous"]))
+    conn.execute("pragma cache_size={}".format(option["cache_size"]))
+    conn.execute("pragma mmap_size={}".format(option["mmap_size"]))
+    return conn
+
+
+def get_connection(path: str = None) -> sqlite3.Connection:
+    """
+
+    获取当前线程的持久连接，每个线程每个数据库文件只创建一次连接，sqlite连接不能跨线程使用
+
+    :param path: 数据库文件路径，默认根据[db]节的db配置
+    :return: sqlite3.Connection
+
+    """
+    path = path or db_path()
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+    return conn
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+
+    获取执行sqlite语句的专用线程池，线程数量由[sqlite] executor_workers配置
+
+    :return: ThreadPoolExecutor
+
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(parser.section("sqlite")["executor_workers"])
+    return _executor
+
+
+def execute_input(conn: sqlite3.Connection, sql: str, arg_list=None, many: bool = False) -> genSQL.InputResult:
+    """
+
+    在指定连接上执行输入语句，不进行提交和回滚，执行失败时抛出异常
+
+    :param conn: sqlite连接
+    :param sql: 输入系列的sql语句
+    :param arg_list: 预处理参数列表
+    :param many: 是否启用多行输入
+    :return: genSQL.InputResult
+
+    """
+    cur = conn.executemany(sql, arg_list or ()) if many else conn.execute(sql, arg_list or ())
+    ir = genSQL.InputResult()
+    ir.affect = cur.rowcount
+    ir.last_rowid = cur.lastrowid
+    cur.close()
+    return ir
+
+
+def execute_bulk(conn: sqlite3.Connection, table: str, rows: Iterable, key: List[str] = None) -> genSQL.BulkResult:
+    """
+
+    在指定连接上执行批量插入，不进行提交和回滚，执行失败时抛出异常
+
+    :param conn: sqlite连接
+    :param table: 表格的名称
+    :param rows: 可迭代的行数据
+    :param key: 字段名称列表
+    :return: genSQL.BulkResult
+
+    """
+    br = genSQL.BulkResult()
+    start = time.time()
+    for sql, arg_list, count in genSQL.insert_bulk(table, rows, key, ph="?", max_packet=MAX_SQL_LENGTH,
+                                                   max_args=MAX_VARIABLES):
+        cur = conn.execute(sql, arg_list)
+        br.affect += cur.rowcount
+        br.last_rowid = cur.lastrowid
+        br.rows += count
+        br.statements += 1
+    br.seconds = time.time() - start
+    return br
+
+
+def failed(result_cls, err):
+    result = result_cls()
+    result.status = False
+    result.err_info = err
+    return result
+
+
+class WriteQueue:
+    """
+
+    单写线程队列，一个数据库文件的所有写入操作交给同一个后台线程执行，避免多个连接争抢写锁
+
+    后台线程取出一个操作后，继续收集已经排队以及write_delay毫秒内到达的操作(最多write_batch个)，
+    合并到同一个事务中一次提交(group commit)，每个操作使用savepoint隔离，单个操作失败只回滚它自己，
+    操作的结果在事务提交成功后才通过Future返回
+
+    :param path: 数据库文件路径
+    :param max_batch: 一个事务最多包含的操作数量
+    :param max_delay: 收集操作的最长等待时间，单位秒
+
+    """
+
+    def __init__(self, path: str, max_batch: int = 256, max_delay: float = 0):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.loop, name="sqlite-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args) -> Future:
+        """
+
+        提交一个写入操作
+
+        :param func: 写入函数，第一个参数为写线程的连接，如execute_input
+        :param args: 写入函数的其余参数
+        :return: concurrent.futures.Future 事务提交后得到写入函数的返回值，失败时得到异常
+
+        """
+        future = Future()
+        self.queue.put((future, func, args))
+        return future
+
+    def close(self) -> None:
+        """
+
+        处理完已经排队的操作后结束后台线程
+
+        :return: None
+
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def collect(self, first) -> List:
+        batch = [first]
+        deadline = time.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def loop(self) -> None:
+        conn = connect(self.path)
+        # 由写线程自己控制事务边界
+        conn.isolation_level = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.commit(conn, self.collect(item))
+        conn.close()
+
+    @staticmethod
+    def commit(conn: sqlite3.Connection, batch: List) -> None:
+        done = []
+        try:
+            conn.execute("begin immediate")
+            for future, func, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("savepoint op")
+                try:
+                    result = func(conn, *args)
+                except Exception as e:
+                    conn.execute("rollback to op")
+                    future.set_exception(e)
+                else:
+                    done.append((future, result))
+                conn.execute("release op")
+            conn.execute("commit")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("rollback")
+            # 事务整体失败，已经执行成功的操作同样没有提交，尚未返回结果的操作都得到该异常
+            for future, func, args in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+
+def get_writer(path: str = None) -> WriteQueue:
+    """
+
+    获取数据库文件对应的单写线程队列，第一次调用时创建
+
+    :param path: 数据库文件路径，默认根据[db]节的db配置
+    :return: WriteQueue
+
+    """
+    path = path or db_path()
+    writer = _writers.get(path)
+    if writer is None:
+        with _lock:
+            writer = _writers.get(path)
+            if writer is None:
+                option = parser.section("sqlite")
+                writer = _writers[path] = WriteQueue(path, option["write_batch"], option["write_delay"] / 1000)
+    return writer
+
+
 class Component:
     """
 
     该模块参数均来源与madtornado配置文件，并且不支持同时连接多个不同的数据库
 
+    每个线程持有一个持久连接，off()时不再关闭连接，连接创建时按照[sqlite]节设置WAL等pragma
+
+    executor模式::
+
+        # 开启executor模式后，sql语句在专用线程池中执行，所有查询方法返回可等待对象，不会阻塞IOLoop
+        async with Component(executor=True) as db:
+            result = await db.select_tcw("table")
+
+    单写队列模式::
+
+        # 输入语句交给数据库的单写线程合并提交，executor模式下返回可等待对象，否则阻塞等待提交完成
+        async with Component(executor=True, write_queue=True) as db:
+            ir = await db.insert_tc("table", {"id": 1})
+
     安全建议::
 
         永远不要相信用户输入内容，sql模块虽然对于value进行了预检测
         但是对于key部分还是无能为力，所以一定不要让用户对key的部分有
         任何操作，只基于用户提供value值的权限，这样做是安全的。
 
+    :param executor: 是否在线程池中执行sql语句并返回可等待对象
+    :param write_queue: 是否通过单写队列执行输入语句，默认取[sqlite] write_queue配置
+
     """
 
-    def __init__(self):
+    def __init__(self, executor: bool = False, write_queue: bool = None):
         self.conn = None
         self.cur = None
         self.is_return_dict = False
         self.switch = False
+        self.executor = executor
+        self.write_queue = parser.section("sqlite")["write_queue"] if write_queue is None else write_queue
 
     def __enter__(self):
         self.on()
@@ -44,6 +330,61 @@ class Component:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.off()
 
+    async def __aenter__(self):
+        self.on()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.off()
+
+    def run(self, func, *args):
+        """
+
+        执行查询函数，executor模式下提交到线程池并返回可等待对象，否则直接执行返回结果
+
+        :param func: 查询函数
+        :param args: 查询函数参数
+        :return: 查询结果或可等待对象
+
+        """
+        if self.executor:
+            return IOLoop.current().run_in_executor(get_executor(), func, *args)
+        return func(*args)
+
+    def wait(self, future: Future, result_cls):
+        """
+
+        等待单写队列返回结果，executor模式下返回可等待对象，失败时转换为status为False的结果对象
+
+        :param future: WriteQueue.submit返回的Future
+        :param result_cls: 结果类型，InputResult或BulkResult
+        :return: 结果对象或可等待对象
+
+        """
+        if self.executor:
+            return self.__wait_async(future, result_cls)
+        try:
+            return future.result()
+        except Exception as e:
+            return failed(result_cls, e)
+
+    @staticmethod
+    async def __wait_async(future, result_cls):
+        try:
+            return await asyncio.wrap_future(future)
+        except Exception as e:
+            return failed(result_cls, e)
+
+    def connection(self) -> sqlite3.Connection:
+        """
+
+        获取执行语句使用的连接，executor模式下为执行线程的持久连接
+
+        :return: sqlite3.Connection
+
+        """
+        return self.conn if self.conn is not None else get_connection()
+
     def set_cursor_dict(self, is_return_dict: bool = True) -> None:
         """
 
@@ -54,16 +395,11 @@ class Component:
 
         """
         self.is_return_dict = is_return_dict
-        if is_return_dict:
-            self.conn.row_factory = dict_factory
-        else:
-            self.conn.row_factory = None
-        self.cur = self.conn.cursor()
 
     def on(self) -> None:
         """
 
-        开启一个数据库实例从sql_pool当中
+        开启一个数据库实例，使用当前线程的持久连接，executor模式下连接在执行线程中获取
 
         举例::
 
@@ -80,22 +416,27 @@ class Component:
         :return: None
 
         """
-        self.conn = sqlite3.connect("./data/{}.db".format(option["db"]))
+        if not self.executor:
+            self.conn = get_connection()
+            self.cur = self.conn.cursor()
         self.set_cursor_dict()
         self.switch = True
 
     def off(self) -> None:
         """
 
-        关闭一个数据库连接实例
+        释放数据库实例，未提交的事务会被回滚，持久连接不会被关闭
 
         :return: None
 
         """
         if self.switch:
             self.switch = False
-            self.cur.close()
-            self.conn.close()
+            if self.conn is not None:
+                self.cur.close()
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                self.conn = self.cur = None
 
     def output_sql(
             self,
@@ -108,15 +449,20 @@ class Component:
 
         :param sql: select开头的sql语句
         :param arg_list: 预处理参数，如果需要预处理查询，需要在sql语句中使用%s作为占位符
-        :return: 查询到的结果内容
+        :return: 查询到的结果内容，executor模式下返回可等待对象
 
         """
-        if arg_list:
-            self.cur.execute(sql, arg_list)
-        else:
-            self.cur.execute(sql)
-        result = self.cur.fetchall()
-        self.conn.commit()
+        return self.run(self.__output_sql, sql, arg_list)
+
+    def __output_sql(self, sql, arg_list):
+        conn = self.connection()
+        cur = conn.execute(sql, arg_list or ())
+        result = cur.fetchall()
+        if self.is_return_dict and cur.description:
+            result = to_dict(cur, result)
+        cur.close()
+        if conn.in_transaction:
+            conn.commit()
         return result
 
     @overload
@@ -145,29 +491,21 @@ class Component:
         :param sql: 输入系列的sql语句
         :param arg_list: 预处理参数列表，可以是二维数组代表多行插入前提需要设置many参数
         :param many: 是否启用多行输入
-        :return: genSQL.InputResult 输入语句查询信息
+        :return: genSQL.InputResult 输入语句查询信息，executor模式下返回可等待对象
 
         """
-        ir = genSQL.InputResult()
+        if self.write_queue:
+            return self.wait(get_writer().submit(execute_input, sql, arg_list, many), genSQL.InputResult)
+        return self.run(self.__input_sql, sql, arg_list, many)
+
+    def __input_sql(self, sql, arg_list=None, many=False):
+        conn = self.connection()
         try:
-            if many:
-                if arg_list:
-                    affect = self.cur.executemany(sql, arg_list)
-                else:
-                    affect = self.cur.executemany(sql)
-            else:
-                if arg_list:
-                    affect = self.cur.execute(sql, arg_list)
-                else:
-                    affect = self.cur.execute(sql)
+            ir = execute_input(conn, sql, arg_list, many)
         except Exception as e:
-            self.conn.rollback()
-            ir.status = False
-            ir.err_info = e
-        else:
-            self.conn.commit()
-            ir.affect = affect
-            ir.last_rowid = self.cur.lastrowid
+            conn.rollback()
+            return failed(genSQL.InputResult, e)
+        conn.commit()
         return ir
 
     def select_tcw(
@@ -245,6 +583,42 @@ class Component:
         sql, content = genSQL.insert_tc(table, content, many, ph="?")
         return self.input_sql(sql, content, many)
 
+    def bulk_insert(
+            self,
+            table: str,
+            rows: Iterable,
+            key: List[str] = None
+    ) -> genSQL.BulkResult:
+        """
+
+        批量插入数据，rows可以是生成器，按照sqlite的参数数量上限将数据拆分成多行VALUES语句执行，
+        所有语句在同一个事务中执行，失败时全部回滚
+
+        示例::
+
+            result = db.bulk_insert("table", ([i, "name"] for i in range(5000000)))
+            print(result.rows, result.rate)  # 写入行数，每秒写入行数
+
+        :param table: 表格的名称
+        :param rows: 可迭代的行数据，每行是list/tuple或dict
+        :param key: 字段名称列表，dict类型的行默认取第一行的键
+        :return: genSQL.BulkResult结果信息对象，executor模式下返回可等待对象
+
+        """
+        if self.write_queue:
+            return self.wait(get_writer().submit(execute_bulk, table, rows, key), genSQL.BulkResult)
+        return self.run(self.__bulk_insert, table, rows, key)
+
+    def __bulk_insert(self, table, rows, key):
+        conn = self.connection()
+        try:
+            br = execute_bulk(conn, table, rows, key)
+        except Exception as e:
+            conn.rollback()
+            return failed(genSQL.BulkResult, e)
+        conn.commit()
+        return br
+
     def update_tcw(
             self,
             table: str,
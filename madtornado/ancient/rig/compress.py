@@ -0,0 +1,163 @@
+"""
+
+compress模块提供动态响应的gzip/brotli压缩，由[tornado-compress]配置控制::
+
+    [tornado-compress]
+    compress = true
+    brotli = true
+
+静态文件的预压缩请使用sea --build_precompress，StaticHandler在存在.br或.gz文件时直接返回预压缩的内容，
+已经设置Content-Encoding的响应不会被重复压缩
+
+"""
+from ..conf import parser
+
+from tornado.web import OutputTransform
+
+import zlib
+from typing import List, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 可以压缩的类型，除此之外所有text/开头的类型都会被压缩
+CONTENT_TYPES = {
+    "application/javascript",
+    "application/x-javascript",
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/atom+xml",
+    "application/xhtml+xml",
+    "application/manifest+json",
+    "application/wasm",
+    "image/svg+xml",
+}
+
+# 预压缩文件的后缀，按优先级排列
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def compressible_type(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip()
+    return content_type.startswith("text/") or content_type in CONTENT_TYPES
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """
+
+    解析Accept-Encoding，返回客户端接受的编码，q=0代表不接受
+
+    :param accept_encoding: Accept-Encoding请求头
+    :return: 编码列表，如["gzip", "br"]
+
+    """
+    result = []
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            result.append(name)
+    return result
+
+
+class Compressor:
+    """
+
+    流式压缩器，每个chunk压缩后立即输出，保证分块响应能被客户端及时解压
+
+    :param encoding: gzip或br
+    :param gzip_level: gzip压缩等级
+    :param brotli_quality: brotli压缩质量
+
+    """
+
+    def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 4):
+        self.encoding = encoding
+        if encoding == "br":
+            self.obj = brotli.Compressor(quality=brotli_quality)
+        else:
+            self.obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes, finishing: bool) -> bytes:
+        if self.encoding == "br":
+            data = self.obj.process(chunk)
+            return data + (self.obj.finish() if finishing else self.obj.flush())
+        data = self.obj.compress(chunk)
+        return data + self.obj.flush(zlib.Z_FINISH if finishing else zlib.Z_SYNC_FLUSH)
+
+
+class CompressTransform(OutputTransform):
+    """
+
+    替代tornado的GZipContentEncoding，支持brotli和可配置的压缩阈值，
+    通过Application(transforms=[CompressTransform])启用
+
+    客户端同时接受br和gzip时优先使用br，一次写完且小于min_length的响应不压缩，分块写入的响应总是压缩
+
+    """
+
+    def __init__(self, request):
+        option = parser.section("tornado-compress")
+        self.min_length = option["min_length"]
+        self.gzip_level = option["gzip_level"]
+        self.brotli_quality = option["brotli_quality"]
+        self.compressor = None  # type: Compressor | None
+
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if option["brotli"] and brotli is not None and "br" in accepted:
+            self.encoding = "br"
+        elif option["gzip"] and "gzip" in accepted:
+            self.encoding = "gzip"
+        else:
+            self.encoding = None
+
+    # @override
+    def transform_first_chunk(self, status_code, headers, chunk, finishing) -> Tuple[int, object, bytes]:
+        content_type = headers.get("Content-Type", "")
+        if not compressible_type(content_type) or "Content-Encoding" in headers:
+            return status_code, headers, chunk
+        if "Vary" in headers:
+            if "accept-encoding" not in headers["Vary"].lower():
+                headers["Vary"] += ", Accept-Encoding"
+        else:
+            headers["Vary"] = "Accept-Encoding"
+        if finishing:
+            length = len(chunk)
+        else:
+            # 静态文件等分块写入的响应根据Content-Length判断大小
+            length = int(headers.get("Content-Length", self.min_length))
+        if self.encoding is None or length < self.min_length:
+            return status_code, headers, chunk
+
+        self.compressor = Compressor(self.encoding, self.gzip_level, self.brotli_quality)
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("Etag")
+        if etag and not etag.startswith("W/"):
+            # 压缩后的内容与原内容不同，强ETag降级为弱ETag
+            headers["Etag"] = "W/" + etag
+        chunk = self.transform_chunk(chunk, finishing)
+        if "Content-Length" in headers:
+            if finishing:
+                headers["Content-Length"] = str(len(chunk))
+            else:
+                del headers["Content-Length"]
+        return status_code, headers, chunk
+
+    # @override
+    def transform_chunk(self, chunk: bytes, finishing: bool) -> bytes:
+        if self.compressor is None:
+            return chunk
+        return self.compressor.compress(chunk, finishing)
@@ -0,0 +1,107 @@
+"""
+
+dbRoute模块负责mysql模块的多数据库路由，asyncMysql和syncMysql共用
+
+[db]节是默认数据库，名称为default，额外的数据库通过[db:名称]节配置，未填写的配置项继承[db]节::
+
+    [db]
+    host = 127.0.0.1
+    ; 写入语句使用的数据库名称，留空代表[db]节本身
+    primary = primary
+    ; 查询语句使用的数据库名称列表，留空代表查询也使用primary
+    replicas = ["replica1", "replica2"]
+    ; 选择查询数据库的策略，round_robin轮询，least_busy选择当前进程占用连接最少的数据库
+    read_policy = round_robin
+
+    [db:primary]
+    host = 10.0.0.1
+
+    [db:replica1]
+    host = 10.0.0.2
+
+    [db:replica2]
+    host = 10.0.0.3
+
+"""
+from ..conf import parser
+
+import threading
+import collections
+
+DEFAULT = "default"
+
+
+def db_option(name: str):
+    """
+
+    获取指定名称数据库的配置
+
+    :param name: 数据库名称，default代表[db]节
+    :return: 只读映射
+
+    """
+    if name == DEFAULT:
+        return parser.section("db")
+    return parser.section("db:" + name)
+
+
+class Balancer:
+    """
+
+    根据[db]配置选择写入和查询使用的数据库，并记录每个数据库当前被占用的连接数量
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = collections.Counter()
+        self.turn = 0
+
+    @staticmethod
+    def primary() -> str:
+        """
+
+        写入语句使用的数据库名称
+
+        :return: 数据库名称
+
+        """
+        return parser.section("db")["primary"] or DEFAULT
+
+    @staticmethod
+    def has_replicas() -> bool:
+        return bool(parser.section("db")["replicas"])
+
+    def replica(self) -> str:
+        """
+
+        按照read_policy选择一个查询数据库，没有配置replicas时返回primary
+
+        :return: 数据库名称
+
+        """
+        option = parser.section("db")
+        replicas = option["replicas"]
+        if not replicas:
+            return self.primary()
+        with self.lock:
+            if option["read_policy"] == "least_busy":
+                # 占用相同时按轮询顺序选择，避免总是落到第一个数据库
+                start = self.turn
+                self.turn += 1
+                order = [replicas[(start + i) % len(replicas)] for i in range(len(replicas))]
+                return min(order, key=lambda name: self.busy[name])
+            name = replicas[self.turn % len(replicas)]
+            self.turn += 1
+            return name
+
+    def acquire(self, name: str) -> None:
+        with self.lock:
+            self.busy[name] += 1
+
+    def release(self, name: str) -> None:
+        with self.lock:
+            self.busy[name] -= 1
+
+
+balancer = Balancer()
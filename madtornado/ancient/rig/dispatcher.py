@@ -0,0 +1,220 @@
+"""
+
+dispatcher模块提供按路径分段建立前缀树的路由分发器，替代tornado逐条正则扫描路由表的方式
+
+纯文本路由(如/v3/prefix/recp)通过字典直接命中，包含正则的路由(如RESTful生成的路由)按照
+其正则前的文本前缀挂载到前缀树节点上，前缀末尾不完整的分段(如/zoos中的zoos)按首字符分桶挂载，
+请求到来时只对路径经过节点上的候选路由进行正则匹配，候选路由仍然按照注册顺序尝试，
+与tornado原有的匹配优先级保持一致
+
+"""
+from tornado.routing import ReversibleRuleRouter, PathMatches
+from tornado.web import RequestHandler
+
+from inspect import isclass
+from typing import Dict, List, Tuple
+
+_SPECIAL = set(".^$*+?{}[]|()")
+_QUANTIFIER = set("*+?{")
+
+
+def _has_alternation(pattern):
+    """
+
+    判断正则表达式最外层是否存在分支符号|，存在时文本前缀不可用
+
+    :param pattern: 正则表达式
+    :return: bool
+
+    """
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def literal_prefix(pattern):
+    """
+
+    提取路由正则表达式开头的纯文本部分
+
+    举例::
+
+        literal_prefix(r"/v3/recp$")  返回 ("/v3/recp", True)
+        literal_prefix(r"/zoos(?:/([^\\/]*))?$")  返回 ("/zoos", False)
+
+    :param pattern: 路由正则表达式
+    :return: (文本前缀，整个表达式是否为纯文本)
+
+    """
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    if _has_alternation(pattern):
+        return "", False
+    anchored = pattern.endswith("$") and not pattern.endswith("\\$")
+    body = pattern[:-1] if anchored else pattern
+
+    prefix = []
+    i = 0
+    while i < len(body):
+        c = body[i]
+        if c == "\\":
+            if i + 1 < len(body) and not body[i + 1].isalnum():
+                char, step = body[i + 1], 2
+            else:
+                return "".join(prefix), False
+        elif c in _SPECIAL:
+            return "".join(prefix), False
+        else:
+            char, step = c, 1
+        if i + step < len(body) and body[i + step] in _QUANTIFIER:
+            # 被量词修饰的字符不一定出现，不能计入前缀
+            return "".join(prefix), False
+        prefix.append(char)
+        i += step
+    return "".join(prefix), anchored
+
+
+class _Node:
+    __slots__ = ("children", "rules", "partials")
+
+    def __init__(self):
+        self.children = {}  # type: Dict[str, _Node]
+        self.rules = []  # type: List[Tuple[int, object]]
+        # 文本前缀以不完整分段结尾的路由，按该分段的首字符分桶：{首字符: [(注册序号，路由规则，不完整分段)]}
+        self.partials = {}  # type: Dict[str, List[Tuple[int, object, str]]]
+
+
+class Dispatcher(ReversibleRuleRouter):
+    """
+
+    前缀树路由分发器，与tornado.web.Application内部路由行为一致，支持RequestHandler子类作为路由目标
+
+    使用方法::
+
+        app = Application(**settings)
+        app.wildcard_router.add_rules([(AnyMatches(), Dispatcher(app, register_route))])
+
+    :param application: tornado.web.Application对象
+    :param rules: 路由列表，与传递给Application的handlers格式一致
+
+    """
+
+    def __init__(self, application, rules=None):
+        self.application = application
+        self.exact = {}  # type: Dict[str, Tuple[int, object]]
+        self.root = _Node()
+        super(Dispatcher, self).__init__(rules)
+
+    # @override
+    def add_rules(self, rules):
+        super(Dispatcher, self).add_rules(rules)
+        self.compile()
+
+    # @override
+    def process_rule(self, rule):
+        rule = super(Dispatcher, self).process_rule(rule)
+        if isinstance(rule.target, (list, tuple)):
+            rule.target = Dispatcher(self.application, rule.target)
+        return rule
+
+    # @override
+    def get_target_delegate(self, target, request, **target_params):
+        if isclass(target) and issubclass(target, RequestHandler):
+            return self.application.get_handler_delegate(request, target, **target_params)
+        return super(Dispatcher, self).get_target_delegate(target, request, **target_params)
+
+    def compile(self):
+        """
+
+        根据当前路由表重新建立索引，纯文本路由放入字典，其余路由按文本前缀的完整分段挂载到前缀树，
+        末尾不完整的分段按首字符分桶挂载到所在节点
+
+        :return: None
+
+        """
+        self.exact = {}
+        self.root = _Node()
+        for index, rule in enumerate(self.rules):
+            if isinstance(rule.matcher, PathMatches):
+                prefix, is_exact = literal_prefix(rule.matcher.regex.pattern)
+            else:
+                prefix, is_exact = "", False
+
+            if is_exact:
+                # 相同路径先注册的优先，后注册的永远不会被匹配到
+                self.exact.setdefault(prefix, (index, rule))
+                continue
+
+            node = self.root
+            partial = ""
+            if prefix.startswith("/"):
+                segs = prefix.split("/")[1:]
+                for seg in segs[:-1]:
+                    node = node.children.setdefault(seg, _Node())
+                partial = segs[-1]
+            if partial:
+                node.partials.setdefault(partial[0], []).append((index, rule, partial))
+            else:
+                node.rules.append((index, rule))
+
+    def candidates(self, path):
+        """
+
+        获取可能匹配该路径的路由，按注册顺序排列
+
+        :param path: 请求路径
+        :return: [(注册序号，路由规则，是否为纯文本路由)]
+
+        """
+        node = self.root
+        found = [(index, rule, False) for index, rule in node.rules]
+        segs = path.split("/")[1:]
+        for depth, seg in enumerate(segs):
+            for index, rule, partial in node.partials.get(seg[:1], ()):
+                if seg.startswith(partial):
+                    found.append((index, rule, False))
+            if depth == len(segs) - 1:
+                break
+            node = node.children.get(seg)
+            if node is None:
+                break
+            found.extend((index, rule, False) for index, rule in node.rules)
+        hit = self.exact.get(path)
+        if hit is not None:
+            found.append((hit[0], hit[1], True))
+        found.sort(key=lambda x: x[0])
+        return found
+
+    # @override
+    def find_handler(self, request, **kwargs):
+        for _, rule, is_exact in self.candidates(request.path):
+            if is_exact:
+                target_params = {"path_args": [], "path_kwargs": {}}
+            else:
+                target_params = rule.matcher.match(request)
+                if target_params is None:
+                    continue
+            if rule.target_kwargs:
+                target_params["target_kwargs"] = rule.target_kwargs
+            delegate = self.get_target_delegate(rule.target, request, **target_params)
+            if delegate is not None:
+                return delegate
+        return None
@@ -0,0 +1,175 @@
+"""
+
+fileWatch模块通过Linux inotify监听目录树的变化，不需要安装第三方库，
+用于静态文件缓存等需要在文件变化时立即失效的场景，其它平台上available()返回False
+
+"""
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+from typing import Callable, Dict, Optional
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+_watcher = None  # type: Optional[Watcher]
+
+
+def _load_libc():
+    global _libc
+    if _libc is None and sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+def available() -> bool:
+    """
+
+    当前平台是否支持inotify
+
+    :return: bool
+
+    """
+    return _load_libc() is not None
+
+
+class Watcher:
+    """
+
+    递归监听目录树，新建的子目录会自动加入监听，事件在IOLoop中回调所有回调函数::
+
+        watcher = Watcher(lambda path, is_dir: print(path))
+        watcher.watch("statics/")
+
+    回调参数path为发生变化的文件或目录的绝对路径，事件队列溢出时path为None，代表需要全部失效
+
+    :param callback: 回调函数callback(path, is_dir)，可以通过add_callback添加更多
+
+    """
+
+    def __init__(self, callback: Callable[[Optional[str], bool], None] = None):
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("inotify is not available on this platform")
+        self.libc = libc
+        self.callbacks = [callback] if callback else []
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}  # type: Dict[int, str]
+        self.roots = set()
+        self.io_loop = IOLoop.current()
+        self.io_loop.add_handler(self.fd, self.on_read, IOLoop.READ)
+
+    def add_callback(self, callback: Callable[[Optional[str], bool], None]) -> None:
+        self.callbacks.append(callback)
+
+    def notify(self, path: Optional[str], is_dir: bool) -> None:
+        for callback in self.callbacks:
+            try:
+                callback(path, is_dir)
+            except Exception as e:
+                app_log.warning("inotify callback failed: %s", e)
+
+    def watch(self, root: str) -> None:
+        """
+
+        递归监听目录，已经监听的目录不会重复添加
+
+        :param root: 目录路径
+        :return: None
+
+        """
+        root = os.path.abspath(root)
+        if root in self.roots:
+            return
+        self.roots.add(root)
+        self.add_tree(root)
+
+    def add_tree(self, root: str) -> None:
+        for dir_path, _, _ in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err != errno.ENOENT:
+                    app_log.warning("inotify watch %s failed: %s", dir_path, os.strerror(err))
+                continue
+            self.paths[wd] = dir_path
+
+    def on_read(self, fd, events) -> None:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.notify(None, True)
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            dir_path = self.paths.get(wd)
+            if dir_path is None:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+            is_dir = bool(mask & IN_ISDIR) or not name
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            self.notify(path, is_dir)
+
+    def close(self) -> None:
+        self.io_loop.remove_handler(self.fd)
+        os.close(self.fd)
+        self.paths.clear()
+        self.roots.clear()
+
+
+def get_watcher() -> Optional[Watcher]:
+    """
+
+    获取进程内共享的Watcher，当前平台不支持inotify时返回None
+
+    :return: Watcher或None
+
+    """
+    global _watcher
+    if _watcher is None and available():
+        _watcher = Watcher()
+    return _watcher
@@ -1,3 +1,77 @@
+import itertools
+import collections
+
+# mysql 5.7的max_allowed_packet默认值，无法查询服务端配置时使用
+MAX_PACKET = 4 * 1024 * 1024
+# 生成的sql语句缓存数量
+SQL_CACHE_SIZE = 1024
+
+
+class SQLCache:
+    """
+
+    按语句结构(表名，字段，where条件，占位符)缓存生成的sql模板的LRU缓存，
+    相同结构的语句只拼接一次，参数值不参与缓存键
+
+    hits和misses为命中与未命中次数，多线程下为近似值，仅用于统计
+
+    :param maxsize: 最多缓存的语句数量
+
+    """
+
+    def __init__(self, maxsize=SQL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+
+        获取缓存的sql语句，不存在时调用build生成并缓存
+
+        :param key: 语句结构
+        :param build: 生成sql语句的函数
+        :return: sql语句
+
+        """
+        try:
+            sql = self.data[key]
+        except KeyError:
+            self.misses += 1
+            sql = self.data[key] = build()
+            if len(self.data) > self.maxsize:
+                try:
+                    self.data.popitem(last=False)
+                except KeyError:
+                    pass
+            return sql
+        self.hits += 1
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            # 其它线程恰好淘汰了该语句
+            pass
+        return sql
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """
+
+        获取缓存统计信息
+
+        :return: {"hits": 命中次数, "misses": 未命中次数, "size": 当前缓存数量, "maxsize": 最大缓存数量}
+
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.data), "maxsize": self.maxsize}
+
+
+sql_cache = SQLCache()
+
+
 def select_tcw(table, field=("*",), where=None):
     """
 
@@ -12,6 +86,11 @@ def select_tcw(table, field=("*",), where=None):
     :return: 查询sql语句
 
     """
+    field = tuple(field)
+    return sql_cache.get(("select", table, field, where), lambda: _select_tcw(table, field, where))
+
+
+def _select_tcw(table, field, where):
     sql = "select {} from {}".format(",".join(field), table)
     if where:
         sql += " where " + where
@@ -44,16 +123,17 @@ def insert_tc(table, content, many=False, ph="%s"):
     """
     if isinstance(content, list):
         content_len = len(content[0]) if many else len(content)
-        sql = "insert into {} values({})".format(table, ",".join([ph] * content_len))
+        sql = sql_cache.get(("insert", table, content_len, ph), lambda: "insert into {} values({})".format(
+            table, ",".join([ph] * content_len)))
     elif isinstance(content, dict):
         if many:
-            field = "(" + ",".join(content["key"]) + ")"
-            sql = "insert into {}{} values({})".format(table, field, ",".join([ph] * len(content["key"])))
+            key = tuple(content["key"])
             content = content["value"]
         else:
-            field = "(" + ",".join(content.keys()) + ")"
-            sql = "insert into {}{} values({})".format(table, field, ",".join([ph] * len(content.values())))
+            key = tuple(content.keys())
             content = list(content.values())
+        sql = sql_cache.get(("insert", table, key, ph), lambda: "insert into {}({}) values({})".format(
+            table, ",".join(key), ",".join([ph] * len(key))))
     else:
         raise TypeError("content is not a dict or list")
     return sql, content
@@ -83,22 +163,102 @@ def insert_update_tc(table, content, many=False, ph="%s"):
     """
     if isinstance(content, dict):
         if many:
-            field = "(" + ",".join(content["key"]) + ")"
-            sql = "insert into {}{} values({}) on duplicate key update ".format(table, field, ",".join(
-                [ph] * len(content["key"])))
-            sql += ",".join(map(lambda x: "{} = values({})".format(x, x), content["key"]))
+            key = tuple(content["key"])
             content = content["value"]
         else:
-            field = "(" + ",".join(content.keys()) + ")"
-            sql = "insert into {}{} values({}) on duplicate key update ".format(table, field, ",".join(
-                [ph] * len(content.values())))
-            sql += ",".join(map(lambda x: "{} = values({})".format(x, x), content.keys()))
+            key = tuple(content.keys())
             content = list(content.values())
+        sql = sql_cache.get(("insert_update", table, key, ph), lambda: _insert_update_tc(table, key, ph))
     else:
         raise TypeError("content is not a dict")
     return sql, content
 
 
+def _insert_update_tc(table, key, ph):
+    sql = "insert into {}({}) values({}) on duplicate key update ".format(table, ",".join(key), ",".join(
+        [ph] * len(key)))
+    sql += ",".join(map(lambda x: "{} = values({})".format(x, x), key))
+    return sql
+
+
+def _value_size(value):
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 3
+    if isinstance(value, (bytes, bytearray)):
+        # 二进制内容转义后最多膨胀为两倍
+        return len(value) * 2 + 3
+    if value is None or isinstance(value, (int, float, bool)):
+        return 24
+    return len(str(value)) + 3
+
+
+def insert_bulk(table, rows, key=None, update=False, ph="%s", max_packet=MAX_PACKET, max_args=None):
+    """
+
+    生成多行插入语句，rows可以是生成器，按语句大小分批产出，不会一次性读取全部内容
+
+    每条语句预估的大小不超过max_packet的四分之三，为参数转义留出余量，max_args用于限制
+    单条语句的参数数量，如sqlite对参数数量有上限
+
+    示例内容::
+
+        list(insert_bulk("table", [[1, "a"], [2, "b"]]))
+        转换内容 ： [('insert into table values(%s,%s),(%s,%s)', [1, 'a', 2, 'b'], 2)]
+
+        list(insert_bulk("table", ({"id": i, "name": "n"} for i in range(2)), update=True))
+        转换内容 ： [('insert into table(id,name) values(%s,%s),(%s,%s) on duplicate key update
+        id = values(id),name = values(name)', [0, 'n', 1, 'n'], 2)]
+
+    :param table: 插入内容的表名称
+    :param rows: 可迭代的行数据，每行是list/tuple或dict，dict类型时字段名称取自key或第一行的键
+    :param key: 字段名称列表，默认值：None
+    :param update: 是否生成插入即更新语句(mysql)，需要能够确定字段名称，默认值：False
+    :param ph: 预查询模板占位符，默认值：%s
+    :param max_packet: 单条语句的最大字节数，对应mysql的max_allowed_packet
+    :param max_args: 单条语句的最大参数数量，默认值：None不限制
+    :return: 生成器，每次产出(多行插入预查询模板，展开后的预查询参数，本条语句的行数)
+
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    if isinstance(first, dict):
+        key = list(first.keys()) if key is None else list(key)
+        width = len(key)
+    elif isinstance(first, (list, tuple)):
+        width = len(first)
+    else:
+        raise TypeError("row is not a dict, list or tuple")
+
+    head = "insert into {}{} values".format(table, "(" + ",".join(key) + ")" if key else "")
+    tail = ""
+    if update:
+        if not key:
+            raise TypeError("update requires key or dict rows")
+        tail = " on duplicate key update " + ",".join(map(lambda x: "{} = values({})".format(x, x), key))
+    row_ph = "(" + ",".join([ph] * width) + ")"
+    budget = max_packet * 3 // 4 - len(head) - len(tail)
+    max_rows = max(1, max_args // width) if max_args else None
+
+    args = []
+    count = size = 0
+    for row in itertools.chain((first,), rows):
+        values = [row[k] for k in key] if isinstance(row, dict) else row
+        if len(values) != width:
+            raise ValueError("row has {} values but {} columns are expected".format(len(values), width))
+        row_size = len(row_ph) + 1 + sum(map(_value_size, values))
+        if count and (size + row_size > budget or count == max_rows):
+            yield head + ",".join([row_ph] * count) + tail, args, count
+            args = []
+            count = size = 0
+        args.extend(values)
+        count += 1
+        size += row_size
+    if count:
+        yield head + ",".join([row_ph] * count) + tail, args, count
+
+
 def update_tcw(table, content, where=None, where_arg=None, ph="%s"):
     """
 
@@ -118,12 +278,18 @@ def update_tcw(table, content, where=None, where_arg=None, ph="%s"):
 
     """
     arg_list = list(content.values())
-    sql = "update {} set {}".format(table, ",".join(map(lambda x: x + "=" + ph, content.keys())))
+    key = tuple(content.keys())
+    sql = sql_cache.get(("update", table, key, where, ph), lambda: _update_tcw(table, key, where, ph))
+    if where and where_arg:
+        arg_list.extend(where_arg)
+    return sql, arg_list
+
+
+def _update_tcw(table, key, where, ph):
+    sql = "update {} set {}".format(table, ",".join(map(lambda x: x + "=" + ph, key)))
     if where:
         sql += " where " + where
-        if where_arg:
-            arg_list.extend(where_arg)
-    return sql, arg_list
+    return sql
 
 
 def delete_tw(table, where=None):
@@ -191,3 +357,30 @@ class InputResult:
         self.err_info = None
         self.affect = None
         self.last_rowid = None
+
+
+class BulkResult(InputResult):
+    """
+
+    批量插入返回的结果对象，在InputResult的基础上记录吞吐信息
+
+    rows : 成功写入的行数
+
+    statements : 执行的语句数量
+
+    seconds : 总耗时，单位秒
+
+    rate : 每秒写入的行数
+
+    """
+
+    def __init__(self):
+        super(BulkResult, self).__init__()
+        self.affect = 0
+        self.rows = 0
+        self.statements = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
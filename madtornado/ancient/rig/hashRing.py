@@ -0,0 +1,76 @@
+"""
+
+hashRing模块提供一致性哈希环，syncMemcached和asyncMemcached使用同一个哈希环分配缓存服务器，
+两者写入的缓存可以互相读取，增减服务器时只有少部分key会被重新分配
+
+"""
+import bisect
+import hashlib
+from typing import Any, Iterator, List
+
+def hash_point(data: bytes) -> int:
+    return int.from_bytes(hashlib.md5(data).digest()[:4], "little")
+
+
+class HashRing:
+    """
+
+    ketama风格的一致性哈希环，每个节点在环上放置replicas个虚拟节点
+
+    举例::
+
+        ring = HashRing(["127.0.0.1:11211", "127.0.0.1:11212"])
+        ring.get_node(b"user:1")  # 返回key所在的节点
+        list(ring.iter_nodes(b"user:1"))  # 按顺序返回所有节点，用于节点不可用时转移
+
+    :param nodes: 节点列表，节点需要能通过str转换成稳定的名称
+    :param replicas: 每个节点的虚拟节点数量
+
+    """
+
+    def __init__(self, nodes: List[Any], replicas: int = 160):
+        self.nodes = list(nodes)
+        points = []
+        for node in self.nodes:
+            for i in range(replicas // 4):
+                digest = hashlib.md5("{}-{}".format(node, i).encode("utf-8")).digest()
+                for j in range(4):
+                    points.append((int.from_bytes(digest[j * 4:j * 4 + 4], "little"), node))
+        points.sort(key=lambda x: x[0])
+        self.points = [p[0] for p in points]
+        self.owners = [p[1] for p in points]
+
+    def get_node(self, key: bytes) -> Any:
+        """
+
+        获取key所在的节点
+
+        :param key: 缓存的key
+        :return: 节点，没有节点时返回None
+
+        """
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, hash_point(key)) % len(self.points)
+        return self.owners[index]
+
+    def iter_nodes(self, key: bytes) -> Iterator[Any]:
+        """
+
+        从key所在的位置开始沿哈希环依次返回不重复的节点
+
+        :param key: 缓存的key
+        :return: 节点生成器
+
+        """
+        if not self.points:
+            return
+        start = bisect.bisect(self.points, hash_point(key))
+        seen = set()
+        for i in range(len(self.points)):
+            node = self.owners[(start + i) % len(self.points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
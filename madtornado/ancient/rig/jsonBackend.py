@@ -0,0 +1,172 @@
+"""
+
+jsonBackend模块提供可替换的JSON序列化后端，由[tornado] json_backend配置选择，
+ResponseModel，BaseHandler的write_dict，write_array，get_body2json以及utils.require都通过该模块编解码
+
+可选后端::
+
+    stdlib: 标准库json
+    orjson: 需要pip install orjson，速度最快
+    ujson: 需要pip install ujson
+    auto: 按orjson，ujson，stdlib的顺序选择第一个已安装的后端
+
+所有后端的date和datetime都交给encode_default转换(与DateEncoder格式相同)，与encode_date参数无关，
+orjson通过OPT_PASSTHROUGH_DATETIME关闭自带的RFC 3339格式，不同后端输出的空白字符和非ASCII字符转义方式可能不同，
+但解析后的内容相同
+
+"""
+from ..conf import parser
+
+import json
+import datetime
+from typing import Any, Callable, Dict, Union
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def encode_default(obj):
+    """
+
+    序列化JSON不支持的类型时调用，date和datetime转换成与DateEncoder相同格式的字符串
+
+    :param obj: 不支持的对象
+    :return: 可以序列化的对象
+
+    """
+    # isoformat比strftime快数倍，结果与DATETIME_FORMAT和DATE_FORMAT相同
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat(" ")[:16]
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+def _stdlib() -> Dict[str, Callable]:
+    encoder = json.JSONEncoder(ensure_ascii=False, default=encode_default)
+    plain_encoder = json.JSONEncoder(default=encode_default)
+
+    def dumps(data, encode_date=False) -> str:
+        if encode_date:
+            return encoder.encode(data)
+        return plain_encoder.encode(data)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+    return {"dumps": dumps, "dumpb": lambda data, encode_date=False: dumps(data, encode_date).encode("utf-8"),
+            "loads": loads}
+
+
+def _orjson() -> Dict[str, Callable]:
+    import orjson
+
+    # 不使用orjson自带的RFC 3339日期格式，date和datetime交给encode_default，与其他后端输出一致
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumpb(data, encode_date=False) -> bytes:
+        return orjson.dumps(data, default=encode_default, option=option)
+
+    return {"dumps": lambda data, encode_date=False: dumpb(data).decode("utf-8"), "dumpb": dumpb,
+            "loads": orjson.loads}
+
+
+def _ujson() -> Dict[str, Callable]:
+    import ujson
+
+    def dumps(data, encode_date=False) -> str:
+        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False, default=encode_default)
+
+    return {"dumps": dumps, "dumpb": lambda data, encode_date=False: dumps(data).encode("utf-8"),
+            "loads": ujson.loads}
+
+
+BACKENDS = {
+    "stdlib": _stdlib,
+    "orjson": _orjson,
+    "ujson": _ujson,
+}
+
+
+def load_backend(name: str) -> Dict[str, Callable]:
+    """
+
+    加载指定名称的后端，auto代表选择第一个已安装的后端
+
+    :param name: 后端名称，auto，stdlib，orjson或ujson
+    :return: 包含dumps，dumpb和loads函数的字典
+
+    """
+    if name != "auto":
+        functions = BACKENDS[name]()
+        functions["name"] = name
+        return functions
+    for candidate in ("orjson", "ujson"):
+        try:
+            return load_backend(candidate)
+        except ImportError:
+            continue
+    return load_backend("stdlib")
+
+
+_backend = {}  # type: Dict[str, Callable]
+
+
+def use(name: str) -> None:
+    """
+
+    切换当前进程使用的JSON后端，例如在基准测试中对比不同后端
+
+    :param name: 后端名称，auto，stdlib，orjson或ujson
+    :return: None
+
+    """
+    global _backend
+    _backend = load_backend(name)
+
+
+def backend_name() -> str:
+    return _backend["name"]
+
+
+def dumps(data, encode_date=False) -> str:
+    """
+
+    序列化JSON，返回字符串
+
+    :param data: 需要序列化的对象
+    :param encode_date: 对象中是否存在date或datetime对象，为True时stdlib后端不转义非ASCII字符
+    :return: str
+
+    """
+    return _backend["dumps"](data, encode_date)
+
+
+def dumpb(data, encode_date=False) -> bytes:
+    """
+
+    序列化JSON，返回UTF-8编码的bytes，直接写入响应时避免一次编码转换
+
+    :param data: 需要序列化的对象
+    :param encode_date: 对象中是否存在date或datetime对象
+    :return: bytes
+
+    """
+    return _backend["dumpb"](data, encode_date)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+
+    解析JSON，格式错误时抛出ValueError(json.JSONDecodeError是ValueError的子类)
+
+    :param data: JSON字符串或bytes
+    :return: 解析后的对象
+
+    """
+    return _backend["loads"](data)
+
+
+use(parser.section("tornado")["json_backend"])
@@ -0,0 +1,264 @@
+"""
+
+localCache模块提供进程内的LRU/TTL缓存，作为memcached前面的一级缓存，
+syncMemcached和asyncMemcached共用同一个实例
+
+一级缓存只存在于当前进程，其它进程修改的缓存最多在local_ttl秒后才能被感知，
+不存在的key会以None缓存negative_ttl秒
+
+"""
+from ..conf import parser
+
+import sys
+import time
+import asyncio
+import threading
+import collections
+from typing import Any, Callable, Dict, Optional
+
+# 缓存中不存在该key，与缓存了None(不存在的key)区分
+MISSING = object()
+
+_local_cache = None  # type: Optional[LocalCache]
+_lock = threading.Lock()
+
+
+def size_of(value) -> int:
+    """
+
+    估算缓存值占用的字节数，容器类型只计算自身大小
+
+    :param value: 缓存值
+    :return: 字节数
+
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LocalCache:
+    """
+
+    按条目数量和字节数双重限制的LRU缓存，每个条目有各自的过期时间，
+    load和load_async对同一个key的并发未命中只调用一次加载函数(single-flight)
+
+    举例::
+
+        cache = LocalCache(max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=60)
+        value = cache.load("user:1", lambda: memcached_client.get("user:1"))
+
+    :param max_entries: 最多缓存的条目数量
+    :param max_bytes: 最多缓存的字节数
+    :param ttl: 默认过期时间，单位秒，也是所有条目过期时间的上限
+    :param negative_ttl: 加载结果为None时的缓存时间，单位秒，0代表不缓存
+
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float = 60, negative_ttl: float = 5):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.data = collections.OrderedDict()  # type: Dict[Any, tuple]
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.flights = {}  # type: Dict[Any, _Flight]
+        self.async_flights = {}  # type: Dict[Any, asyncio.Future]
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key) -> Any:
+        """
+
+        获取缓存值
+
+        :param key: 缓存的key
+        :return: 缓存值，不存在或已过期时返回MISSING，缓存了不存在的key时返回None
+
+        """
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISSING
+            value, expire_at, size = item
+            if expire_at <= time.time():
+                del self.data[key]
+                self.bytes -= size
+                self.misses += 1
+                return MISSING
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """
+
+        设置缓存值，value为None时代表key不存在，缓存negative_ttl秒
+
+        :param key: 缓存的key
+        :param value: 缓存值
+        :param ttl: 过期时间，单位秒，超过默认过期时间时使用默认过期时间
+        :return: None
+
+        """
+        ttl = self.ttl if ttl is None or ttl <= 0 else min(ttl, self.ttl)
+        if value is None:
+            ttl = min(ttl, self.negative_ttl)
+        size = size_of(value)
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            if ttl <= 0 or size > self.max_bytes:
+                return
+            self.data[key] = (value, time.time() + ttl, size)
+            self.bytes += size
+            while len(self.data) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self.data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def delete(self, key) -> None:
+        with self.lock:
+            item = self.data.pop(key, None)
+            if item is not None:
+                self.bytes -= item[2]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
+
+    def load(self, key, loader: Callable[[], Any], ttl: float = None) -> Any:
+        """
+
+        获取缓存值，未命中时调用loader加载并缓存，多个线程同时未命中同一个key时只有一个线程调用loader
+
+        :param key: 缓存的key
+        :param loader: 加载函数，返回None代表key不存在
+        :param ttl: 过期时间，单位秒
+        :return: 缓存值
+
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self.loads += 1
+            flight.value = loader()
+            self.set(key, flight.value, ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+
+    async def load_async(self, key, loader: Callable[[], Any], ttl: float = None) -> Any:
+        """
+
+        load的协程版本，loader返回可等待对象，同一个事件循环中对同一个key的并发未命中只等待一次loader
+
+        :param key: 缓存的key
+        :param loader: 返回可等待对象的加载函数，结果为None代表key不存在
+        :param ttl: 过期时间，单位秒
+        :return: 缓存值
+
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        future = self.async_flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self.async_flights[key] = asyncio.get_event_loop().create_future()
+        try:
+            self.loads += 1
+            value = await loader()
+            self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其它等待者时避免出现未获取异常的警告
+            future.exception()
+            raise
+        finally:
+            del self.async_flights[key]
+            if not future.done():
+                # 加载被取消时通知等待者
+                future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+
+        获取缓存统计信息
+
+        :return: 命中次数，未命中次数，命中率，加载次数，合并的并发加载次数，淘汰次数，条目数量，字节数
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self.data),
+            "bytes": self.bytes,
+        }
+
+
+def get_local_cache() -> Optional[LocalCache]:
+    """
+
+    获取进程内共享的一级缓存，根据[cache]配置创建，local_entries为0时返回None
+
+    :return: LocalCache或None
+
+    """
+    global _local_cache
+    if _local_cache is None:
+        option = parser.section("cache")
+        if option["local_entries"] <= 0:
+            return None
+        with _lock:
+            if _local_cache is None:
+                _local_cache = LocalCache(option["local_entries"], option["local_bytes"],
+                                          min(option["local_ttl"], option["over_time"]), option["negative_ttl"])
+    return _local_cache
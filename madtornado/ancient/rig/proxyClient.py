@@ -0,0 +1,638 @@
+"""
+
+proxyClient模块为ProxyHandler提供每个上游独立的HTTP客户端，由[tornado-proxy]配置控制::
+
+    [tornado-proxy]
+    client = auto
+    max_clients = 1000
+    request_timeout = 10
+    upload_timeout = 900
+    upstream_option = {"p1": {"max_clients": 200, "request_timeout": 60}}
+
+client为curl时使用libcurl自带的连接复用(需要安装pycurl)，为simple时使用KeepAliveClient，
+在tornado的SimpleAsyncHTTPClient基础上复用到同一个上游的连接，auto在安装了pycurl时使用curl
+
+simple客户端的streaming_callback可以返回Future，Future完成之前不会继续读取上游的响应，
+ProxyHandler借此在客户端接收较慢时暂停读取上游，curl客户端不支持
+
+request_timeout从开始请求上游计算到收到完整响应，流式转发请求体时包含整个上传的时间，
+因此带有请求体的代理请求改用更长的upload_timeout，读取客户端请求体的时间由HTTPServer的body_timeout限制，
+upload_timeout应大于body_timeout
+
+每个上游统计请求数，错误数，并发数，排队耗时和上游耗时，通过stats()获取
+
+一个alias可以对应一组后端，按balance选择后端::
+
+    proxy_handler = [["api", ["http://127.0.0.1:8001", "http://127.0.0.1:8002"]]]
+
+    round_robin: 轮询
+    least_conn: 选择当前请求数最少的后端
+    hash: 按hash_header请求头(没有该请求头时按客户端IP)一致性哈希，同一个值总是落到同一个后端
+
+连续失败max_fails次(连接失败，超时或者502/503/504)的后端在fail_timeout秒内不再被选择，
+health_interval大于0时每隔health_interval秒请求每个后端的health_path(默认为PongHandler的/pong)，
+不可用的后端在恢复之前不会被选择，所有后端都不可用时依然从全部后端中选择，
+server.py在每个进程创建Application时调用start_upstreams，健康检查从启动时开始
+
+"""
+from ..conf import parser
+from .hashRing import HashRing
+
+from tornado.httpclient import HTTPRequest, HTTPResponse
+from tornado.simple_httpclient import SimpleAsyncHTTPClient, _HTTPConnection
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.log import app_log
+from tornado.iostream import IOStream
+from tornado import gen
+
+import ssl
+import time
+import select
+import socket
+import weakref
+import collections
+import urllib.parse
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    from tornado.curl_httpclient import CurlAsyncHTTPClient
+except ImportError:
+    CurlAsyncHTTPClient = None
+
+# 逐跳头部，只对一个连接有效，不能转发给上游
+HOP_HEADERS = (
+    "Connection",
+    "Keep-Alive",
+    "Proxy-Connection",
+    "Proxy-Authenticate",
+    "Proxy-Authorization",
+    "TE",
+    "Trailer",
+    "Transfer-Encoding",
+    "Upgrade",
+)
+
+# upstream_option中可以覆盖的配置项
+OPTION_KEYS = ("client", "max_clients", "connect_timeout", "request_timeout", "upload_timeout",
+               "keep_alive", "keep_alive_timeout", "max_idle",
+               "balance", "hash_header", "max_fails", "fail_timeout", "retries",
+               "health_interval", "health_path")
+
+BALANCES = ("round_robin", "least_conn", "hash")
+
+# 后端返回这些状态码时记为一次失败
+FAIL_CODES = (502, 503, 504)
+
+# 可以安全重试的请求方法
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+_upstreams = {}  # type: Dict[str, Upstream]
+
+# 按(validate_cert, ca_certs, client_cert, client_key)缓存的SSLContext，相同TLS配置的请求使用同一个对象
+_ssl_contexts = {}  # type: Dict[Tuple[bool, Optional[str], Optional[str], Optional[str]], ssl.SSLContext]
+
+
+def tls_identity(ssl_options) -> Any:
+    """
+
+    连接池键中的TLS部分，TLS配置不同的连接不能互相复用，避免健康检查等校验证书的请求复用没有校验过证书的连接
+
+    :param ssl_options: TCPClient.connect的ssl_options，None，SSLContext或dict
+    :return: http为None，SSLContext为其本身，dict为其内容
+
+    """
+    if ssl_options is None:
+        return None
+    if isinstance(ssl_options, ssl.SSLContext):
+        return ssl_options
+    return tuple(sorted((key, repr(value)) for key, value in ssl_options.items()))
+
+
+class ConnectionPool:
+    """
+
+    按(host, port, TLS配置)保存空闲连接的连接池，代替SimpleAsyncHTTPClient的tcp_client，
+    有空闲连接时直接返回，否则建立新连接，TLS配置参考tls_identity
+
+    空闲连接后进先出，超过keep_alive_timeout秒或被上游关闭的连接在取出时丢弃，
+    keep_alive_timeout应小于上游服务器的keep-alive超时时间
+
+    :param tcp_client: tornado.tcpclient.TCPClient
+    :param keep_alive_timeout: 空闲连接的最长保留秒数
+    :param max_idle: 每个上游地址最多保留的空闲连接数
+
+    """
+
+    def __init__(self, tcp_client, keep_alive_timeout: float = 4, max_idle: int = 64):
+        self.tcp_client = tcp_client
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_idle = max_idle
+        self.idle = {}  # type: Dict[Tuple[str, int, Any], collections.deque]
+        self.keys = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+        self.sweeper = None  # type: Optional[PeriodicCallback]
+        self.created = 0
+        self.reused = 0
+
+    async def connect(self, host: str, port: int, af=socket.AF_UNSPEC, ssl_options=None,
+                      max_buffer_size: int = None, source_ip: str = None, source_port: int = None,
+                      timeout=None) -> IOStream:
+        key = (host, port, tls_identity(ssl_options))
+        stream = self.acquire(key)
+        if stream is None:
+            stream = await self.tcp_client.connect(host, port, af=af, ssl_options=ssl_options,
+                                                   max_buffer_size=max_buffer_size, source_ip=source_ip,
+                                                   source_port=source_port, timeout=timeout)
+            self.created += 1
+        else:
+            self.reused += 1
+        self.keys[stream] = key
+        return stream
+
+    def acquire(self, key: Tuple[str, int, Any]) -> Optional[IOStream]:
+        streams = self.idle.get(key)
+        deadline = time.monotonic() - self.keep_alive_timeout
+        while streams:
+            stream, since = streams.pop()
+            if since >= deadline and self.alive(stream):
+                return stream
+            stream.close()
+        return None
+
+    def release(self, stream: IOStream) -> None:
+        """
+
+        响应读取完毕后归还连接
+
+        :param stream: 已经从HTTP1Connection分离的IOStream
+        :return: None
+
+        """
+        key = self.keys.pop(stream, None)
+        if key is None or stream.closed():
+            stream.close()
+            return
+        streams = self.idle.setdefault(key, collections.deque())
+        if len(streams) >= self.max_idle:
+            stream.close()
+            return
+        streams.append((stream, time.monotonic()))
+        if self.sweeper is None:
+            self.sweeper = PeriodicCallback(self.sweep, max(self.keep_alive_timeout, 1) * 1000)
+            self.sweeper.start()
+
+    @staticmethod
+    def alive(stream: IOStream) -> bool:
+        """
+
+        检查空闲连接是否可用，空闲连接上不应该有任何数据，可读代表上游已经关闭连接(包括TLS的close_notify)或发送了多余的数据
+
+        不使用recv(MSG_PEEK)，ssl.SSLSocket不允许recv带有flags
+
+        :param stream: 空闲的IOStream
+        :return: bool
+
+        """
+        if stream.closed() or stream.reading():
+            return False
+        sock = stream.socket
+        try:
+            pending = getattr(sock, "pending", None)
+            if pending is not None and pending():
+                return False
+            if hasattr(select, "poll"):
+                poller = select.poll()
+                poller.register(sock.fileno(), select.POLLIN | select.POLLPRI)
+                return not poller.poll(0)
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def sweep(self) -> None:
+        deadline = time.monotonic() - self.keep_alive_timeout
+        for streams in self.idle.values():
+            while streams and streams[0][1] < deadline:
+                streams.popleft()[0].close()
+
+    def idle_count(self) -> int:
+        return sum(len(streams) for streams in self.idle.values())
+
+    def close(self) -> None:
+        if self.sweeper is not None:
+            self.sweeper.stop()
+        for streams in self.idle.values():
+            for stream, _ in streams:
+                stream.close()
+        self.idle.clear()
+        self.tcp_client.close()
+
+
+class StreamingConnection(_HTTPConnection):
+    """
+    streaming_callback返回Future时等待其完成后再读取下一块响应，形成反压
+    """
+
+    # @override
+    def data_received(self, chunk):
+        if self._should_follow_redirect():
+            return None
+        if self.request.streaming_callback is not None:
+            return self.request.streaming_callback(chunk)
+        self.chunks.append(chunk)
+        return None
+
+
+class StreamingClient(SimpleAsyncHTTPClient):
+    """
+    使用StreamingConnection的SimpleAsyncHTTPClient，每个请求依然建立新连接
+    """
+
+    # @override
+    def _connection_class(self):
+        return StreamingConnection
+
+
+class KeepAliveConnection(StreamingConnection):
+    """
+    读取完响应后把连接归还给ConnectionPool，而不是关闭
+    """
+
+    # @override
+    def _get_ssl_options(self, scheme):
+        # tornado在validate_cert=False等非默认配置时每个请求创建新的SSLContext，缓存后相同配置的连接才能复用
+        request = self.request
+        if scheme != "https" or request.ssl_options is not None:
+            return super(KeepAliveConnection, self)._get_ssl_options(scheme)
+        key = (bool(request.validate_cert), request.ca_certs, request.client_cert, request.client_key)
+        context = _ssl_contexts.get(key)
+        if context is None:
+            context = _ssl_contexts[key] = super(KeepAliveConnection, self)._get_ssl_options(scheme)
+        return context
+
+    # @override
+    def _create_connection(self, stream):
+        connection = super(KeepAliveConnection, self)._create_connection(stream)
+        connection.params.no_keep_alive = False
+        return connection
+
+    # @override
+    def _on_end_request(self):
+        connection = getattr(self, "connection", None)
+        start_line = getattr(connection, "_response_start_line", None)
+        if (connection is None or start_line is None or self.stream.closed()
+                or not connection._write_finished or not connection._can_keep_alive(start_line, self.headers)):
+            self.stream.close()
+            return
+        self.tcp_client.release(connection.detach())
+
+
+class KeepAliveClient(StreamingClient):
+    """
+
+    复用上游连接的SimpleAsyncHTTPClient，tornado自带的实现每个请求都会建立新连接并发送Connection: close
+
+    :param keep_alive_timeout: 空闲连接的最长保留秒数
+    :param max_idle: 每个上游地址最多保留的空闲连接数
+
+    """
+
+    # @override
+    def initialize(self, keep_alive_timeout: float = 4, max_idle: int = 64, **kwargs):
+        super(KeepAliveClient, self).initialize(**kwargs)
+        self.tcp_client = ConnectionPool(self.tcp_client, keep_alive_timeout, max_idle)
+
+    # @override
+    def fetch_impl(self, request, callback):
+        if "Connection" not in request.headers:
+            request.headers["Connection"] = "keep-alive"
+        super(KeepAliveClient, self).fetch_impl(request, callback)
+
+    # @override
+    def _connection_class(self):
+        return KeepAliveConnection
+
+
+class Backend:
+    """
+
+    上游组中的一个后端
+
+    :param address: 后端地址，如http://127.0.0.1:8001
+
+    """
+
+    def __init__(self, address: str):
+        self.address = address.rstrip("/")
+        self.host = urllib.parse.urlsplit(self.address).netloc
+        self.active = 0
+        self.fails = 0
+        self.dead_until = 0.0
+        self.healthy = True
+        self.requests = 0
+        self.errors = 0
+
+    def __str__(self):
+        # 哈希环按地址放置节点，多个进程的选择结果一致
+        return self.address
+
+    def alive(self) -> bool:
+        return self.healthy and self.dead_until <= time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alive": self.alive(),
+            "healthy": self.healthy,
+            "active": self.active,
+            "fails": self.fails,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class Upstream:
+    """
+
+    一个代理上游的HTTP客户端，后端组和统计信息，每个上游使用独立的客户端实例，并发数和超时互不影响
+
+    :param name: 上游名称，即proxy_handler中的alias
+    :param backends: 后端地址列表
+    :param client: auto，simple或curl
+    :param max_clients: 最大并发请求数，超过后在客户端内排队
+    :param connect_timeout: 连接超时秒数
+    :param request_timeout: 请求超时秒数
+    :param upload_timeout: 带有流式请求体的请求超时秒数，包含上传时间，0代表不限制
+    :param keep_alive: 是否复用上游连接
+    :param keep_alive_timeout: 空闲连接的最长保留秒数
+    :param max_idle: 每个上游地址最多保留的空闲连接数
+    :param balance: 选择后端的方式，round_robin，least_conn或hash
+    :param hash_header: balance为hash时使用的请求头，为空时使用客户端IP
+    :param max_fails: 连续失败多少次后暂时剔除后端，0代表不剔除
+    :param fail_timeout: 剔除的秒数
+    :param retries: 幂等且没有请求体的请求在连接失败或超时时换一个后端重试的次数
+    :param health_interval: 主动健康检查的间隔秒数，0代表不检查
+    :param health_path: 健康检查请求的路径
+
+    """
+
+    def __init__(self, name: str, backends: Sequence[str] = (), client: str = "auto", max_clients: int = 1000,
+                 connect_timeout: float = 5, request_timeout: float = 10, upload_timeout: float = 900,
+                 keep_alive: bool = True,
+                 keep_alive_timeout: float = 4, max_idle: int = 64, balance: str = "round_robin",
+                 hash_header: str = "", max_fails: int = 3, fail_timeout: float = 10, retries: int = 1,
+                 health_interval: float = 0, health_path: str = "/pong"):
+        if balance not in BALANCES:
+            raise ValueError("balance must be one of {}".format(", ".join(BALANCES)))
+        self.backends = [Backend(address) for address in backends]
+        self.balance = balance
+        self.hash_header = hash_header
+        self.ring = HashRing(self.backends, replicas=160) if balance == "hash" else None
+        self.counter = 0
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.retries = retries
+        self.upload_timeout = upload_timeout
+        self.health_path = health_path
+        self.health_timeout = connect_timeout
+        self.health_checker = None  # type: Optional[PeriodicCallback]
+        if client == "auto":
+            client = "curl" if CurlAsyncHTTPClient is not None else "simple"
+        if client == "curl" and CurlAsyncHTTPClient is None:
+            raise ImportError("client = curl requires pycurl: pip install pycurl")
+        self.name = name
+        self.kind = client
+        self.keep_alive = keep_alive
+        defaults = {"connect_timeout": connect_timeout, "request_timeout": request_timeout}
+        if client == "curl":
+            self.client = CurlAsyncHTTPClient(force_instance=True, max_clients=max_clients,
+                                              defaults=defaults)
+        elif keep_alive:
+            self.client = KeepAliveClient(force_instance=True, max_clients=max_clients, defaults=defaults,
+                                          keep_alive_timeout=keep_alive_timeout, max_idle=max_idle)
+        else:
+            self.client = StreamingClient(force_instance=True, max_clients=max_clients, defaults=defaults)
+        self.max_clients = max_clients
+
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queued = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.queue_time = 0.0
+        self.queue_time_max = 0.0
+        self.retried = 0
+
+        if health_interval > 0 and self.backends:
+            self.health_checker = PeriodicCallback(self.check_health, health_interval * 1000)
+            self.health_checker.start()
+            IOLoop.current().spawn_callback(self.check_health)
+
+    def select(self, request=None, exclude: Sequence[Backend] = ()) -> Backend:
+        """
+
+        按balance选择一个后端，优先选择可用且不在exclude中的后端
+
+        :param request: tornado.httputil.HTTPServerRequest，balance为hash时使用
+        :param exclude: 本次请求已经失败的后端
+        :return: Backend
+
+        """
+        candidates = [b for b in self.backends if b.alive() and b not in exclude]
+        if not candidates:
+            # 所有后端都不可用时依然尝试，而不是直接返回错误
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+        if self.balance == "hash":
+            value = request.headers.get(self.hash_header, "") if request is not None and self.hash_header else ""
+            if not value and request is not None:
+                value = request.remote_ip or ""
+            for backend in self.ring.iter_nodes(value.encode("utf-8")):
+                if backend in candidates:
+                    return backend
+        self.counter += 1
+        start = self.counter % len(candidates)
+        if self.balance == "least_conn":
+            # 从轮询位置开始比较，请求数相同的后端轮流被选择
+            rotated = candidates[start:] + candidates[:start]
+            return min(rotated, key=lambda b: b.active)
+        return candidates[start]
+
+    def success(self, backend: Backend) -> None:
+        backend.fails = 0
+
+    def failure(self, backend: Backend) -> None:
+        backend.errors += 1
+        backend.fails += 1
+        if self.max_fails and backend.fails >= self.max_fails:
+            if backend.dead_until <= time.time():
+                app_log.warning("proxy %s backend %s ejected for %ss after %d failures",
+                                self.name, backend.address, self.fail_timeout, backend.fails)
+            backend.dead_until = time.time() + self.fail_timeout
+
+    async def check_health(self) -> None:
+        """
+
+        请求每个后端的health_path，2xx和3xx代表可用，其它状态码，连接失败或超时代表不可用
+
+        :return: None
+
+        """
+        async def probe(backend):
+            try:
+                response = await self.client.fetch(backend.address + self.health_path, raise_error=False,
+                                                   connect_timeout=self.health_timeout,
+                                                   request_timeout=self.health_timeout)
+                healthy = 200 <= response.code < 400
+            except Exception:
+                healthy = False
+            if healthy != backend.healthy:
+                app_log.warning("proxy %s backend %s is %s", self.name, backend.address,
+                                "healthy" if healthy else "unhealthy")
+            backend.healthy = healthy
+            if healthy and backend.dead_until > time.time():
+                # 健康检查通过的后端提前恢复
+                backend.dead_until = 0.0
+                backend.fails = 0
+
+        await gen.multi([probe(backend) for backend in self.backends])
+
+    async def fetch(self, request: HTTPRequest, backend: Backend = None) -> HTTPResponse:
+        """
+
+        发送请求并记录统计信息，不会因为HTTP错误码抛出异常
+
+        :param request: HTTPRequest
+        :param backend: 请求的后端，用于记录失败和当前请求数
+        :return: HTTPResponse，连接失败或超时时抛出异常
+
+        """
+        if not self.keep_alive:
+            request.headers["Connection"] = "close"
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        if self.in_flight > self.max_clients:
+            self.queued += 1
+        if backend is not None:
+            backend.requests += 1
+            backend.active += 1
+        start = IOLoop.current().time()
+        try:
+            response = await self.client.fetch(request, raise_error=False)
+        except Exception:
+            self.errors += 1
+            if backend is not None:
+                self.failure(backend)
+            raise
+        finally:
+            self.in_flight -= 1
+            if backend is not None:
+                backend.active -= 1
+        if backend is not None:
+            if response.code in FAIL_CODES:
+                self.failure(backend)
+            else:
+                self.success(backend)
+        elapsed = IOLoop.current().time() - start
+        # request_time从开始连接上游时计算，之前的时间都在客户端的队列中等待
+        waited = max(elapsed - (response.request_time or 0), 0)
+        self.latency += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        self.queue_time += waited
+        self.queue_time_max = max(self.queue_time_max, waited)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+
+        获取上游统计信息，耗时单位为秒
+
+        :return: 请求数，错误数，当前并发数，最大并发数，排队请求数，平均/最大耗时，平均/最大排队耗时，连接复用情况
+
+        """
+        requests = self.requests or 1
+        result = {
+            "client": self.kind,
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queued": self.queued,
+            "latency_avg": self.latency / requests,
+            "latency_max": self.latency_max,
+            "queue_avg": self.queue_time / requests,
+            "queue_max": self.queue_time_max,
+            "retried": self.retried,
+            "backends": {backend.address: backend.stats() for backend in self.backends},
+        }
+        pool = getattr(self.client, "tcp_client", None)
+        if isinstance(pool, ConnectionPool):
+            result.update(connections_created=pool.created, connections_reused=pool.reused,
+                          connections_idle=pool.idle_count())
+        return result
+
+    def close(self) -> None:
+        if self.health_checker is not None:
+            self.health_checker.stop()
+        self.client.close()
+
+
+def upstream_option(name: str) -> Dict[str, Any]:
+    """
+
+    合并[tornado-proxy]的全局配置和upstream_option中该上游的配置
+
+    :param name: 上游名称
+    :return: Upstream的参数
+    :raises ValueError: upstream_option中存在未知的配置项
+
+    """
+    option = parser.section("tornado-proxy")
+    result = {key: option[key] for key in OPTION_KEYS}
+    override = option["upstream_option"].get(name, {})
+    unknown = set(override) - set(OPTION_KEYS)
+    if unknown:
+        raise ValueError("unknown upstream_option for {}: {}".format(name, ", ".join(sorted(unknown))))
+    result.update(override)
+    return result
+
+
+def get_upstream(name: str, backends: Sequence[str] = ()) -> Upstream:
+    """
+
+    获取上游的客户端，第一次调用时根据配置创建，需要在IOLoop中调用
+
+    :param name: 上游名称
+    :param backends: 后端地址列表，只在第一次调用时使用
+    :return: Upstream
+
+    """
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        upstream = _upstreams[name] = Upstream(name, backends, **upstream_option(name))
+    return upstream
+
+
+def start_upstreams(proxy_options: Iterable[Dict[str, Any]]) -> None:
+    """
+
+    启动时为每个代理路由创建上游客户端，health_interval大于0时立即开始健康检查，
+    不可用的后端在第一个请求到达之前就被发现，需要在处理请求的进程中调用
+
+    :param proxy_options: ProxyHandler的proxy_option列表
+    :return: None
+
+    """
+    for option in proxy_options:
+        get_upstream(option["upstream"], option.get("backends") or [option["address"]])
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+
+    获取所有上游的统计信息
+
+    :return: {上游名称: 统计信息}
+
+    """
+    return {name: upstream.stats() for name, upstream in _upstreams.items()}
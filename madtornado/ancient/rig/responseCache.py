@@ -0,0 +1,296 @@
+"""
+
+responseCache模块提供handler方法的响应缓存，缓存命中时在BaseHandler.prepare()中直接返回缓存的响应
+
+举例::
+
+    from ancient.rig import register
+    from ancient.rig.responseCache import cached, invalidate
+
+    @register.route(version="v3")
+    class ArticleHandler(Base):
+
+        @cached(ttl=60, query=["page"], vary=["Accept-Language"], tags=["article"])
+        async def get(self):
+            self.write_array(await load_articles(self.get_argument("page", "1")))
+
+        async def post(self):
+            ...
+            invalidate("article")  # 所有带有article标签的缓存失效
+
+标签失效通过版本号实现，缓存键中包含标签当前的版本号，invalidate只需要更新版本号，
+旧的缓存条目不再被命中，并在ttl到期后被后端淘汰
+
+默认的MemoryBackend每个进程独立保存响应和标签版本，invalidate只对调用它的进程有效，
+多进程部署需要跨进程失效时使用MemcachedBackend
+
+"""
+from .localCache import MISSING, LocalCache
+
+from tornado.log import app_log
+
+import time
+import hashlib
+from inspect import isawaitable
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+KEY_PREFIX = "mad:resp:"
+TAG_PREFIX = "mad:tag:"
+# 不会被缓存和回放的响应头
+SKIP_HEADERS = ("Set-Cookie", "Date", "Server", "Content-Length", "Transfer-Encoding")
+
+_default_backend = None
+
+
+class MemoryBackend:
+    """
+
+    进程内LRU缓存后端，每个进程各自缓存，标签版本也保存在进程内，
+    因此invalidate只会使当前进程的缓存失效，其它工作进程的缓存要等到ttl到期
+
+    :param max_entries: 最多缓存的响应数量
+    :param max_bytes: 最多缓存的字节数
+
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.cache = LocalCache(max_entries, max_bytes, ttl=365 * 24 * 3600, negative_ttl=0)
+
+    def get_multi(self, keys: List[str]) -> Dict[str, Any]:
+        result = {}
+        for key in keys:
+            value = self.cache.get(key)
+            if value is not MISSING:
+                result[key] = value
+        return result
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        # ttl为0时LocalCache使用默认过期时间，即长期保存(用于标签版本)
+        self.cache.set(key, value, ttl)
+
+
+class MemcachedBackend:
+    """
+
+    memcached缓存后端，通过syncMemcached共享的客户端读写，多个进程共享缓存和标签版本
+
+    """
+
+    def __init__(self):
+        from ..module import syncMemcached
+        self.client = syncMemcached.get_client()
+
+    def get_multi(self, keys: List[str]) -> Dict[str, Any]:
+        return self.client.get_multi(keys)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.client.set(key, value, ttl)
+
+
+def get_default_backend():
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = MemoryBackend()
+    return _default_backend
+
+
+def set_default_backend(backend) -> None:
+    """
+
+    设置未指定backend的cached装饰器使用的缓存后端，后端需要实现get_multi(keys)和set(key, value, ttl)，
+    两个方法可以返回可等待对象
+
+    :param backend: 缓存后端，如MemcachedBackend()
+    :return: None
+
+    """
+    global _default_backend
+    _default_backend = backend
+
+
+async def _resolve(result):
+    if isawaitable(result):
+        return await result
+    return result
+
+
+def invalidate(*tags: str, backend=None):
+    """
+
+    使带有指定标签的缓存全部失效，使用MemoryBackend时只对当前进程有效
+
+    :param tags: 标签
+    :param backend: 缓存后端，默认为set_default_backend设置的后端
+    :return: 后端返回可等待对象时返回可等待对象，否则返回None
+
+    """
+    backend = backend or get_default_backend()
+    version = str(time.time())
+    results = [backend.set(TAG_PREFIX + tag, version, 0) for tag in tags]
+    awaitables = [r for r in results if isawaitable(r)]
+    if awaitables:
+        async def wait():
+            for r in awaitables:
+                await r
+
+        return wait()
+
+
+class ResponseCapture:
+    """
+
+    缓存未命中时记录handler通过公开方法写出的响应，finish()时保存到缓存后端
+
+    .. attribute:: operations
+
+        set_header，add_header，clear_header的调用记录，命中时按顺序重放
+
+    .. attribute:: chunks
+
+        write()写入的响应体
+
+    .. attribute:: cacheable
+
+        设置了cookie，调用了clear()或者在finish()之前flush()过的响应不缓存
+
+    """
+
+    def __init__(self, rule, key: str):
+        self.rule = rule
+        self.key = key
+        self.operations = []  # type: List[Tuple[str, str, Any]]
+        self.chunks = []  # type: List[bytes]
+        self.cacheable = True
+        self.finishing = False
+
+
+class CacheRule:
+    """
+
+    cached装饰器生成的缓存规则
+
+    :param ttl: 缓存时间，单位秒
+    :param query: 参与缓存键的query参数名称，None代表全部参数
+    :param vary: 参与缓存键的请求头名称
+    :param tags: 标签列表，元素可以是字符串或接收handler返回字符串的函数
+    :param backend: 缓存后端，None代表使用默认后端
+
+    """
+
+    def __init__(self, ttl: int, query: Optional[Iterable[str]], vary: Iterable[str],
+                 tags: Iterable[Union[str, Callable]], backend):
+        self.ttl = ttl
+        self.query = None if query is None else tuple(query)
+        self.vary = tuple(vary)
+        self.tags = tuple(tags)
+        self.backend = backend
+
+    def get_backend(self):
+        return self.backend or get_default_backend()
+
+    def tag_names(self, handler) -> List[str]:
+        return [tag(handler) if callable(tag) else tag for tag in self.tags]
+
+    async def key(self, handler) -> str:
+        """
+
+        根据请求方法，路径，选定的query参数，请求头和标签版本计算缓存键
+
+        :param handler: RequestHandler对象
+        :return: 缓存键
+
+        """
+        request = handler.request
+        arguments = request.query_arguments
+        names = sorted(arguments) if self.query is None else self.query
+        parts = [request.method, request.path]
+        for name in names:
+            parts.append("{}={}".format(name, b",".join(arguments.get(name, [])).decode("utf-8", "replace")))
+        for name in self.vary:
+            parts.append("{}:{}".format(name.lower(), request.headers.get(name, "")))
+        tags = self.tag_names(handler)
+        if tags:
+            keys = [TAG_PREFIX + tag for tag in tags]
+            versions = await _resolve(self.get_backend().get_multi(keys))
+            parts.extend("{}#{}".format(tag, versions.get(key, "0")) for tag, key in zip(tags, keys))
+        digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+        return KEY_PREFIX + digest
+
+    async def serve(self, handler) -> Optional[ResponseCapture]:
+        """
+
+        查找缓存，命中时通过finish()直接完成响应，未命中时返回用于记录响应的ResponseCapture
+
+        :param handler: RequestHandler对象
+        :return: 命中时为None，否则为ResponseCapture
+
+        """
+        key = await self.key(handler)
+        entry = (await _resolve(self.get_backend().get_multi([key]))).get(key)
+        if entry is None:
+            handler.set_header("X-Cache", "MISS")
+            return ResponseCapture(self, key)
+        status, operations, body = entry
+        handler.set_status(status)
+        for operation, name, value in operations:
+            if operation == "clear_header":
+                handler.clear_header(name)
+            else:
+                getattr(handler, operation)(name, value)
+        handler.set_header("X-Cache", "HIT")
+        # 缓存中保存了ETag，finish()不再计算响应体的哈希，也不再检查If-None-Match，需要在这里处理
+        if handler.check_etag_header():
+            handler.set_status(304)
+            handler.finish()
+        else:
+            handler.finish(body)
+        return None
+
+    async def store(self, capture: ResponseCapture, status: int) -> None:
+        """
+
+        保存记录的响应，只缓存200响应
+
+        :param capture: 未命中时serve返回的ResponseCapture
+        :param status: finish()之前的状态码，If-None-Match匹配时finish()会把200改为304
+        :return: None
+
+        """
+        if status != 200 or not capture.cacheable:
+            return
+        operations = [(operation, name, value) for operation, name, value in capture.operations
+                      if name not in SKIP_HEADERS]
+        entry = (200, operations, b"".join(capture.chunks))
+        try:
+            await _resolve(self.get_backend().set(capture.key, entry, self.ttl))
+        except Exception as e:
+            app_log.warning("response cache store failed: %s", e)
+
+
+def cached(ttl: int = 60, query: Iterable[str] = None, vary: Iterable[str] = (),
+           tags: Iterable[Union[str, Callable]] = (), backend=None):
+    """
+
+    ``装饰器`` 缓存handler方法(GET，HEAD)的响应，缓存内容为状态码，响应头和响应体
+
+    继承BaseHandler的handler在BaseHandler.prepare()中检查缓存，命中时直接finish()，被装饰的方法不会执行，
+    重写prepare()的handler需要先调用super().prepare()，响应头中X-Cache为HIT，未命中时为MISS
+
+    未命中时BaseHandler通过write()，set_header()等公开方法记录响应，在finish()时保存，
+    设置了cookie或者在finish()之前flush()过的响应不缓存
+
+    :param ttl: 缓存时间，单位秒
+    :param query: 参与缓存键的query参数名称列表，默认全部参数
+    :param vary: 参与缓存键的请求头名称列表，如["Accept-Language"]
+    :param tags: 标签列表，元素可以是字符串或接收handler返回字符串的函数，用于invalidate
+    :param backend: 缓存后端，默认使用set_default_backend设置的后端(进程内MemoryBackend)
+    :return: 装饰器
+
+    """
+    rule = CacheRule(ttl, query, vary, tags, backend)
+
+    def decorator(method):
+        method.cache_rule = rule
+        return method
+
+    return decorator
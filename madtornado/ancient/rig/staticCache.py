@@ -0,0 +1,382 @@
+"""
+
+staticCache模块在内存中缓存StaticHandler返回的小文件，缓存内容包括文件内容，ETag，修改时间和类型，
+命中时不需要打开，读取和哈希文件，由[tornado-static]的cache_bytes配置开启
+
+缓存的校验方式::
+
+    mtime: 每次命中时stat一次文件，修改时间或大小变化时重新读取
+    inotify: 通过fileWatch监听静态目录，文件变化时立即失效，命中时没有任何文件系统调用(仅Linux，其它平台使用mtime)
+
+开启spa_page的静态路由使用StaticIndex判断请求的是文件还是前端路由，前端路由直接返回缓存的SPA页面，
+不再先查找文件失败后再查找一次SPA页面
+
+"""
+from ..conf import parser
+from . import fileWatch
+
+import os
+import time
+import hashlib
+import datetime
+import collections
+from typing import Any, Dict, Optional, Tuple
+
+_static_cache = None  # type: Optional[StaticCache]
+_shell_cache = None  # type: Optional[StaticCache]
+_static_indexes = {}  # type: Dict[str, StaticIndex]
+
+
+class StaticEntry:
+    """
+
+    一个缓存的静态文件
+
+    :param path: 实际读取的文件路径，返回预压缩文件时为.br或.gz文件
+    :param content: 文件内容
+    :param stat: 文件的stat结果
+    :param content_type: Content-Type
+    :param encoding: 预压缩文件的Content-Encoding，普通文件为None
+
+    """
+
+    __slots__ = ("path", "content", "etag", "modified", "mtime", "size", "content_type", "encoding")
+
+    def __init__(self, path: str, content: bytes, stat: os.stat_result, content_type: str, encoding: str = None):
+        self.path = path
+        self.content = content
+        self.etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+        self.modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc)
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.content_type = content_type
+        self.encoding = encoding
+
+
+class StaticCache:
+    """
+
+    按总字节数限制的静态文件LRU缓存，只在IOLoop线程中使用，不加锁
+
+    缓存的key为(原文件绝对路径, 客户端接受的预压缩编码)，同一个文件的不同编码分别缓存
+
+    :param max_bytes: 缓存的总字节数
+    :param max_file: 单个文件的最大字节数，超过的文件不缓存
+    :param validate: 校验方式，mtime或inotify
+
+    """
+
+    def __init__(self, max_bytes: int, max_file: int, validate: str = "mtime"):
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.data = collections.OrderedDict()  # type: Dict[Tuple[str, Any], StaticEntry]
+        self.bytes = 0
+        self.watcher = None  # type: Optional[fileWatch.Watcher]
+        if validate == "inotify":
+            self.watcher = fileWatch.get_watcher()
+            if self.watcher is not None:
+                self.watcher.add_callback(self.on_change)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def watch(self, root: str) -> None:
+        """
+
+        开始监听静态目录，mtime校验方式下不做任何事情
+
+        :param root: 静态目录
+        :return: None
+
+        """
+        if self.watcher is not None:
+            self.watcher.watch(root)
+
+    def get(self, key: Tuple[str, Any]) -> Optional[StaticEntry]:
+        """
+
+        获取缓存的文件，mtime校验方式下文件变化时返回None
+
+        :param key: (原文件绝对路径, 编码)
+        :return: StaticEntry或None
+
+        """
+        entry = self.data.get(key)
+        if entry is not None and self.watcher is None:
+            try:
+                stat = os.stat(entry.path)
+                changed = stat.st_mtime_ns != entry.mtime or stat.st_size != entry.size
+            except OSError:
+                changed = True
+            if changed:
+                self.pop(key)
+                self.invalidations += 1
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key: Tuple[str, Any], entry: StaticEntry) -> None:
+        self.pop(key)
+        size = len(entry.content)
+        if size > self.max_file or size > self.max_bytes:
+            return
+        self.data[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.data.popitem(last=False)
+            self.bytes -= len(evicted.content)
+            self.evictions += 1
+
+    def pop(self, key: Tuple[str, Any]) -> None:
+        entry = self.data.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry.content)
+
+    def clear(self) -> None:
+        self.data.clear()
+        self.bytes = 0
+
+    def on_change(self, path: Optional[str], is_dir: bool) -> None:
+        """
+
+        fileWatch的回调，使变化的文件(包括预压缩文件对应的原文件)或目录下的所有文件失效
+
+        :param path: 变化的路径，None代表全部失效
+        :param is_dir: 是否为目录
+        :return: None
+
+        """
+        if path is None:
+            self.invalidations += len(self.data)
+            self.clear()
+            return
+        if is_dir:
+            prefix = path + os.sep
+            keys = [key for key in self.data if key[0] == path or key[0].startswith(prefix)]
+        else:
+            keys = [key for key in self.data if key[0] == path or self.data[key].path == path]
+        for key in keys:
+            self.pop(key)
+        self.invalidations += len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+
+        获取缓存统计信息
+
+        :return: 命中次数，未命中次数，命中率，失效次数，淘汰次数，条目数量，字节数，校验方式
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "entries": len(self.data),
+            "bytes": self.bytes,
+            "validate": "mtime" if self.watcher is None else "inotify",
+        }
+
+
+def get_static_cache() -> Optional[StaticCache]:
+    """
+
+    获取进程内共享的静态文件缓存，根据[tornado-static]配置创建，cache_bytes为0时返回None
+
+    :return: StaticCache或None
+
+    """
+    global _static_cache
+    if _static_cache is None:
+        option = parser.section("tornado-static")
+        if option["cache_bytes"] <= 0:
+            return None
+        _static_cache = StaticCache(option["cache_bytes"], option["cache_max_file"], option["cache_validate"])
+    return _static_cache
+
+
+def get_shell_cache() -> StaticCache:
+    """
+
+    获取缓存SPA页面的缓存，cache_bytes为0时SPA页面依然缓存在这里，开启静态文件缓存时与其共用
+
+    :return: StaticCache
+
+    """
+    global _shell_cache
+    cache = get_static_cache()
+    if cache is not None:
+        return cache
+    if _shell_cache is None:
+        option = parser.section("tornado-static")
+        max_file = option["cache_max_file"]
+        _shell_cache = StaticCache(max_file * 4, max_file, option["cache_validate"])
+    return _shell_cache
+
+
+class StaticIndex:
+    """
+
+    静态目录下所有文件和目录的相对路径集合，用一次集合查询判断请求的路径是否存在::
+
+        index = StaticIndex("statics/")
+        index.exists("js/app.js")  # True
+        index.exists("user/12/profile")  # False，交给SPA页面
+
+    路径使用"/"分隔，目录不包含结尾的"/"，根目录为""
+
+    校验方式::
+
+        mtime: 距离上次检查超过interval秒时stat所有目录，有目录的修改时间变化则重新扫描
+        inotify: 通过fileWatch监听静态目录，文件或目录增删时立即更新
+
+    索引只用于决定是否直接返回SPA页面，索引中存在但已经被删除的文件依然会经过查找失败后返回SPA页面的流程
+
+    :param root: 静态目录
+    :param validate: 校验方式，mtime或inotify
+    :param interval: mtime校验方式下两次检查的最小间隔秒数
+
+    """
+
+    def __init__(self, root: str, validate: str = "mtime", interval: float = 1.0):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.files = set()  # type: set[str]
+        self.dirs = set()  # type: set[str]
+        self.dir_mtimes = {}  # type: Dict[str, int]
+        self.checked = 0.0
+        self.scans = 0
+        self.watcher = None  # type: Optional[fileWatch.Watcher]
+        if validate == "inotify":
+            self.watcher = fileWatch.get_watcher()
+            if self.watcher is not None:
+                self.watcher.add_callback(self.on_change)
+                self.watcher.watch(self.root)
+        self.scan()
+
+    def relative(self, path: str) -> str:
+        rel = os.path.relpath(path, self.root)
+        if rel == ".":
+            return ""
+        return rel.replace(os.sep, "/")
+
+    def scan(self) -> None:
+        """
+
+        重新扫描整个静态目录
+
+        :return: None
+
+        """
+        files = set()
+        dirs = set()
+        dir_mtimes = {}
+        for dir_path, _, file_names in os.walk(self.root):
+            try:
+                dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            rel = self.relative(dir_path)
+            dirs.add(rel)
+            prefix = rel + "/" if rel else ""
+            for name in file_names:
+                files.add(prefix + name)
+        self.files = files
+        self.dirs = dirs
+        self.dir_mtimes = dir_mtimes
+        self.checked = time.monotonic()
+        self.scans += 1
+
+    def refresh(self) -> None:
+        """
+
+        mtime校验方式下检查目录的修改时间，间隔内或inotify校验方式下不做任何事情
+
+        :return: None
+
+        """
+        if self.watcher is not None:
+            return
+        now = time.monotonic()
+        if now - self.checked < self.interval:
+            return
+        self.checked = now
+        for dir_path, mtime in self.dir_mtimes.items():
+            try:
+                changed = os.stat(dir_path).st_mtime_ns != mtime
+            except OSError:
+                changed = True
+            if changed:
+                self.scan()
+                return
+
+    def exists(self, path: str) -> bool:
+        """
+
+        请求的路径是否为静态目录下的文件或目录
+
+        :param path: URL中的相对路径，如js/app.js或docs/
+        :return: bool
+
+        """
+        self.refresh()
+        return path in self.files or path.rstrip("/") in self.dirs
+
+    def on_change(self, path: Optional[str], is_dir: bool) -> None:
+        """
+
+        fileWatch的回调，根据路径当前是否存在加入或移出索引
+
+        :param path: 变化的路径，None代表需要重新扫描
+        :param is_dir: 是否为目录
+        :return: None
+
+        """
+        if path is None:
+            self.scan()
+            return
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return
+        rel = self.relative(path)
+        if not is_dir:
+            if os.path.isfile(path):
+                self.files.add(rel)
+            else:
+                self.files.discard(rel)
+            return
+        prefix = rel + "/" if rel else ""
+        self.files = {name for name in self.files if not name.startswith(prefix)}
+        self.dirs = {name for name in self.dirs if name != rel and not name.startswith(prefix)}
+        for dir_path, _, file_names in os.walk(path):
+            sub = self.relative(dir_path)
+            self.dirs.add(sub)
+            sub_prefix = sub + "/" if sub else ""
+            for name in file_names:
+                self.files.add(sub_prefix + name)
+
+
+def get_static_index(root: str) -> Optional[StaticIndex]:
+    """
+
+    获取静态目录的索引，每个目录在进程内共享一个，[tornado-static] spa_index为false时返回None
+
+    :param root: 静态目录
+    :return: StaticIndex或None
+
+    """
+    index = _static_indexes.get(root)
+    if index is None:
+        option = parser.section("tornado-static")
+        if not option["spa_index"]:
+            return None
+        index = StaticIndex(root, option["cache_validate"], option["spa_index_interval"])
+        _static_indexes[root] = index
+    return index
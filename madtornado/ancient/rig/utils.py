@@ -1,4 +1,4 @@
-from typing import List, Optional, Callable, TypeVar
+from typing import List, Callable, TypeVar
 import os
 import platform
 
@@ -13,13 +13,13 @@ def require(path, encoding="utf-8"):
     :return: dict
 
     """
-    import json
+    from . import jsonBackend
     fp = open(path, "r", encoding=encoding)
     data = fp.read()
     fp.close()
     try:
-        return json.loads(data)
-    except json.decoder.JSONDecodeError:
+        return jsonBackend.loads(data)
+    except ValueError:
         return {}
 
 
@@ -441,7 +441,7 @@ class TreeOperate:
         self.key = key
         self.pid = None
         self.data = {}
-        self.parent = None  # type: Optional[TreeOperate]
+        self.parent = None  # type: TreeOperate | None
         self.__children = []  # type: List[TreeOperate]
 
     def __str__(self):
@@ -176,6 +176,9 @@ class FreedomHandler(AbstractBaseHandler):
             else:
                 self.throw(404)
 
+        stat = os.stat(data_json_path)
+        if self.check_not_modified(stat.st_mtime, "{:x}-{:x}".format(stat.st_mtime_ns, stat.st_size)):
+            return
         self.write_dict(require(data_json_path))
 
     async def post(self, path):
@@ -1,7 +1,7 @@
 from ..handlers.inheritHandler import Base
 from ..rig import register
 from ..rig.utils import kill_form_port, require, rinin
-from ..conf import c_parser
+from ..conf import parser
 
 from tornado.log import app_log
 
@@ -18,7 +18,7 @@ webhook模块允许你通过配置文件注册webhook以运行指定脚本程序
 webhook = register.Router(prefix="/webhook")
 rf = register.rf
 
-GOGS_CONF_PATH = c_parser.get("tornado-webhook", "gogs")
+GOGS_CONF_PATH = parser.section("tornado-webhook")["gogs"]
 
 
 def exec_hook(name_conf):
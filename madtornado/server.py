@@ -4,16 +4,34 @@
 #   https://github.com/SystemLight/madtornado
 #
 # # # # # # # # # # #
+from tornado import gen
 from tornado.ioloop import IOLoop
+from tornado.log import app_log
 from tornado.web import Application
+from tornado.routing import AnyMatches
 from tornado.httpserver import HTTPServer
+from tornado.httputil import HTTPMessageDelegate
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, cpu_count
 from tornado.options import define, options
 
 import qrcode
 
 import os
-import json
+import sys
+import time
+import select
+import signal
+import weakref
+import subprocess
 from socket import gethostname, gethostbyname_ex
+from typing import Dict, List, Tuple
+
+# server.py的绝对路径，导入ancient时可能会切换工作目录，需要提前记录用于启动工作进程
+SERVER_PATH = os.path.abspath(__file__)
+# 工作进程编号和就绪通知管道的环境变量名称，由监管进程传递给工作进程
+WORKER_ENV = "MAD_WORKER"
+READY_FD_ENV = "MAD_READY_FD"
 
 try:
     import ancient
@@ -25,13 +43,339 @@ except FileNotFoundError:
 
 ancient.boot()
 
-opt = ancient.parser.options("tornado")
-opt_server = ancient.parser.options("tornado-server")
-opt_secret = ancient.parser.options("tornado-secret")
-opt_static = ancient.parser.options("tornado-static")
-opt_template = ancient.parser.options("tornado-template")
-opt_proxy = ancient.parser.options("tornado-proxy")
-opt_debug = ancient.parser.options("tornado-debug")
+opt = ancient.parser.section("tornado")
+opt_server = ancient.parser.section("tornado-server")
+opt_secret = ancient.parser.section("tornado-secret")
+opt_static = ancient.parser.section("tornado-static")
+opt_compress = ancient.parser.section("tornado-compress")
+opt_template = ancient.parser.section("tornado-template")
+opt_proxy = ancient.parser.section("tornado-proxy")
+opt_debug = ancient.parser.section("tornado-debug")
+
+
+class PendingDelegate(HTTPMessageDelegate):
+    """
+
+    包装find_handler返回的delegate，客户端在请求体读取完之前断开连接时，请求不会交给handler处理，
+    此时从处理中的请求中移除
+
+    :param requests: MadApplication.requests
+    :param request: 当前请求
+    :param delegate: 原本的delegate
+
+    """
+
+    def __init__(self, requests, request, delegate):
+        self.requests = requests
+        self.request = request
+        self.delegate = delegate
+
+    # @override
+    def headers_received(self, start_line, headers):
+        return self.delegate.headers_received(start_line, headers)
+
+    # @override
+    def data_received(self, chunk):
+        return self.delegate.data_received(chunk)
+
+    # @override
+    def finish(self):
+        return self.delegate.finish()
+
+    # @override
+    def on_connection_close(self):
+        self.requests.discard(self.request)
+        return self.delegate.on_connection_close()
+
+
+class MadApplication(Application):
+    """
+
+    记录处理中请求的Application，平滑重启时工作进程据此等待请求处理完成后再退出
+
+    请求在log_request(请求完成)或读取请求体时连接断开时移除，每个请求只会移除一次，
+    其它原因没有完成的请求(如finish时连接已经关闭)在请求对象被回收时自动从弱引用集合中移除
+
+    .. attribute:: requests
+
+        正在处理中的请求集合
+
+    .. attribute:: pending
+
+        正在处理中的请求数量
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MadApplication, self).__init__(*args, **kwargs)
+        self.requests = weakref.WeakSet()
+
+    @property
+    def pending(self):
+        return len(self.requests)
+
+    # @override
+    def find_handler(self, request, **kwargs):
+        self.requests.add(request)
+        delegate = super(MadApplication, self).find_handler(request, **kwargs)
+        return PendingDelegate(self.requests, request, delegate)
+
+    # @override
+    def log_request(self, handler):
+        self.requests.discard(handler.request)
+        super(MadApplication, self).log_request(handler)
+
+
+class Supervisor:
+    """
+
+    SO_REUSEPORT监管模式，每个工作进程独立绑定同一端口，由内核分发新连接
+
+    收到SIGHUP信号时启动新一代工作进程，待全部就绪后通知旧工作进程停止接收连接，
+    旧工作进程等待处理中的请求完成(最长drain_timeout秒)后退出，从而不中断服务地发布新代码::
+
+        kill -HUP 监管进程PID
+
+    意外退出的工作进程会被重新拉起，没有就绪或就绪后运行不足stable_time秒就退出的工作进程，
+    每次重新拉起之前的等待时间从restart_delay开始翻倍，最长restart_delay_max秒，
+    重新拉起的工作进程通过就绪通知管道确认开始监听后才被视为正常
+
+    :param workers: 工作进程数量
+    :param drain_timeout: 旧工作进程等待请求完成的最长时间，单位秒
+
+    """
+
+    # 新一代工作进程完成启动的最长等待时间，超时则放弃本次重启
+    ready_timeout = 60
+    # 旧工作进程超过drain_timeout后再等待的秒数，之后强制结束
+    kill_grace = 5
+    # 连续异常退出的工作进程重新拉起前的等待时间，单位秒，每次翻倍直到restart_delay_max
+    restart_delay = 1
+    restart_delay_max = 60
+    # 工作进程就绪后运行超过该秒数再退出时，视为正常运行过，立即重新拉起并重置等待时间
+    stable_time = 30
+
+    def __init__(self, workers, drain_timeout):
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.generation = []  # type: List[subprocess.Popen]
+        self.retiring = []  # type: List[Tuple[subprocess.Popen, float]]
+        self.reload_flag = False
+        self.stop_flag = False
+        # 以下按工作进程编号记录：连续异常退出次数，下次重新拉起的时间，尚未就绪的通知管道，就绪时间
+        self.failures = {}  # type: Dict[int, int]
+        self.restart_at = {}  # type: Dict[int, float]
+        self.starting = {}  # type: Dict[int, int]
+        self.ready_at = {}  # type: Dict[int, float]
+
+    def command(self, index):
+        """
+
+        工作进程的启动命令，工作进程编号和就绪通知管道通过环境变量传递
+
+        :param index: 工作进程编号
+        :return: 命令参数列表
+
+        """
+        return [sys.executable, SERVER_PATH] + sys.argv[1:]
+
+    def spawn(self, index):
+        """
+
+        启动一个工作进程，工作进程开始监听后通过管道通知监管进程
+
+        :param index: 工作进程编号
+        :return: (进程对象，就绪通知管道的读取端)
+
+        """
+        r, w = os.pipe()
+        env = dict(os.environ)
+        env[WORKER_ENV] = str(index)
+        env[READY_FD_ENV] = str(w)
+        proc = subprocess.Popen(self.command(index), env=env, pass_fds=(w,))
+        os.close(w)
+        return proc, r
+
+    def wait_ready(self, spawned):
+        """
+
+        等待一组工作进程全部就绪
+
+        :param spawned: spawn方法返回的列表
+        :return: 全部就绪返回True，有进程启动失败或超时返回False
+
+        """
+        pending = dict((r, proc) for proc, r in spawned)
+        deadline = time.time() + self.ready_timeout
+        ready = True
+        while pending and ready:
+            remain = deadline - time.time()
+            if remain <= 0:
+                ready = False
+                break
+            readable, _, _ = select.select(list(pending), [], [], remain)
+            for r in readable:
+                if not os.read(r, 1):
+                    # 管道被关闭但没有收到数据，说明工作进程在就绪前退出了
+                    ready = False
+                os.close(r)
+                pending.pop(r)
+        for r in pending:
+            os.close(r)
+        return ready
+
+    def retire(self, procs):
+        """
+
+        通知工作进程停止接收新连接，等待处理中的请求完成后退出
+
+        :param procs: 工作进程列表
+        :return: None
+
+        """
+        deadline = time.time() + self.drain_timeout + self.kill_grace
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+            self.retiring.append((proc, deadline))
+
+    def reload(self):
+        """
+
+        启动新一代工作进程替换当前的工作进程
+
+        :return: None
+
+        """
+        app_log.info("Reloading {} workers".format(self.workers))
+        spawned = [self.spawn(i) for i in range(self.workers)]
+        if not self.wait_ready(spawned):
+            app_log.error("New workers failed to start, reload aborted")
+            for proc, _ in spawned:
+                proc.kill()
+                proc.wait()
+            return
+        self.retire(self.generation)
+        self.adopt([proc for proc, _ in spawned])
+        app_log.info("Reload is successful")
+
+    def adopt(self, procs):
+        """
+
+        把一组已经就绪的工作进程作为当前一代，清除上一代的重启状态
+
+        :param procs: 工作进程列表
+        :return: None
+
+        """
+        for r in self.starting.values():
+            os.close(r)
+        self.starting.clear()
+        self.restart_at.clear()
+        self.failures.clear()
+        now = time.time()
+        self.ready_at = dict((index, now) for index in range(len(procs)))
+        self.generation = procs
+
+    def check_ready(self, index):
+        """
+
+        非阻塞地读取重新拉起的工作进程的就绪通知
+
+        :param index: 工作进程编号
+        :return: None
+
+        """
+        r = self.starting.get(index)
+        if r is None:
+            return
+        readable, _, _ = select.select([r], [], [], 0)
+        if not readable:
+            return
+        if os.read(r, 1):
+            self.ready_at[index] = time.time()
+            app_log.info("Worker {} (pid {}) is ready".format(index, self.generation[index].pid))
+        os.close(r)
+        del self.starting[index]
+
+    def restart(self, index):
+        """
+
+        处理意外退出的工作进程，按照连续异常退出的次数等待一段时间后重新拉起
+
+        :param index: 工作进程编号
+        :return: None
+
+        """
+        now = time.time()
+        if index not in self.restart_at:
+            proc = self.generation[index]
+            r = self.starting.pop(index, None)
+            if r is not None:
+                os.close(r)
+            ready_at = self.ready_at.pop(index, None)
+            if ready_at is not None and now - ready_at >= self.stable_time:
+                self.failures[index] = 0
+                delay = 0
+            else:
+                self.failures[index] = self.failures.get(index, 0) + 1
+                delay = min(self.restart_delay * 2 ** (self.failures[index] - 1), self.restart_delay_max)
+            self.restart_at[index] = now + delay
+            app_log.warning("Worker {} (pid {}) exited with code {}, restarting in {}s".format(
+                index, proc.pid, proc.returncode, delay))
+        if now >= self.restart_at[index]:
+            del self.restart_at[index]
+            self.generation[index], self.starting[index] = self.spawn(index)
+
+    def reap(self):
+        """
+
+        重新拉起意外退出的工作进程，回收已经退出的旧工作进程，强制结束超时未退出的旧工作进程
+
+        :return: None
+
+        """
+        for index, proc in enumerate(self.generation):
+            self.check_ready(index)
+            if proc.poll() is not None:
+                self.restart(index)
+        retiring = []
+        for proc, deadline in self.retiring:
+            if proc.poll() is None:
+                if time.time() > deadline:
+                    proc.kill()
+                retiring.append((proc, deadline))
+        self.retiring = retiring
+
+    def run(self):
+        """
+
+        启动工作进程并进入监管循环，直到收到SIGTERM或SIGINT信号
+
+        :return: None
+
+        """
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "reload_flag", True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, "stop_flag", True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, "stop_flag", True))
+
+        spawned = [self.spawn(i) for i in range(self.workers)]
+        self.wait_ready(spawned)
+        self.adopt([proc for proc, _ in spawned])
+        print("Supervisor (pid {}) started {} workers, send SIGHUP to reload".format(os.getpid(), self.workers))
+
+        while not self.stop_flag:
+            if self.reload_flag:
+                self.reload_flag = False
+                self.reload()
+            self.reap()
+            time.sleep(0.5)
+
+        self.retire(self.generation)
+        self.generation = []
+        while self.retiring:
+            self.reap()
+            time.sleep(0.1)
 
 
 def default_routers():
@@ -49,7 +393,7 @@ def default_routers():
     default_filename = opt_static["default_filename"]
     default_static_path = opt_static["default_static_path"]
     default_spa_page = opt_static["spa_page"]
-    for p in json.loads(opt_static["url_prefix"]):
+    for p in opt_static["url_prefix"]:
         path = None
         df = None
         spa = None
@@ -67,24 +411,28 @@ def default_routers():
             "path": path or default_static_path,
             "default_filename": df or default_filename,
             "spa_page": spa,
+            "precompressed": opt_compress["precompressed"],
         }))
     static_route = (r"/(.*)", ancient.dealHandler.StaticHandler, {
         "path": default_static_path,
         "default_filename": default_filename,
         "spa_page": default_spa_page,
+        "precompressed": opt_compress["precompressed"],
     })
 
     proxy_prefix = opt_proxy["proxy_prefix"]
-    proxy_handler = json.loads(opt_proxy["proxy_handler"])
+    proxy_handler = opt_proxy["proxy_handler"]
     proxy_routes = []
     for alias, address in proxy_handler:
         partner = filter(lambda x: x, [proxy_prefix, alias, r".*"])
-        address = address.rstrip("/")
+        # address为列表时代表一组负载均衡的后端
+        backends = [a.rstrip("/") for a in ([address] if isinstance(address, str) else address)]
         url = "/" + "/".join(partner)
-        host = address.split("://")[1]
+        host = backends[0].split("://")[1]
         proxy_routes.append(
             (url, ancient.dealHandler.ProxyHandler, {
-                "proxy_option": {"instead": url.rstrip("/.*"), "address": address, "host": host}
+                "proxy_option": {"instead": url.rstrip("/.*"), "address": backends[0], "host": host,
+                                 "upstream": alias, "backends": backends}
             }))
 
     return [pong_route, *proxy_routes, *static_routes, *ancient.end_register_route, static_route]
@@ -93,7 +441,7 @@ def default_routers():
 def routers():
     """
 
-    生成tornado的路由，将静态路由，和动态注册的路由合并
+    生成tornado的路由，将静态路由，和动态注册的路由合并，最终交给前缀树路由分发器Dispatcher进行匹配
 
     :return: List
 
@@ -107,20 +455,95 @@ def routers():
     return ancient.register_route
 
 
-def set_log():
+def set_log(worker=None):
     """
 
     配置tornado的日志函数，DEBUG < INFO < WARNING < ERROR < CRITICAL
 
+    多进程模式下每个子进程拥有独立的日志文件，如log/torStatus8095-0.log
+
+    :param worker: 子进程编号，单进程模式下为None
     :return: None
 
     """
+    if worker is None:
+        log_name = "log/torStatus{0}.log".format(options.port)
+    else:
+        log_name = "log/torStatus{0}-{1}.log".format(options.port, worker)
     options.logging = "DEBUG"
-    options.log_file_prefix = os.path.join(opt_debug["log_dir"], "log/torStatus{0}.log".format(options.port))
+    options.log_file_prefix = os.path.join(opt_debug["log_dir"], log_name)
     options.log_rotate_mode = "time"
     options.log_rotate_when = "D"
     options.log_rotate_interval = 1
-    print("Enable log files : {}".format("log/torStatus{0}.log".format(options.port)))
+    print("Enable log files : {}".format(log_name))
+
+
+def get_workers():
+    """
+
+    获取配置的工作进程数量，auto代表与CPU核心数一致
+
+    :return: int
+
+    """
+    workers = opt_server["workers"]
+    if workers == "auto":
+        return cpu_count()
+    return workers
+
+
+def create_server(app):
+    """
+
+    创建HTTP服务器，读取请求体的时间由body_timeout限制
+
+    :param app: Application
+    :return: HTTPServer
+
+    """
+    return HTTPServer(app, xheaders=opt_proxy["xheaders"],
+                      max_buffer_size=128 * 1024 * 1024, max_body_size=128 * 1024 * 1024,
+                      body_timeout=opt_server["body_timeout"] or None)
+
+
+def serve_worker(worker):
+    """
+
+    监管模式下的工作进程，以reuse_port方式绑定端口，收到SIGTERM后停止接收新连接，
+    等待处理中的请求完成或超过drain_timeout后退出
+
+    :param worker: 工作进程编号
+    :return: None
+
+    """
+    if opt_debug["open_log"]:
+        set_log(worker)
+    options.parse_command_line()
+    app = application()
+    sockets = bind_sockets(options.port, opt_server["listen"], reuse_port=True)
+    http_server = create_server(app)
+    http_server.add_sockets(sockets)
+    io_loop = IOLoop.current()
+
+    async def drain():
+        http_server.stop()
+        deadline = io_loop.time() + opt_server["drain_timeout"]
+        while app.pending > 0 and io_loop.time() < deadline:
+            await gen.sleep(0.1)
+        app_log.info("Worker {} drained, {} requests unfinished".format(worker, app.pending))
+        io_loop.stop()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: io_loop.add_callback_from_signal(drain))
+
+    ready_fd = os.environ.get(READY_FD_ENV)
+    if ready_fd:
+        try:
+            os.write(int(ready_fd), b"1")
+            os.close(int(ready_fd))
+        except OSError:
+            pass
+    print("Worker {} (pid {}) is ready".format(worker, os.getpid()))
+    io_loop.start()
 
 
 def print_qrcode(url):
@@ -173,27 +596,33 @@ def application():
         # "static_url_prefix": "/static",
         "template_path": opt_template["template_path"],
         "cookie_secret": opt_secret["cookie_secret"],
-        "xsrf_cookies": opt_secret["xsrf_cookies"] == "true",
+        "xsrf_cookies": opt_secret["xsrf_cookies"],
 
         "ui_methods": ancient.uiMethod,
         "ui_modules": ancient.uiModule.registered_class,
 
-        "debug": opt_debug["debug"] == "true",
-        "autoreload": opt_debug["autoreload"] == "true",
-        "compiled_template_cache": opt_debug["compiled_template_cache"] == "true",
-        "static_hash_cache": opt_debug["static_hash_cache"] == "true",
-        "serve_traceback": opt_debug["serve_traceback"] == "true",
+        "debug": opt_debug["debug"],
+        "autoreload": opt_debug["autoreload"],
+        "compiled_template_cache": opt_debug["compiled_template_cache"],
+        "static_hash_cache": opt_debug["static_hash_cache"],
+        "serve_traceback": opt_debug["serve_traceback"],
     }
     domain_name = opt_server["domain"]
+    transforms = [ancient.CompressTransform] if opt_compress["compress"] else None
+    app = MadApplication(handlers=None, transforms=transforms, **settings)
+    routes = routers()
+    dispatcher = ancient.Dispatcher(app, routes)
+    # 每个进程启动时创建代理上游，健康检查不必等到第一个请求
+    ancient.proxyClient.start_upstreams(route[2]["proxy_option"] for route in routes
+                                        if len(route) > 2 and "proxy_option" in route[2])
     if domain_name:
-        app = Application(handlers=None, **settings)
-        app.add_handlers(domain_name, routers())
+        app.add_handlers(domain_name, [(AnyMatches(), dispatcher)])
         print("Local access : [ http://127.0.0.1:{} ]".format(options.port))
         print("Remote access : [ http://{0}:{1} ]".format(domain_name, options.port))
     else:
-        app = Application(handlers=routers(), **settings)
+        app.wildcard_router.add_rules([(AnyMatches(), dispatcher)])
         print("Local access : [ http://127.0.0.1:{} ]".format(options.port))
-        network_index = int(opt_debug["network_index"])
+        network_index = opt_debug["network_index"]
         index = 0
         for ip in gethostbyname_ex(gethostname())[2]:
             index += 1
@@ -212,15 +641,42 @@ def main():
     :return: None
 
     """
-    define("port", default=int(opt_server["port"]), type=int, help="Run on the given port")
+    define("port", default=opt_server["port"], type=int, help="Run on the given port")
+    worker = os.environ.get(WORKER_ENV)
+    if worker is not None:
+        serve_worker(int(worker))
+        return
     print_info()
-    if opt_debug["open_log"] == "true":
-        set_log()
-    options.parse_command_line()
-    http_server = HTTPServer(application(), xheaders=opt_proxy["xheaders"],
-                             max_buffer_size=128 * 1024 * 1024, max_body_size=128 * 1024 * 1024)
-    http_server.bind(options.port, opt_server["listen"])
-    http_server.start(1)
+    workers = get_workers()
+    if opt_server["reuse_port"]:
+        # 监管模式：监管进程本身不处理请求，负责启动、重启和平滑替换工作进程
+        if opt_debug["open_log"]:
+            set_log()
+        options.parse_command_line()
+        Supervisor(workers, opt_server["drain_timeout"]).run()
+        return
+    if workers == 1:
+        if opt_debug["open_log"]:
+            set_log()
+        options.parse_command_line()
+        http_server = create_server(application())
+        http_server.bind(options.port, opt_server["listen"])
+        http_server.start(1)
+    else:
+        # 多进程模式：先在主进程绑定端口，再fork子进程共享监听套接字，子进程崩溃时由主进程重新拉起
+        if opt_debug["debug"] or opt_debug["autoreload"]:
+            # fork出的子进程不会自动重载，debug模式同时会开启autoreload
+            sys.exit("debug and autoreload require workers = 1")
+        options.parse_command_line(final=False)
+        sockets = bind_sockets(options.port, opt_server["listen"])
+        print("Fork {} worker processes".format(workers))
+        worker = fork_processes(workers, max_restarts=opt_server["max_restarts"])
+        if opt_debug["open_log"]:
+            set_log(worker)
+        options.run_parse_callbacks()
+        # 每个子进程创建自己的Application，缓存和上游客户端等进程内状态不在fork之前创建
+        http_server = create_server(application())
+        http_server.add_sockets(sockets)
     print("Site initialization is successful !")
     IOLoop.current().start()
 
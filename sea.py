@@ -1,5 +1,6 @@
 import os
 import re
+import gzip
 import tqdm
 import json
 import shutil
@@ -15,6 +16,10 @@ VERSION = "VERSION"
 BUILD_NAME = "madtornado-{}".format(VERSION)
 DOWNLOAD_URL = "DOWNLOAD_URL"
 
+# 预压缩的文件类型和最小文件大小，小文件压缩后收益不大
+PRECOMPRESS_SUFFIX = (".html", ".htm", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".xml", ".txt", ".wasm")
+PRECOMPRESS_MIN_SIZE = 1024
+
 U_NAME = None
 U_REPO = None
 CH_TOKEN = None
@@ -335,6 +340,10 @@ class Sea:
         get_group.add_argument("--get_clean", action="store_true", help="clear cache")
         get_group.add_argument("--get_where", action="store_true", help="get path for SEA")
         get_group.add_argument("--get_nginx", action="store_true", help="download nginx for your system")
+
+        build_group = self.arg_parse.add_argument_group("build")
+        build_group.add_argument("--build_precompress", nargs="?", const="statics", metavar="static path",
+                                 help="precompress static files to .gz/.br, default statics")
         return self.arg_parse.parse_args().__dict__
 
     def np(self, path):
@@ -590,6 +599,55 @@ class RouteHandler(Base):
     def get_where(arg):
         print(os.path.abspath(__file__))
 
+    def build_precompress(self, arg):
+        """
+
+        为静态目录下的文本类文件生成.gz和.br(需要pip install brotli)预压缩文件，
+        StaticHandler开启precompressed后直接返回预压缩文件，压缩后没有变小的文件不会生成
+
+        """
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+            print("brotli未安装，只生成.gz文件：pip install brotli")
+        root = os.path.join(self.user_abs_path, arg)
+        if not os.path.isdir(root):
+            print("不是一个有效路径")
+            return
+        total = 0
+        saved = 0
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                if not file_name.endswith(PRECOMPRESS_SUFFIX):
+                    continue
+                source = os.path.join(dir_path, file_name)
+                stat = os.stat(source)
+                if stat.st_size < PRECOMPRESS_MIN_SIZE:
+                    continue
+                with open(source, "rb") as fp:
+                    data = fp.read()
+                outputs = [(".gz", lambda: gzip.compress(data, 9))]
+                if brotli is not None:
+                    outputs.append((".br", lambda: brotli.compress(data, quality=11)))
+                for suffix, compress in outputs:
+                    target = source + suffix
+                    if os.path.isfile(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                        continue
+                    compressed = compress()
+                    if len(compressed) >= len(data):
+                        if os.path.isfile(target):
+                            os.remove(target)
+                        continue
+                    with open(target, "wb") as fp:
+                        fp.write(compressed)
+                    # 与源文件保持相同的修改时间，源文件更新后重新生成
+                    os.utime(target, (stat.st_atime, stat.st_mtime))
+                    total += 1
+                    saved += len(data) - len(compressed)
+                    print("precompress: " + target)
+        print("生成{}个预压缩文件，节省{}KB".format(total, saved // 1024))
+
     @staticmethod
     def get_clean(arg):
         ip = InitProject("./")
@@ -29,7 +29,13 @@ setup(
     long_description=long_description,
     download_url="https://github.com/SystemLight/madtornado/releases",
     install_requires=install_requires,
-    extras_require={},
+    # 可选依赖，未安装时对应功能自动降级：pip install madtornado[brotli]
+    extras_require={
+        "brotli": ["brotli>=1.0.9"],
+        "orjson": ["orjson>=3.0"],
+        "ujson": ["ujson>=4.0"],
+        "curl": ["pycurl>=7.43"],
+    },
     tests_require=[],
     setup_requires=[],
     dependency_links=[],
@@ -0,0 +1,114 @@
+"""
+
+BaseHandler.write_array_stream的测试：按chunk_rows分批写入和flush，JSON数组，NDJSON和异步批量数据源
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import json
+import datetime
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.testing import AsyncHTTPTestCase  # noqa: E402
+from tornado.web import Application  # noqa: E402
+
+from ancient.handlers.baseHandler import BaseHandler  # noqa: E402
+
+flushes = []
+produced = []
+
+
+def rows(count):
+    for i in range(count):
+        # 记录生成每一行时已经flush的次数，确认数据是边发送边读取的
+        produced.append(len(flushes))
+        yield {"id": i}
+
+
+async def batches(count, size):
+    for start in range(0, count, size):
+        yield [{"id": i} for i in range(start, min(start + size, count))]
+
+
+class StreamHandler(BaseHandler):
+
+    def initialize(self):
+        self.pending = []
+
+    # @override
+    def write(self, chunk):
+        self.pending.append(chunk)
+        super(StreamHandler, self).write(chunk)
+
+    # @override
+    def flush(self, include_footers=False):
+        flushes.append(b"".join(self.pending))
+        self.pending = []
+        return super(StreamHandler, self).flush(include_footers)
+
+    async def get(self, mode):
+        count = int(self.get_argument("count", "10"))
+        if mode == "array":
+            await self.write_array_stream(rows(count), chunk_rows=3)
+        elif mode == "ndjson":
+            await self.write_array_stream(rows(count), chunk_rows=4, ndjson=True)
+        elif mode == "batched":
+            await self.write_array_stream(batches(count, 4), chunk_rows=5, batched=True)
+        elif mode == "date":
+            await self.write_array_stream([{"at": datetime.datetime(2020, 1, 2, 3, 4)}], encode_date=True)
+
+
+class ArrayStreamTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/(\w+)", StreamHandler)])
+
+    def setUp(self):
+        super(ArrayStreamTest, self).setUp()
+        flushes.clear()
+        produced.clear()
+
+    def test_array_chunks(self):
+        response = self.fetch("/array")
+        self.assertEqual(response.headers["Content-Type"], "application/json; charset=UTF-8")
+        self.assertEqual(json.loads(response.body), [{"id": i} for i in range(10)])
+        # 每3行flush一次，最后不足3行的一批在结束前flush
+        self.assertEqual([chunk.count(b'"id"') for chunk in flushes], [3, 3, 3, 1, 0])
+        self.assertTrue(flushes[0].startswith(b"[{"))
+        self.assertTrue(flushes[1].startswith(b",{"))
+        self.assertEqual(produced, [0, 0, 0, 1, 1, 1, 2, 2, 2, 3])
+        self.assertNotIn("Content-Length", response.headers)
+
+    def test_empty(self):
+        response = self.fetch("/array?count=0")
+        self.assertEqual(response.body, b"[]")
+        self.assertEqual(len(flushes), 1)
+
+    def test_ndjson(self):
+        response = self.fetch("/ndjson")
+        self.assertEqual(response.headers["Content-Type"], "application/x-ndjson; charset=UTF-8")
+        lines = response.body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"id": i} for i in range(10)])
+        self.assertEqual([chunk.count(b"\n") for chunk in flushes], [4, 4, 2, 0])
+
+    def test_batched_async_source(self):
+        response = self.fetch("/batched?count=18")
+        self.assertEqual(json.loads(response.body), [{"id": i} for i in range(18)])
+        # 每批4行，累计达到5行时写出
+        self.assertEqual([chunk.count(b'"id"') for chunk in flushes], [8, 8, 2, 0])
+
+    def test_encode_date(self):
+        self.assertEqual(json.loads(self.fetch("/date").body), [{"at": "2020-01-02 03:04"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
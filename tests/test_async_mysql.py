@@ -0,0 +1,308 @@
+"""
+
+asyncMysql组件的测试，使用模拟tormysql连接的假连接池代替mysql服务器，
+假连接记录执行的语句，并按照autocommit设置维护SERVER_STATUS_IN_TRANS状态
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from pymysql.constants import SERVER_STATUS  # noqa: E402
+from tornado.testing import AsyncTestCase, gen_test  # noqa: E402
+
+from ancient.conf import parser, read_config, build_snapshot  # noqa: E402
+from ancient.rig.dbRoute import balancer  # noqa: E402
+
+try:
+    import tormysql
+    from ancient.module import asyncMysql
+except ImportError:
+    # tormysql未安装或与当前tornado版本不兼容
+    tormysql = asyncMysql = None
+
+IN_TRANS = SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+
+class FakeCursor:
+
+    def __init__(self, conn, cursor_cls):
+        self.conn = conn
+        self.cursor_cls = cursor_cls
+        self.rows = []
+        self.lastrowid = 0
+        self.closed = False
+
+    async def execute(self, sql, args=None):
+        self.conn.log.append(sql)
+        if self.conn.fail_on and self.conn.fail_on in sql:
+            raise ValueError("fail on {}".format(sql))
+        if not self.conn.autocommit:
+            self.conn.server_status |= IN_TRANS
+        self.rows = list(self.conn.rows) if sql.lower().startswith("select") else []
+        self.lastrowid += 1
+        return 1
+
+    async def executemany(self, sql, args):
+        return sum([await self.execute(sql, arg) for arg in args])
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.autocommit = pool.autocommit
+        self.rows = pool.rows
+        self.fail_on = None
+        self.server_status = 0
+        self.log = []
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, cursor_cls=None):
+        cursor = FakeCursor(self, cursor_cls)
+        self.cursors.append(cursor)
+        return cursor
+
+    async def begin(self):
+        self.log.append("BEGIN")
+        self.server_status |= IN_TRANS
+
+    async def commit(self):
+        self.log.append("COMMIT")
+        self.server_status &= ~IN_TRANS
+
+    async def rollback(self):
+        self.log.append("ROLLBACK")
+        self.server_status &= ~IN_TRANS
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePool:
+
+    def __init__(self, name, autocommit=True, rows=()):
+        self.name = name
+        self.autocommit = autocommit
+        self.rows = list(rows)
+        self.connections = []
+
+    async def Connection(self):
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+
+@unittest.skipIf(asyncMysql is None, "tormysql is not importable")
+class FakePoolTestCase(AsyncTestCase):
+    """
+    把asyncMysql.pools中的连接池替换为FakePool，测试结束后恢复
+    """
+
+    def setUp(self):
+        super(FakePoolTestCase, self).setUp()
+        self.saved_pools = dict(asyncMysql.pools)
+
+    def tearDown(self):
+        asyncMysql.pools.clear()
+        asyncMysql.pools.update(self.saved_pools)
+        super(FakePoolTestCase, self).tearDown()
+
+    def install(self, name="default", **kwargs):
+        pool = asyncMysql.pools[name] = FakePool(name, **kwargs)
+        return pool
+
+
+class ReadTest(FakePoolTestCase):
+
+    @gen_test
+    async def test_read_without_commit_in_autocommit(self):
+        pool = self.install(rows=[{"id": 1}])
+        async with asyncMysql.Component() as db:
+            self.assertEqual(await db.select_tcw("item"), [{"id": 1}])
+        conn = pool.connections[0]
+        self.assertEqual(conn.log, ["select * from item"])
+        self.assertTrue(conn.closed)
+
+    @gen_test
+    async def test_read_ends_implicit_transaction(self):
+        pool = self.install(autocommit=False, rows=[{"id": 1}])
+        async with asyncMysql.Component() as db:
+            await db.select_tcw("item")
+        # 关闭autocommit时查询会开启事务，需要提交结束读快照
+        self.assertEqual(pool.connections[0].log, ["select * from item", "COMMIT"])
+
+    @gen_test
+    async def test_iter_sql_batches(self):
+        pool = self.install(rows=[{"id": i} for i in range(2500)])
+        async with asyncMysql.Component() as db:
+            batches = [len(rows) async for rows in db.iter_sql("select id from item", batch_size=1000)]
+            self.assertIsNone(db.stream)
+        self.assertEqual(batches, [1000, 1000, 500])
+        stream_cursor = pool.connections[0].cursors[-1]
+        self.assertIs(stream_cursor.cursor_cls, tormysql.SSDictCursor)
+        self.assertTrue(stream_cursor.closed)
+
+    @gen_test
+    async def test_iter_sql_break_closes_cursor(self):
+        pool = self.install(autocommit=False, rows=[(i,) for i in range(10)])
+        async with asyncMysql.Component() as db:
+            db.set_return_dict(False)
+            async with db.iter_sql("select id from item", batch_size=3) as stream:
+                async for rows in stream:
+                    self.assertEqual(rows, [(0,), (1,), (2,)])
+                    break
+            self.assertIsNone(db.stream)
+        conn = pool.connections[0]
+        self.assertIs(conn.cursors[-1].cursor_cls, tormysql.SSCursor)
+        self.assertTrue(conn.cursors[-1].closed)
+        self.assertEqual(conn.log, ["select id from item", "COMMIT"])
+
+
+class TransactionTest(FakePoolTestCase):
+
+    def setUp(self):
+        super(TransactionTest, self).setUp()
+        self.pool = self.install()
+
+    @gen_test
+    async def test_single_commit(self):
+        async with asyncMysql.Component() as db:
+            async with db.transaction():
+                await db.insert_tc("item", {"id": 1})
+                await db.update_tcw("item", {"name": "a"}, "id=%s", [1])
+        self.assertEqual(self.pool.connections[0].log, [
+            "BEGIN", "insert into item(id) values(%s)", "update item set name=%s where id=%s", "COMMIT"])
+
+    @gen_test
+    async def test_rollback_on_error(self):
+        async with asyncMysql.Component() as db:
+            db.conn.fail_on = "update"
+            with self.assertRaises(ValueError):
+                # 工作单元中的语句失败时抛出异常，而不是返回status为False的结果
+                async with db.transaction():
+                    await db.insert_tc("item", {"id": 1})
+                    await db.update_tcw("item", {"name": "a"}, "id=%s", [1])
+            self.assertEqual(db.tx_depth, 0)
+        log = self.pool.connections[0].log
+        self.assertEqual(log[0], "BEGIN")
+        self.assertEqual(log[-1], "ROLLBACK")
+        self.assertNotIn("COMMIT", log)
+
+    @gen_test
+    async def test_nested_savepoint_release(self):
+        async with asyncMysql.Component() as db:
+            async with db.transaction():
+                await db.insert_tc("item", {"id": 1})
+                async with db.transaction():
+                    async with db.transaction():
+                        await db.delete_tw("cart", "uid=%s", [1])
+        self.assertEqual(self.pool.connections[0].log, [
+            "BEGIN", "insert into item(id) values(%s)", "SAVEPOINT mad_sp_1", "SAVEPOINT mad_sp_2",
+            "delete from cart where uid=%s", "RELEASE SAVEPOINT mad_sp_2", "RELEASE SAVEPOINT mad_sp_1", "COMMIT"])
+
+    @gen_test
+    async def test_nested_rollback_keeps_outer(self):
+        async with asyncMysql.Component() as db:
+            db.conn.fail_on = "delete"
+            async with db.transaction():
+                await db.insert_tc("item", {"id": 1})
+                try:
+                    async with db.transaction():
+                        await db.delete_tw("cart", "uid=%s", [1])
+                except ValueError:
+                    pass
+                await db.insert_tc("item", {"id": 2})
+        self.assertEqual(self.pool.connections[0].log, [
+            "BEGIN", "insert into item(id) values(%s)", "SAVEPOINT mad_sp_1", "delete from cart where uid=%s",
+            "ROLLBACK TO SAVEPOINT mad_sp_1", "insert into item(id) values(%s)", "COMMIT"])
+
+    @gen_test
+    async def test_off_rolls_back_open_transaction(self):
+        db = asyncMysql.Component()
+        await db.on()
+        await db.transaction().__aenter__()
+        await db.insert_tc("item", {"id": 1})
+        await db.off()
+        conn = self.pool.connections[0]
+        self.assertEqual(conn.log[-1], "ROLLBACK")
+        self.assertTrue(conn.closed)
+        self.assertEqual(db.tx_depth, 0)
+
+
+class RoutingTest(FakePoolTestCase):
+
+    def setUp(self):
+        super(RoutingTest, self).setUp()
+        self.saved_config = parser.config
+        parser.config = build_snapshot(read_config(environ={
+            "MAD_DB__PRIMARY": "primary",
+            "MAD_DB__REPLICAS": '["replica1", "replica2"]',
+            "MAD_DB_3A_PRIMARY__HOST": "10.0.0.1",
+            "MAD_DB_3A_REPLICA1__HOST": "10.0.0.2",
+            "MAD_DB_3A_REPLICA2__HOST": "10.0.0.3",
+        }))
+        self.pools = dict((name, self.install(name, rows=[{"db": name}]))
+                          for name in ("primary", "replica1", "replica2"))
+
+    def tearDown(self):
+        parser.config = self.saved_config
+        super(RoutingTest, self).tearDown()
+
+    @gen_test
+    async def test_read_replica_write_primary(self):
+        async with asyncMysql.Component() as db:
+            # 读写分离时连接在第一次使用时才获取
+            self.assertIsNone(db.conn)
+            first = (await db.output_sql("select 1"))[0]["db"]
+            self.assertEqual((await db.output_sql("select 1"))[0]["db"], first)
+            self.assertTrue((await db.insert_tc("item", {"id": 1})).status)
+            self.assertEqual(db.conn_name, "primary")
+        async with asyncMysql.Component() as db:
+            second = (await db.output_sql("select 1"))[0]["db"]
+        self.assertEqual({first, second}, {"replica1", "replica2"})
+        self.assertEqual(sum(balancer.busy.values()), 0)
+        self.assertTrue(all(conn.closed for pool in self.pools.values() for conn in pool.connections))
+
+    @gen_test
+    async def test_using_pins_database(self):
+        async with asyncMysql.Component(using="replica2") as db:
+            self.assertEqual((await db.output_sql("select 1"))[0]["db"], "replica2")
+            await db.insert_tc("item", {"id": 1})
+        self.assertEqual(len(self.pools["replica2"].connections), 1)
+        self.assertEqual(self.pools["primary"].connections, [])
+
+    @gen_test
+    async def test_read_in_transaction_uses_primary(self):
+        async with asyncMysql.Component() as db:
+            async with db.transaction():
+                await db.insert_tc("item", {"id": 1})
+                self.assertEqual((await db.output_sql("select 1"))[0]["db"], "primary")
+            self.assertIsNone(db.read_conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
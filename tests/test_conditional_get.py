@@ -0,0 +1,100 @@
+"""
+
+BaseHandler条件请求的测试：根据响应体计算的ETag，check_not_modified的ETag和Last-Modified校验
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.httputil import format_timestamp  # noqa: E402
+from tornado.testing import AsyncHTTPTestCase  # noqa: E402
+from tornado.web import Application  # noqa: E402
+
+from ancient.handlers.baseHandler import BaseHandler  # noqa: E402
+
+MODIFIED = 1600000000
+loads = []
+
+
+class BodyHandler(BaseHandler):
+
+    def get(self):
+        self.write_dict({"id": 1, "name": "文本"})
+
+    def post(self):
+        self.write_dict({"id": 1})
+
+
+class VersionHandler(BaseHandler):
+
+    def get(self):
+        if self.check_not_modified(MODIFIED, "v1"):
+            return
+        loads.append(self.request.uri)
+        self.write_dict({"version": 1})
+
+
+class ConditionalGetTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/body", BodyHandler), (r"/version", VersionHandler)])
+
+    def setUp(self):
+        super(ConditionalGetTest, self).setUp()
+        loads.clear()
+
+    def test_body_etag(self):
+        response = self.fetch("/body")
+        etag = response.headers["Etag"]
+        self.assertEqual(response.code, 200)
+        response = self.fetch("/body", headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b"")
+        self.assertEqual(response.headers["Etag"], etag)
+        self.assertEqual(self.fetch("/body", headers={"If-None-Match": '"other"'}).code, 200)
+
+    def test_body_etag_only_for_get(self):
+        response = self.fetch("/body", method="POST", body="", headers={"If-None-Match": "*"})
+        self.assertEqual(response.code, 200)
+        self.assertNotIn("Etag", response.headers)
+
+    def test_version_etag(self):
+        response = self.fetch("/version")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Etag"], '"v1"')
+        self.assertEqual(response.headers["Last-Modified"], format_timestamp(MODIFIED))
+        response = self.fetch("/version", headers={"If-None-Match": '"v1"'})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.headers["Etag"], '"v1"')
+        # 304时不再读取数据
+        self.assertEqual(loads, ["/version"])
+        self.assertEqual(self.fetch("/version", headers={"If-None-Match": 'W/"v1", "v2"'}).code, 304)
+        self.assertEqual(self.fetch("/version", headers={"If-None-Match": '"v0"'}).code, 200)
+
+    def test_if_modified_since(self):
+        self.assertEqual(self.fetch("/version", headers={"If-Modified-Since": format_timestamp(MODIFIED)}).code, 304)
+        self.assertEqual(self.fetch("/version", headers={"If-Modified-Since": format_timestamp(MODIFIED + 60)}).code,
+                         304)
+        self.assertEqual(self.fetch("/version", headers={"If-Modified-Since": format_timestamp(MODIFIED - 60)}).code,
+                         200)
+        self.assertEqual(self.fetch("/version", headers={"If-Modified-Since": "not a date"}).code, 200)
+
+    def test_if_none_match_takes_precedence(self):
+        response = self.fetch("/version", headers={"If-None-Match": '"v0"',
+                                                   "If-Modified-Since": format_timestamp(MODIFIED)})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(loads), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
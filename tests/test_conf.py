@@ -0,0 +1,38 @@
+"""
+
+conf模块环境变量覆盖的回归测试
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from ancient.conf import read_config  # noqa: E402
+
+
+class EnvOverrideTest(unittest.TestCase):
+
+    def test_dash_in_section(self):
+        raw = read_config(environ={"MAD_TORNADO_SERVER__DRAIN_TIMEOUT": "7"})
+        self.assertEqual(raw.get("tornado-server", "drain_timeout"), "7")
+
+    def test_colon_in_section(self):
+        raw = read_config(environ={"MAD_DB_3A_REPLICA1__HOST": "10.0.0.2"})
+        self.assertEqual(raw.get("db:replica1", "host"), "10.0.0.2")
+
+    def test_underscore_in_section(self):
+        raw = read_config(environ={"MAD_DB_3A_ORDER_5F_DB__HOST": "10.0.0.3"})
+        self.assertEqual(raw.get("db:order_db", "host"), "10.0.0.3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+
+dbRoute读写分离的测试：查询数据库的选择策略，syncMysql查询发往从库，写入和事务中的查询发往主库
+
+syncMysql的连接池使用记录语句的假连接，测试期间替换[db]配置快照
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from pymysql.constants import SERVER_STATUS  # noqa: E402
+
+from ancient.conf import parser, read_config, build_snapshot  # noqa: E402
+from ancient.module import syncMysql  # noqa: E402
+from ancient.rig.dbRoute import Balancer, balancer  # noqa: E402
+
+REPLICATED = {
+    "MAD_DB__PRIMARY": "primary",
+    "MAD_DB__REPLICAS": '["replica1", "replica2"]',
+    "MAD_DB_3A_PRIMARY__HOST": "10.0.0.1",
+    "MAD_DB_3A_REPLICA1__HOST": "10.0.0.2",
+    "MAD_DB_3A_REPLICA2__HOST": "10.0.0.3",
+}
+
+
+def use_config(environ):
+    parser.config = build_snapshot(read_config(environ=environ))
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = 0
+
+    def execute(self, sql, args=None):
+        self.conn.log.append(sql)
+        if sql.startswith("select"):
+            # 关闭autocommit时查询同样会开启事务
+            self.conn.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        return 1
+
+    def fetchall(self):
+        return [{"db": self.conn.name}]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, name):
+        self.name = name
+        self.open = True
+        self.server_status = 0
+        self.log = []
+
+    def cursor(self, cursor_cls=None):
+        return FakeCursor(self)
+
+    def begin(self):
+        self.log.append("BEGIN")
+        self.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def commit(self):
+        self.log.append("COMMIT")
+        self.server_status &= ~SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+        self.server_status &= ~SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def close(self):
+        self.open = False
+
+
+class ConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_config = parser.config
+
+    def tearDown(self):
+        parser.config = self.saved_config
+
+
+class BalancerTest(ConfigTestCase):
+
+    def test_without_replicas(self):
+        use_config({})
+        self.assertFalse(Balancer.has_replicas())
+        self.assertEqual(Balancer().replica(), "default")
+
+    def test_round_robin(self):
+        use_config(REPLICATED)
+        b = Balancer()
+        self.assertEqual(b.primary(), "primary")
+        self.assertEqual([b.replica() for _ in range(4)], ["replica1", "replica2", "replica1", "replica2"])
+
+    def test_least_busy(self):
+        use_config(dict(REPLICATED, MAD_DB__READ_POLICY="least_busy"))
+        b = Balancer()
+        b.acquire("replica1")
+        self.assertEqual([b.replica() for _ in range(3)], ["replica2"] * 3)
+        b.acquire("replica2")
+        # 占用相同时按轮询顺序选择
+        self.assertEqual(sorted(b.replica() for _ in range(2)), ["replica1", "replica2"])
+
+
+class SyncRoutingTest(ConfigTestCase):
+
+    def setUp(self):
+        super(SyncRoutingTest, self).setUp()
+        use_config(REPLICATED)
+        self.saved_pools = dict(syncMysql._pools)
+        self.connections = []
+        for name in ("primary", "replica1", "replica2"):
+            syncMysql._pools[name] = syncMysql.ConnectionPool(lambda name=name: self.create(name))
+
+    def tearDown(self):
+        syncMysql._pools.clear()
+        syncMysql._pools.update(self.saved_pools)
+        super(SyncRoutingTest, self).tearDown()
+
+    def create(self, name):
+        conn = FakeConnection(name)
+        self.connections.append(conn)
+        return conn
+
+    def test_read_replica_write_primary(self):
+        with syncMysql.Component() as db:
+            read = db.output_sql("select 1")[0]["db"]
+            self.assertIn(read, ("replica1", "replica2"))
+            self.assertTrue(db.input_sql("insert into item values(1)").status)
+            self.assertEqual(db.conn_name, "primary")
+        self.assertEqual(sum(balancer.busy.values()), 0)
+
+    def test_using_pins_database(self):
+        with syncMysql.Component(using="replica2") as db:
+            self.assertEqual(db.output_sql("select 1")[0]["db"], "replica2")
+            db.input_sql("insert into item values(1)")
+            self.assertEqual(db.conn_name, "replica2")
+        self.assertEqual([conn.name for conn in self.connections], ["replica2"])
+
+    def test_read_in_primary_transaction(self):
+        with syncMysql.Component() as db:
+            conn, _ = db.writer()
+            conn.begin()
+            # 主库连接处于事务中时查询使用主库，能读到未提交的修改
+            self.assertEqual(db.output_sql("select 1")[0]["db"], "primary")
+            self.assertIsNone(db.read_conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
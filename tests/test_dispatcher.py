@@ -0,0 +1,116 @@
+"""
+
+Dispatcher前缀树路由的测试：纯文本路由，前缀树路由，无文本前缀的兜底路由，注册顺序和reverse_url
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.routing import AnyMatches  # noqa: E402
+from tornado.testing import AsyncHTTPTestCase  # noqa: E402
+from tornado.web import Application, RequestHandler, url  # noqa: E402
+
+from ancient.rig.dispatcher import Dispatcher, literal_prefix  # noqa: E402
+
+
+class NameHandler(RequestHandler):
+
+    def initialize(self, name):
+        self.name = name
+
+    def get(self, *args):
+        self.write("{}:{}".format(self.name, ",".join(arg or "" for arg in args)))
+
+
+ROUTES = [
+    url(r"/v3/recp$", NameHandler, {"name": "exact"}, name="recp"),
+    url(r"/v3/recp$", NameHandler, {"name": "shadowed"}),
+    url(r"/v3/item/(\d+)$", NameHandler, {"name": "item"}, name="item"),
+    url(r"/zoos(?:/([^/]*))?$", NameHandler, {"name": "zoos"}, name="zoos"),
+    url(r"/zoo/(\w+)$", NameHandler, {"name": "zoo"}),
+    url(r"/v3/(\w+)/raw$", NameHandler, {"name": "v3-raw"}),
+    url(r"/(\w+)/raw$", NameHandler, {"name": "raw"}),
+    (r"/nested/.*", [
+        (r"/nested/(\w+)$", NameHandler, {"name": "nested"}),
+    ]),
+]
+
+
+class LiteralPrefixTest(unittest.TestCase):
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix(r"/v3/recp$"), ("/v3/recp", True))
+        self.assertEqual(literal_prefix(r"/zoos(?:/([^\/]*))?$"), ("/zoos", False))
+        self.assertEqual(literal_prefix(r"/a\.b$"), ("/a.b", True))
+        self.assertEqual(literal_prefix(r"/items?$"), ("/item", False))
+        self.assertEqual(literal_prefix(r"/a|/b"), ("", False))
+
+
+class CandidatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(Application(), ROUTES)
+
+    def names(self, path):
+        return [rule.target_kwargs.get("name") for _, rule, _ in self.dispatcher.candidates(path)
+                if rule.target_kwargs]
+
+    def test_partial_segment_not_scanned_for_other_paths(self):
+        # /zoos挂在根节点z桶，不再对所有请求做正则匹配
+        self.assertNotIn("zoos", self.names("/v3/item/1"))
+        self.assertNotIn("zoos", self.names("/apple"))
+        self.assertIn("zoos", self.names("/zoos"))
+        self.assertIn("zoos", self.names("/zoos/1"))
+        self.assertNotIn("zoo", self.names("/zoos/1"))
+
+    def test_registration_order(self):
+        self.assertEqual(self.names("/v3/recp"), ["exact", "v3-raw", "raw"])
+
+
+class DispatcherTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        app = Application()
+        app.wildcard_router.add_rules([(AnyMatches(), Dispatcher(app, ROUTES))])
+        return app
+
+    def assertRoute(self, path, body):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, body)
+
+    def test_exact(self):
+        self.assertRoute("/v3/recp", b"exact:")
+
+    def test_trie(self):
+        self.assertRoute("/v3/item/7", b"item:7")
+        self.assertRoute("/zoos", b"zoos:")
+        self.assertRoute("/zoos/7", b"zoos:7")
+        self.assertRoute("/zoo/lion", b"zoo:lion")
+        self.assertRoute("/nested/x", b"nested:x")
+
+    def test_fallback(self):
+        # 正则开头的路由没有文本前缀，挂在根节点对所有请求尝试
+        self.assertRoute("/v3/abc/raw", b"v3-raw:abc")
+        self.assertRoute("/abc/raw", b"raw:abc")
+        self.assertEqual(self.fetch("/zoosx/1").code, 404)
+        self.assertEqual(self.fetch("/v3/item/x").code, 404)
+
+    def test_reverse_url(self):
+        app = self.get_app()
+        self.assertEqual(app.reverse_url("recp"), "/v3/recp")
+        self.assertEqual(app.reverse_url("item", 42), "/v3/item/42")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+
+genSQL的测试：多行插入按语句大小和参数数量拆分，sql模板缓存的命中统计和LRU淘汰
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import sqlite3
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from ancient.rig import genSQL  # noqa: E402
+from ancient.module.syncSqlite import execute_bulk  # noqa: E402
+
+
+class InsertBulkTest(unittest.TestCase):
+
+    def test_single_statement(self):
+        self.assertEqual(list(genSQL.insert_bulk("table", [[1, "a"], [2, "b"]])),
+                         [("insert into table values(%s,%s),(%s,%s)", [1, "a", 2, "b"], 2)])
+
+    def test_dict_rows_with_update(self):
+        rows = ({"id": i, "name": "n"} for i in range(2))
+        self.assertEqual(list(genSQL.insert_bulk("table", rows, update=True)), [(
+            "insert into table(id,name) values(%s,%s),(%s,%s) on duplicate key update "
+            "id = values(id),name = values(name)", [0, "n", 1, "n"], 2)])
+
+    def test_split_by_max_args(self):
+        rows = [[i, i, i] for i in range(10)]
+        statements = list(genSQL.insert_bulk("t", rows, ph="?", max_args=7))
+        # 每行3个参数，每条语句最多2行
+        self.assertEqual([count for _, _, count in statements], [2, 2, 2, 2, 2])
+        self.assertTrue(all(len(args) <= 7 for _, args, _ in statements))
+        self.assertEqual(statements[0][0], "insert into t values(?,?,?),(?,?,?)")
+        self.assertEqual(sum((args for _, args, _ in statements), []), [v for row in rows for v in row])
+
+    def test_split_by_max_packet(self):
+        max_packet = 4096
+        rows = [[i, "x" * 100] for i in range(200)]
+        statements = list(genSQL.insert_bulk("t", rows, max_packet=max_packet))
+        self.assertGreater(len(statements), 1)
+        self.assertEqual(sum(count for _, _, count in statements), len(rows))
+        for sql, args, count in statements:
+            # 语句加上转义后的参数不超过max_packet
+            self.assertLessEqual(len(sql) + sum(len(str(value)) + 3 for value in args), max_packet)
+            self.assertEqual(len(args), count * 2)
+
+    def test_oversized_row_alone(self):
+        rows = [[1, "a"], [2, "x" * 5000], [3, "b"]]
+        statements = list(genSQL.insert_bulk("t", rows, max_packet=4096))
+        self.assertEqual([count for _, _, count in statements], [1, 1, 1])
+
+    def test_lazy_generator(self):
+        consumed = []
+
+        def rows():
+            for i in range(1000):
+                consumed.append(i)
+                yield [i]
+
+        statements = genSQL.insert_bulk("t", rows(), max_args=100)
+        self.assertEqual(next(statements)[2], 100)
+        # 产出第一条语句时只读取了下一条语句的第一行
+        self.assertEqual(len(consumed), 101)
+
+    def test_row_width_mismatch(self):
+        with self.assertRaises(ValueError):
+            list(genSQL.insert_bulk("t", [[1, 2], [3]]))
+        with self.assertRaises(TypeError):
+            list(genSQL.insert_bulk("t", [1, 2]))
+
+    def test_execute_in_sqlite(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("create table t (id integer primary key, a, b, c)")
+        rows = ({"id": i, "a": i, "b": "b", "c": None} for i in range(20000))
+        br = execute_bulk(conn, "t", rows)
+        self.assertEqual(br.rows, 20000)
+        self.assertGreater(br.statements, 1)
+        self.assertEqual(conn.execute("select count(*), max(id) from t").fetchone(), (20000, 19999))
+        conn.close()
+
+
+class SQLCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        genSQL.sql_cache.clear()
+
+    def tearDown(self):
+        genSQL.sql_cache.clear()
+
+    def test_stats(self):
+        sql = "update t set name=%s where id=%s"
+        self.assertEqual(genSQL.update_tcw("t", {"name": "a"}, "id=%s", [1]), (sql, ["a", 1]))
+        # 参数值不参与缓存键，相同结构的语句命中缓存
+        self.assertEqual(genSQL.update_tcw("t", {"name": "b"}, "id=%s", [2]), (sql, ["b", 2]))
+        genSQL.select_tcw("t", ["id"], "id=%s")
+        genSQL.select_tcw("t", ("id",), "id=%s")
+        genSQL.insert_tc("t", {"id": 1, "name": "a"})
+        genSQL.insert_tc("t", {"name": "a", "id": 1})
+        self.assertEqual(genSQL.sql_cache.stats(),
+                         {"hits": 2, "misses": 4, "size": 4, "maxsize": genSQL.SQL_CACHE_SIZE})
+        genSQL.sql_cache.clear()
+        self.assertEqual(genSQL.sql_cache.stats()["hits"], 0)
+        self.assertEqual(genSQL.sql_cache.stats()["size"], 0)
+
+    def test_lru_eviction(self):
+        cache = genSQL.SQLCache(maxsize=2)
+        builds = []
+
+        def build(name):
+            return lambda: builds.append(name) or name
+
+        cache.get("a", build("a"))
+        cache.get("b", build("b"))
+        cache.get("a", build("a"))
+        cache.get("c", build("c"))
+        # b最久未使用，被淘汰
+        self.assertEqual(list(cache.data), ["a", "c"])
+        self.assertEqual(cache.get("b", build("b")), "b")
+        self.assertEqual(builds, ["a", "b", "c", "b"])
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 4, "size": 2, "maxsize": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
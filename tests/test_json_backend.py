@@ -0,0 +1,67 @@
+"""
+
+jsonBackend各个后端的输出一致性测试，没有安装的后端跳过
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import json
+import datetime
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from ancient.rig import jsonBackend  # noqa: E402
+
+DATA = {
+    "datetime": datetime.datetime(2020, 1, 2, 3, 4, 5, 678),
+    "aware": datetime.datetime(2020, 1, 2, 3, 4, tzinfo=datetime.timezone.utc),
+    "date": datetime.date(2020, 1, 2),
+    "text": "中文/text",
+    "number": [1, 1.5, None, True],
+}
+
+EXPECTED = {
+    "datetime": "2020-01-02 03:04",
+    "aware": "2020-01-02 03:04",
+    "date": "2020-01-02",
+    "text": "中文/text",
+    "number": [1, 1.5, None, True],
+}
+
+
+class BackendTest(unittest.TestCase):
+
+    def check(self, name):
+        try:
+            backend = jsonBackend.load_backend(name)
+        except ImportError:
+            self.skipTest("{} is not installed".format(name))
+        for encode_date in (False, True):
+            self.assertEqual(json.loads(backend["dumps"](DATA, encode_date)), EXPECTED)
+            self.assertEqual(json.loads(backend["dumpb"](DATA, encode_date)), EXPECTED)
+        self.assertEqual(backend["loads"](b'{"a": [1, "\\u4e2d"]}'), {"a": [1, "中"]})
+        with self.assertRaises(TypeError):
+            backend["dumps"]({"time": datetime.time(1, 2)}, True)
+        with self.assertRaises(ValueError):
+            backend["loads"]("{bad")
+
+    def test_stdlib(self):
+        self.check("stdlib")
+
+    def test_orjson(self):
+        self.check("orjson")
+
+    def test_ujson(self):
+        self.check("ujson")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+
+asyncMemcached和syncMemcached的测试，使用进程内的MemoryServer代替memcached
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import asyncio
+import datetime
+import threading
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.ioloop import IOLoop  # noqa: E402
+from tornado.netutil import bind_sockets  # noqa: E402
+from tornado.testing import AsyncTestCase, gen_test  # noqa: E402
+
+from ancient.module.asyncMemcached import Client, MemoryServer  # noqa: E402
+from ancient.module.syncMemcached import RingClient  # noqa: E402
+
+VALUES = {
+    "str": "文本",
+    "bytes": b"\x00\x01raw",
+    "int": 42,
+    "dict": {"id": 1, "tags": ["a", "b"]},
+    "datetime": datetime.datetime(2020, 1, 2, 3, 4, 5),
+}
+
+
+def start_server():
+    sockets = bind_sockets(0, "127.0.0.1")
+    server = MemoryServer()
+    server.add_sockets(sockets)
+    return server, "127.0.0.1:{}".format(sockets[0].getsockname()[1])
+
+
+class ServerThread(threading.Thread):
+    """
+    在独立线程的IOLoop中运行MemoryServer，同步客户端阻塞调用时服务器依然可以响应
+    """
+
+    def __init__(self):
+        super(ServerThread, self).__init__(daemon=True)
+        self.ready = threading.Event()
+        self.server = self.address = self.io_loop = None
+
+    def run(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.io_loop = IOLoop.current()
+        self.server, self.address = start_server()
+        self.ready.set()
+        self.io_loop.start()
+
+    def stop(self):
+        self.io_loop.add_callback(self.server.stop)
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.join()
+
+
+class AsyncClientTest(AsyncTestCase):
+
+    def setUp(self):
+        super(AsyncClientTest, self).setUp()
+        self.first, first_address = start_server()
+        self.second, second_address = start_server()
+        self.addresses = [first_address, second_address]
+        self.client = Client(self.addresses, pool_size=4, timeout=1)
+
+    def tearDown(self):
+        self.first.stop()
+        self.second.stop()
+        super(AsyncClientTest, self).tearDown()
+
+    @gen_test
+    async def test_set_multi_get_multi(self):
+        mapping = dict(("key:{}".format(i), "value:{}".format(i)) for i in range(50))
+        mapping.update(VALUES)
+        self.assertEqual(await self.client.set_multi(mapping), [])
+        # 一致性哈希把key分到两台服务器上
+        self.assertTrue(self.first.data)
+        self.assertTrue(self.second.data)
+        self.assertEqual(len(self.first.data) + len(self.second.data), len(mapping))
+        self.assertEqual(await self.client.get_multi(list(mapping) + ["missing"]), mapping)
+
+    @gen_test
+    async def test_add_and_delete(self):
+        self.assertTrue(await self.client.add("k", "v1"))
+        self.assertFalse(await self.client.add("k", "v2"))
+        self.assertEqual(await self.client.get("k"), "v1")
+        self.assertEqual(await self.client.delete_multi(["k", "missing"]), 1)
+        self.assertIsNone(await self.client.get("k"))
+
+    @gen_test
+    async def test_failover(self):
+        key = next("user:{}".format(i) for i in range(1000)
+                   if self.client.ring.get_node("user:{}".format(i).encode()) == self.addresses[0])
+        self.first.stop()
+        # 第一次请求失败并把服务器标记为不可用，之后沿哈希环转移到第二台服务器
+        self.assertFalse(await self.client.set(key, "moved"))
+        self.assertFalse(self.client.servers[self.addresses[0]].alive())
+        self.assertTrue(await self.client.set(key, "moved"))
+        self.assertIn(key.encode(), self.second.data)
+        self.assertEqual(await self.client.get(key), "moved")
+
+
+class InteropTest(AsyncTestCase):
+    """
+    同步的RingClient和异步的Client使用相同的哈希环和编码，写入的缓存可以互相读取
+    """
+
+    def setUp(self):
+        super(InteropTest, self).setUp()
+        self.threads = [ServerThread(), ServerThread()]
+        for thread in self.threads:
+            thread.start()
+            thread.ready.wait()
+        addresses = [thread.address for thread in self.threads]
+        self.sync_client = RingClient(addresses, socket_timeout=1)
+        self.async_client = Client(addresses, timeout=1)
+
+    def tearDown(self):
+        self.sync_client.disconnect_all()
+        for thread in self.threads:
+            thread.stop()
+        super(InteropTest, self).tearDown()
+
+    def owner(self, key):
+        return next(thread.address for thread in self.threads if key.encode() in thread.server.data)
+
+    @gen_test
+    async def test_sync_write_async_read(self):
+        self.assertEqual(self.sync_client.set_multi(VALUES), [])
+        self.assertEqual(await self.async_client.get_multi(list(VALUES)), VALUES)
+        for key in VALUES:
+            self.assertEqual(self.owner(key), self.async_client.ring.get_node(key.encode()))
+
+    @gen_test
+    async def test_async_write_sync_read(self):
+        self.assertEqual(await self.async_client.set_multi(VALUES), [])
+        self.assertEqual(self.sync_client.get_multi(list(VALUES)), VALUES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+
+syncMysql连接池的测试：连接复用，空闲连接ping检测，空闲回收，归还时回滚和连接耗尽
+
+连接池通过creator创建连接，测试中使用记录调用的假连接代替mysql连接
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import time
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from pymysql.constants import SERVER_STATUS  # noqa: E402
+
+from ancient.module.syncMysql import ConnectionPool, PoolTimeoutError  # noqa: E402
+
+
+class FakeConnection:
+
+    def __init__(self, ping_error=None):
+        self.open = True
+        self.server_status = 0
+        self.pings = 0
+        self.rollbacks = 0
+        self.ping_error = ping_error
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.ping_error:
+            raise self.ping_error
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status &= ~SERVER_STATUS.SERVER_STATUS_IN_TRANS
+
+    def close(self):
+        self.open = False
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+
+    def creator(self):
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+    def test_reuse(self):
+        pool = ConnectionPool(self.creator, max_size=4)
+        first = pool.get()
+        pool.put(first)
+        self.assertIs(pool.get(), first)
+        second = pool.get()
+        self.assertIsNot(second, first)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(pool.size, 2)
+        # 新近归还的连接不需要ping
+        self.assertEqual(first.pings, 0)
+
+    def test_ping_idle_connection(self):
+        pool = ConnectionPool(self.creator, min_size=1, idle_seconds=0.05)
+        conn = pool.get()
+        pool.put(conn)
+        time.sleep(0.1)
+        # 保留的空闲连接超过idle_seconds，取出时先ping
+        self.assertIs(pool.get(), conn)
+        self.assertEqual(conn.pings, 1)
+
+    def test_failed_ping_discarded(self):
+        pool = ConnectionPool(lambda: FakeConnection(ping_error=OSError("gone")), min_size=1, idle_seconds=0.05)
+        conn = pool.get()
+        pool.put(conn)
+        time.sleep(0.1)
+        with self.assertRaises(OSError):
+            pool.get()
+        self.assertFalse(conn.open)
+        self.assertEqual(pool.size, 0)
+
+    def test_reap_idle_connections(self):
+        pool = ConnectionPool(self.creator, min_size=1, idle_seconds=0.05)
+        conns = [pool.get() for _ in range(3)]
+        for conn in conns:
+            pool.put(conn)
+        time.sleep(0.1)
+        pool.get()
+        # 超过min_size的空闲连接被关闭，最近归还的连接被保留
+        self.assertEqual([conn.open for conn in conns], [False, False, True])
+        self.assertEqual(pool.size, 1)
+
+    def test_put_rolls_back_and_discards_closed(self):
+        pool = ConnectionPool(self.creator)
+        in_trans, closed = pool.get(), pool.get()
+        in_trans.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        closed.open = False
+        pool.put(in_trans)
+        pool.put(closed)
+        self.assertEqual(in_trans.rollbacks, 1)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual([conn for conn, _ in pool.idle], [in_trans])
+
+    def test_exhausted(self):
+        pool = ConnectionPool(self.creator, max_size=1, wait_timeout=0.1)
+        conn = pool.get()
+        started = time.time()
+        with self.assertRaises(PoolTimeoutError):
+            pool.get()
+        self.assertGreaterEqual(time.time() - started, 0.1)
+        pool.put(conn)
+        self.assertIs(pool.get(), conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+
+多进程预派生模式的测试：主进程绑定端口后fork出workers个子进程，子进程崩溃后被重新拉起
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import time
+import signal
+import subprocess
+import unittest
+import urllib.request
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.netutil import bind_sockets  # noqa: E402
+
+
+def free_port():
+    sock = bind_sockets(0, "127.0.0.1")[0]
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def children(pid):
+    with open("/proc/{0}/task/{0}/children".format(pid)) as fp:
+        return set(int(child) for child in fp.read().split())
+
+
+def wait_until(predicate, timeout=20):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            result = predicate()
+            if result:
+                return result
+        except OSError:
+            pass
+        if time.time() > deadline:
+            raise AssertionError("condition not met in {}s".format(timeout))
+        time.sleep(0.1)
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/task"), "requires Linux procfs")
+class PreforkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.port = free_port()
+        env = dict(os.environ, MAD_TORNADO_SERVER__WORKERS="2", MAD_TORNADO_SERVER__PORT=str(self.port),
+                   MAD_TORNADO_SERVER__LISTEN="127.0.0.1", MAD_TORNADO_SERVER__REUSE_PORT="false",
+                   MAD_TORNADO_DEBUG__OPEN_LOG="false")
+        self.proc = subprocess.Popen([sys.executable, "server.py"], env=env, start_new_session=True,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def tearDown(self):
+        os.killpg(self.proc.pid, signal.SIGKILL)
+        self.proc.wait()
+
+    def pong(self):
+        with urllib.request.urlopen("http://127.0.0.1:{}/pong".format(self.port), timeout=5) as response:
+            return response.status == 200
+
+    def test_workers_share_port_and_restart(self):
+        wait_until(self.pong)
+        workers = wait_until(lambda: len(children(self.proc.pid)) == 2 and children(self.proc.pid))
+        crashed = min(workers)
+        os.kill(crashed, signal.SIGKILL)
+        # 主进程重新拉起崩溃的子进程，另一个子进程保持不变
+        restarted = wait_until(lambda: len(children(self.proc.pid) - {crashed}) == 2 and children(self.proc.pid))
+        self.assertNotIn(crashed, restarted)
+        self.assertIn(max(workers), restarted)
+        for _ in range(4):
+            self.assertTrue(wait_until(self.pong))
+
+
+if __name__ == "__main__":
+    unittest.main()
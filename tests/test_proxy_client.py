@@ -0,0 +1,202 @@
+"""
+
+proxyClient连接池和ProxyHandler的回归测试
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import ssl
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.httpclient import HTTPRequest  # noqa: E402
+from tornado import gen  # noqa: E402
+from tornado.testing import AsyncHTTPTestCase, AsyncHTTPSTestCase, gen_test  # noqa: E402
+from tornado.web import Application, RequestHandler, stream_request_body  # noqa: E402
+
+from ancient.handlers.dealHandler import ProxyHandler  # noqa: E402
+from ancient.rig import proxyClient  # noqa: E402
+from ancient.rig.proxyClient import Upstream  # noqa: E402
+
+
+class HelloHandler(RequestHandler):
+    def get(self):
+        self.write("hello")
+
+
+class LengthHandler(RequestHandler):
+    def post(self):
+        self.write(str(len(self.request.body)))
+
+
+@stream_request_body
+class StreamLengthHandler(RequestHandler):
+    def prepare(self):
+        self.request.connection.set_max_body_size(1024 * 1024)
+        self.length = 0
+
+    def data_received(self, chunk):
+        self.length += len(chunk)
+
+    def post(self):
+        self.write(str(self.length))
+
+
+class SlowHandler(RequestHandler):
+    async def get(self):
+        await gen.sleep(1)
+        self.write("slow")
+
+
+class KeepAliveTLSTest(AsyncHTTPSTestCase):
+    """
+    https上游的空闲连接被复用时不能因为检查连接状态而失败
+    """
+
+    def get_app(self):
+        return Application([(r"/", HelloHandler)])
+
+    @gen_test
+    async def test_reuse_tls_connection(self):
+        upstream = Upstream("tls", [self.get_url("")], client="simple")
+        try:
+            for _ in range(3):
+                response = await upstream.fetch(HTTPRequest(self.get_url("/"), validate_cert=False))
+                self.assertEqual(response.code, 200)
+                self.assertEqual(response.body, b"hello")
+            stats = upstream.stats()
+            self.assertEqual(stats["connections_created"], 1)
+            self.assertEqual(stats["connections_reused"], 2)
+        finally:
+            upstream.close()
+
+    @gen_test
+    async def test_verified_request_not_reuse_unverified_connection(self):
+        upstream = Upstream("tls", [self.get_url("")], client="simple")
+        try:
+            response = await upstream.fetch(HTTPRequest(self.get_url("/"), validate_cert=False))
+            self.assertEqual(response.code, 200)
+            # 测试服务器使用自签名证书，校验证书的请求必须建立新连接并且校验失败
+            with self.assertRaises(ssl.SSLError):
+                await upstream.fetch(HTTPRequest(self.get_url("/"), validate_cert=True))
+            self.assertEqual(upstream.stats()["connections_reused"], 0)
+        finally:
+            upstream.close()
+
+
+class KeepAliveTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/", HelloHandler)])
+
+    @gen_test
+    async def test_closed_connection_not_reused(self):
+        upstream = Upstream("plain", [self.get_url("")], client="simple")
+        try:
+            response = await upstream.fetch(HTTPRequest(self.get_url("/")))
+            self.assertEqual(response.code, 200)
+            await self.http_server.close_all_connections()
+            response = await upstream.fetch(HTTPRequest(self.get_url("/")))
+            self.assertEqual(response.code, 200)
+            self.assertEqual(upstream.stats()["connections_created"], 2)
+        finally:
+            upstream.close()
+
+
+class SlowUploadTest(AsyncHTTPTestCase):
+    """
+    上传时间超过request_timeout的流式请求体不能被上游客户端超时中断
+    """
+
+    def get_app(self):
+        option = {"proxy_option": {"instead": "/proxy/slow", "address": self.get_url(""),
+                                   "host": "127.0.0.1:{}".format(self.get_http_port()), "upstream": "slow"}}
+        return Application([(r"/length", LengthHandler), (r"/proxy/slow/.*", ProxyHandler, option)])
+
+    def setUp(self):
+        super(SlowUploadTest, self).setUp()
+        proxyClient._upstreams["slow"] = Upstream("slow", [self.get_url("")], client="simple",
+                                                  request_timeout=0.5, upload_timeout=10)
+
+    def tearDown(self):
+        proxyClient._upstreams.pop("slow").close()
+        super(SlowUploadTest, self).tearDown()
+
+    @gen_test
+    async def test_upload_slower_than_request_timeout(self):
+        async def producer(write):
+            for _ in range(4):
+                await write(b"x" * 1024)
+                await gen.sleep(0.25)
+
+        response = await self.http_client.fetch(HTTPRequest(
+            self.get_url("/proxy/slow/length"), method="POST", body_producer=producer,
+            headers={"Transfer-Encoding": "chunked"}, request_timeout=10))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"4096")
+
+
+class UnlimitedBodyTest(AsyncHTTPTestCase):
+    """
+    max_body_size为0时代理路由的请求体不受HTTPServer的max_body_size限制
+    """
+
+    def get_app(self):
+        option = {"proxy_option": {"instead": "/proxy/large", "address": self.get_url(""),
+                                   "host": "127.0.0.1:{}".format(self.get_http_port()), "upstream": "large"}}
+        return Application([(r"/length", StreamLengthHandler), (r"/proxy/large/.*", ProxyHandler, option)])
+
+    def get_httpserver_options(self):
+        return {"max_body_size": 1024}
+
+    def setUp(self):
+        super(UnlimitedBodyTest, self).setUp()
+        proxyClient._upstreams["large"] = Upstream("large", [self.get_url("")], client="simple")
+
+    def tearDown(self):
+        proxyClient._upstreams.pop("large").close()
+        super(UnlimitedBodyTest, self).tearDown()
+
+    def test_body_larger_than_server_limit(self):
+        response = self.fetch("/proxy/large/length", method="POST", body=b"x" * 8192)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"8192")
+
+
+class UpstreamFailureTest(AsyncHTTPTestCase):
+    """
+    上游超时等传输错误在重试之后返回502，并记为后端失败
+    """
+
+    def get_app(self):
+        option = {"proxy_option": {"instead": "/proxy/timeout", "address": self.get_url(""),
+                                   "host": "127.0.0.1:{}".format(self.get_http_port()), "upstream": "timeout"}}
+        return Application([(r"/slow", SlowHandler), (r"/proxy/timeout/.*", ProxyHandler, option)])
+
+    def setUp(self):
+        super(UpstreamFailureTest, self).setUp()
+        proxyClient._upstreams["timeout"] = Upstream("timeout", [self.get_url("")], client="simple",
+                                                     request_timeout=0.2, retries=1)
+
+    def tearDown(self):
+        proxyClient._upstreams.pop("timeout").close()
+        super(UpstreamFailureTest, self).tearDown()
+
+    def test_timeout_returns_502(self):
+        response = self.fetch("/proxy/timeout/slow")
+        self.assertEqual(response.code, 502)
+        stats = proxyClient._upstreams["timeout"].stats()
+        self.assertEqual(stats["retried"], 1)
+        self.assertEqual(stats["backends"][self.get_url("")]["fails"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+
+ProxyHandler响应体合并的测试：上游的小块合并到coalesce_bytes或等待coalesce_delay后写出，
+写给客户端的flush完成之前不再读取上游的响应
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado import gen  # noqa: E402
+from tornado.locks import Event  # noqa: E402
+from tornado.testing import AsyncHTTPTestCase, gen_test  # noqa: E402
+from tornado.web import Application, RequestHandler  # noqa: E402
+
+from ancient.handlers.dealHandler import ProxyHandler  # noqa: E402
+from ancient.rig import proxyClient  # noqa: E402
+from ancient.rig.proxyClient import Upstream  # noqa: E402
+
+flushes = []
+received = []
+
+
+class ChunksHandler(RequestHandler):
+
+    async def get(self):
+        count = int(self.get_argument("count"))
+        size = int(self.get_argument("size"))
+        pause = float(self.get_argument("pause", "0"))
+        for i in range(count):
+            self.write(str(i % 10).encode() * size)
+            await self.flush()
+            if pause:
+                await gen.sleep(pause)
+
+
+class RecordingProxyHandler(ProxyHandler):
+    hold = None
+
+    # @override
+    def initialize(self, coalesce_bytes=65536, coalesce_delay=10, **kwargs):
+        super(RecordingProxyHandler, self).initialize(**kwargs)
+        self.coalesce_bytes = coalesce_bytes
+        self.coalesce_delay = coalesce_delay / 1000
+
+    # @override
+    def proxy_received_body(self, chunk):
+        received.append(len(chunk))
+        return super(RecordingProxyHandler, self).proxy_received_body(chunk)
+
+    # @override
+    def flush_body(self):
+        if self.body_chunks:
+            flushes.append(self.body_buffered)
+        return super(RecordingProxyHandler, self).flush_body()
+
+    # @override
+    def flush(self, include_footers=False):
+        future = super(RecordingProxyHandler, self).flush(include_footers)
+        hold = RecordingProxyHandler.hold
+        if hold is None:
+            return future
+
+        async def held():
+            await future
+            await hold.wait()
+
+        return gen.convert_yielded(held())
+
+
+def expected_body(count, size):
+    return b"".join(str(i % 10).encode() * size for i in range(count))
+
+
+class CoalesceTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        def route(prefix, **option):
+            option["proxy_option"] = {"instead": prefix, "address": self.get_url(""),
+                                      "host": "127.0.0.1:{}".format(self.get_http_port()),
+                                      "upstream": "coalesce"}
+            return r"{}/.*".format(prefix), RecordingProxyHandler, option
+
+        return Application([
+            (r"/chunks", ChunksHandler),
+            route("/proxy/bytes", coalesce_bytes=1000, coalesce_delay=10000),
+            route("/proxy/delay", coalesce_bytes=65536, coalesce_delay=50),
+            route("/proxy/direct", coalesce_bytes=65536, coalesce_delay=0),
+        ])
+
+    def setUp(self):
+        super(CoalesceTest, self).setUp()
+        proxyClient._upstreams["coalesce"] = Upstream("coalesce", [self.get_url("")], client="simple")
+        flushes.clear()
+        received.clear()
+        RecordingProxyHandler.hold = None
+
+    def tearDown(self):
+        RecordingProxyHandler.hold = None
+        proxyClient._upstreams.pop("coalesce").close()
+        super(CoalesceTest, self).tearDown()
+
+    def test_coalesce_bytes(self):
+        response = self.fetch("/proxy/bytes/chunks?count=25&size=100")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, expected_body(25, 100))
+        self.assertLess(len(flushes), len(received))
+        # 达到coalesce_bytes时写出，最后不足的部分在结束时写出
+        self.assertTrue(all(size >= 1000 for size in flushes[:-1]))
+        self.assertEqual(sum(flushes), 2500)
+
+    def test_coalesce_delay(self):
+        response = self.fetch("/proxy/delay/chunks?count=3&size=10&pause=0.2")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, expected_body(3, 10))
+        # 上游停顿超过coalesce_delay，每块都由定时器单独写出
+        self.assertEqual(flushes, [10, 10, 10])
+
+    def test_no_delay(self):
+        response = self.fetch("/proxy/direct/chunks?count=5&size=10")
+        self.assertEqual(response.body, expected_body(5, 10))
+        self.assertEqual(flushes, received)
+
+    @gen_test
+    async def test_backpressure(self):
+        RecordingProxyHandler.hold = Event()
+        future = self.http_client.fetch(self.get_url("/proxy/direct/chunks?count=5&size=10"))
+        while not received:
+            await gen.sleep(0.01)
+        await gen.sleep(0.2)
+        # flush没有完成之前不读取上游的下一块
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(flushes), 1)
+        RecordingProxyHandler.hold.set()
+        response = await future
+        self.assertEqual(response.body, expected_body(5, 10))
+        self.assertEqual(len(flushes), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+
+responseCache响应缓存的测试：命中，未命中，Vary，标签失效和ETag
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.testing import AsyncHTTPTestCase  # noqa: E402
+from tornado.web import Application  # noqa: E402
+
+from ancient.handlers.baseHandler import BaseHandler  # noqa: E402
+from ancient.rig.responseCache import MemoryBackend, cached, invalidate  # noqa: E402
+
+backend = MemoryBackend()
+calls = []
+
+
+class ArticleHandler(BaseHandler):
+
+    @cached(ttl=60, query=["page"], vary=["Accept-Language"], tags=["article"], backend=backend)
+    async def get(self):
+        calls.append(self.request.uri)
+        self.set_header("X-Custom", "article")
+        self.write("{}:{}:{}".format(self.request.headers.get("Accept-Language", ""),
+                                     self.get_argument("page", "1"), len(calls)))
+
+
+class CookieHandler(BaseHandler):
+
+    @cached(ttl=60, backend=backend)
+    def get(self):
+        calls.append(self.request.uri)
+        self.set_cookie("session", "1")
+        self.write("cookie")
+
+
+class StreamHandler(BaseHandler):
+
+    @cached(ttl=60, backend=backend)
+    async def get(self):
+        calls.append(self.request.uri)
+        await self.write_array_stream(range(10), chunk_rows=3)
+
+
+class ResponseCacheTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/article", ArticleHandler), (r"/cookie", CookieHandler),
+                            (r"/stream", StreamHandler)])
+
+    def setUp(self):
+        super(ResponseCacheTest, self).setUp()
+        backend.cache.clear()
+        calls.clear()
+
+    def test_miss_then_hit(self):
+        first = self.fetch("/article")
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        second = self.fetch("/article")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(second.headers["X-Custom"], "article")
+        self.assertEqual(second.headers["Etag"], first.headers["Etag"])
+        self.assertEqual(len(calls), 1)
+
+    def test_query_filter(self):
+        self.fetch("/article?page=2&t=1")
+        response = self.fetch("/article?page=2&t=2")
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+        response = self.fetch("/article?page=3")
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(len(calls), 2)
+
+    def test_vary_header(self):
+        en = self.fetch("/article", headers={"Accept-Language": "en"})
+        zh = self.fetch("/article", headers={"Accept-Language": "zh"})
+        self.assertEqual(zh.headers["X-Cache"], "MISS")
+        self.assertNotEqual(en.body, zh.body)
+        self.assertEqual(self.fetch("/article", headers={"Accept-Language": "en"}).body, en.body)
+        self.assertEqual(self.fetch("/article", headers={"Accept-Language": "zh"}).body, zh.body)
+        self.assertEqual(len(calls), 2)
+
+    def test_tag_invalidation(self):
+        self.fetch("/article")
+        invalidate("article", backend=backend)
+        response = self.fetch("/article")
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.fetch("/article").headers["X-Cache"], "HIT")
+
+    def test_hit_not_modified(self):
+        etag = self.fetch("/article").headers["Etag"]
+        response = self.fetch("/article", headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+
+    def test_miss_not_modified_still_stored(self):
+        response = self.fetch("/article", headers={"If-None-Match": "*"})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        response = self.fetch("/article")
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+        self.assertEqual(response.body, b":1:1")
+
+    def test_cookie_not_cached(self):
+        self.fetch("/cookie")
+        response = self.fetch("/cookie")
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(len(calls), 2)
+
+    def test_streamed_not_cached(self):
+        self.assertEqual(self.fetch("/stream").body, b"[0,1,2,3,4,5,6,7,8,9]")
+        response = self.fetch("/stream")
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
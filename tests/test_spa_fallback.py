@@ -0,0 +1,142 @@
+"""
+
+SPA页面回退的测试：StaticIndex文件索引，前端路由直接返回SPA页面，索引过期时的回退流程
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from tornado.testing import AsyncHTTPTestCase  # noqa: E402
+from tornado.web import Application  # noqa: E402
+
+from ancient.handlers.dealHandler import StaticHandler  # noqa: E402
+from ancient.rig import staticCache  # noqa: E402
+from ancient.rig.staticCache import StaticIndex  # noqa: E402
+
+SPA_PAGE = b"<html>spa</html>"
+
+
+def make_root():
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "js"))
+    with open(os.path.join(root, "index.html"), "wb") as fp:
+        fp.write(SPA_PAGE)
+    with open(os.path.join(root, "js", "app.js"), "wb") as fp:
+        fp.write(b"app()")
+    return root
+
+
+def touch_later(path, content):
+    # 保证目录的修改时间发生变化
+    time.sleep(0.01)
+    with open(path, "wb") as fp:
+        fp.write(content)
+
+
+class StaticIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = make_root()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_exists(self):
+        index = StaticIndex(self.root, interval=60)
+        self.assertTrue(index.exists("index.html"))
+        self.assertTrue(index.exists("js/app.js"))
+        self.assertTrue(index.exists("js"))
+        self.assertTrue(index.exists("js/"))
+        self.assertTrue(index.exists(""))
+        self.assertFalse(index.exists("js/missing.js"))
+        self.assertFalse(index.exists("user/1"))
+
+    def test_refresh_on_mtime(self):
+        index = StaticIndex(self.root, interval=60)
+        touch_later(os.path.join(self.root, "js", "new.js"), b"new()")
+        # 检查间隔内不重新扫描
+        self.assertFalse(index.exists("js/new.js"))
+        index.interval = 0
+        self.assertTrue(index.exists("js/new.js"))
+        self.assertEqual(index.scans, 2)
+        # 目录没有变化时不重新扫描
+        self.assertTrue(index.exists("js/new.js"))
+        self.assertEqual(index.scans, 2)
+
+
+class RecordingStaticHandler(StaticHandler):
+    validated = []
+
+    # @override
+    def validate_absolute_path(self, root, absolute_path):
+        self.validated.append(os.path.relpath(absolute_path, root))
+        return super(RecordingStaticHandler, self).validate_absolute_path(root, absolute_path)
+
+
+class SpaFallbackTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        self.root = make_root()
+        self.index = staticCache._static_indexes[self.root] = StaticIndex(self.root, interval=60)
+        RecordingStaticHandler.validated = []
+        super(SpaFallbackTest, self).setUp()
+
+    def tearDown(self):
+        super(SpaFallbackTest, self).tearDown()
+        staticCache._static_indexes.pop(self.root)
+        shutil.rmtree(self.root)
+
+    def get_app(self):
+        return Application([(r"/(.*)", RecordingStaticHandler,
+                             {"path": self.root, "default_filename": "index.html", "spa_page": "index.html"})])
+
+    def test_file(self):
+        response = self.fetch("/js/app.js")
+        self.assertEqual(response.body, b"app()")
+        self.assertEqual(RecordingStaticHandler.validated, ["js/app.js"])
+
+    def test_deep_link(self):
+        for path in ("/user/1", "/js/missing.js", "/user/2"):
+            response = self.fetch(path)
+            self.assertEqual(response.code, 200)
+            self.assertEqual(response.body, SPA_PAGE)
+        # 前端路由不再先查找请求路径，SPA页面从内存缓存返回
+        self.assertNotIn("user/1", RecordingStaticHandler.validated)
+        self.assertLessEqual(RecordingStaticHandler.validated.count("index.html"), 1)
+
+    def test_head_deep_link(self):
+        response = self.fetch("/user/1", method="HEAD")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"")
+        self.assertEqual(int(response.headers["Content-Length"]), len(SPA_PAGE))
+
+    def test_deleted_file_falls_back(self):
+        os.remove(os.path.join(self.root, "js", "app.js"))
+        # 索引尚未刷新，查找失败后仍然返回SPA页面
+        self.assertTrue(self.index.exists("js/app.js"))
+        response = self.fetch("/js/app.js")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, SPA_PAGE)
+
+    def test_new_file_after_refresh(self):
+        touch_later(os.path.join(self.root, "js", "new.js"), b"new()")
+        self.assertEqual(self.fetch("/js/new.js").body, SPA_PAGE)
+        self.index.interval = 0
+        self.assertEqual(self.fetch("/js/new.js").body, b"new()")
+
+
+if __name__ == "__main__":
+    unittest.main()
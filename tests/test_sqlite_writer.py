@@ -0,0 +1,114 @@
+"""
+
+syncSqlite单写队列的测试：合并提交，savepoint隔离单个操作，事务失败和队列关闭
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from ancient.module.syncSqlite import WriteQueue, connect, execute_input  # noqa: E402
+
+INSERT = "insert into item (id, name) values (?, ?)"
+
+
+class WriteQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "test.db")
+        conn = connect(self.path)
+        conn.execute("create table item (id integer primary key, name text)")
+        conn.commit()
+        conn.close()
+        self.writer = None
+
+    def tearDown(self):
+        if self.writer:
+            self.writer.close()
+        shutil.rmtree(self.tmp)
+
+    def rows(self):
+        conn = connect(self.path)
+        rows = conn.execute("select id, name from item order by id").fetchall()
+        conn.close()
+        return rows
+
+    def test_group_commit(self):
+        self.writer = WriteQueue(self.path, max_batch=16)
+        started, release = threading.Event(), threading.Event()
+        statements = []
+
+        def block(conn):
+            conn.set_trace_callback(statements.append)
+            started.set()
+            release.wait(5)
+
+        first = self.writer.submit(block)
+        started.wait(5)
+        futures = [self.writer.submit(execute_input, INSERT, [i, "n{}".format(i)]) for i in range(5)]
+        release.set()
+        self.assertEqual([future.result(5).last_rowid for future in futures], list(range(5)))
+        first.result(5)
+        # 写线程阻塞期间排队的5个操作合并在同一个事务中提交
+        self.assertEqual(statements.count("begin immediate"), 1)
+        self.assertEqual(statements.count("commit"), 2)
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_savepoint_isolation(self):
+        conn = connect(self.path)
+        conn.isolation_level = None
+        batch = [(Future(), execute_input, (INSERT, [1, "a"])),
+                 (Future(), execute_input, (INSERT, [1, "duplicate"])),
+                 (Future(), execute_input, (INSERT, [2, "b"]))]
+        WriteQueue.commit(conn, batch)
+        conn.close()
+        self.assertEqual(batch[0][0].result().affect, 1)
+        self.assertIsInstance(batch[1][0].exception(), Exception)
+        self.assertEqual(batch[2][0].result().affect, 1)
+        self.assertEqual(self.rows(), [(1, "a"), (2, "b")])
+
+    def test_transaction_failure(self):
+        conn = connect(self.path)
+        conn.isolation_level = None
+        cancelled = Future()
+        cancelled.cancel()
+
+        def broken(conn):
+            # 结束整个事务，之后释放savepoint失败
+            conn.execute("rollback")
+
+        batch = [(Future(), execute_input, (INSERT, [1, "a"])), (cancelled, execute_input, (INSERT, [2, "b"])),
+                 (Future(), broken, ()), (Future(), execute_input, (INSERT, [3, "c"]))]
+        WriteQueue.commit(conn, batch)
+        conn.close()
+        errors = [batch[i][0].exception() for i in (0, 2, 3)]
+        self.assertTrue(all(isinstance(error, Exception) for error in errors))
+        self.assertIs(errors[0], errors[1])
+        self.assertTrue(cancelled.cancelled())
+        self.assertEqual(self.rows(), [])
+
+    def test_close_drains_queue(self):
+        writer = WriteQueue(self.path, max_batch=4)
+        futures = [writer.submit(execute_input, INSERT, [i, "n{}".format(i)]) for i in range(10)]
+        writer.close()
+        self.assertFalse(writer.thread.is_alive())
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(len(self.rows()), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+
+多进程监管的测试：SIGHUP平滑重启，超时强制结束旧工作进程，崩溃工作进程的退避重启
+
+工作进程使用一个很小的Python脚本代替，脚本按照参数决定就绪后正常运行，忽略SIGTERM或者直接崩溃
+
+运行方式::
+
+    python -m pytest -q tests
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import time
+import signal
+import threading
+import unittest
+
+MAD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../madtornado"))
+sys.path.insert(0, MAD_PATH)
+os.chdir(MAD_PATH)
+
+from server import Supervisor  # noqa: E402
+
+WORKER = """
+import os, sys, time, signal
+mode = sys.argv[1]
+if mode == "crash":
+    sys.exit(1)
+if mode == "stubborn":
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+else:
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+fd = int(os.environ["MAD_READY_FD"])
+os.write(fd, b"1")
+os.close(fd)
+while True:
+    time.sleep(0.1)
+"""
+
+
+class FakeSupervisor(Supervisor):
+
+    def __init__(self, workers, drain_timeout, mode="serve"):
+        super(FakeSupervisor, self).__init__(workers, drain_timeout)
+        self.mode = mode
+        self.spawned = 0
+
+    # @override
+    def command(self, index):
+        self.spawned += 1
+        return [sys.executable, "-c", WORKER, self.mode]
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("condition not met in {}s".format(timeout))
+        time.sleep(0.05)
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = None
+
+    def tearDown(self):
+        if self.supervisor:
+            for proc in self.supervisor.generation + [proc for proc, _ in self.supervisor.retiring]:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+
+    def start(self, supervisor):
+        self.supervisor = supervisor
+        spawned = [supervisor.spawn(i) for i in range(supervisor.workers)]
+        supervisor.wait_ready(spawned)
+        supervisor.adopt([proc for proc, _ in spawned])
+        return supervisor
+
+    def test_sighup_reload(self):
+        supervisor = self.supervisor = FakeSupervisor(2, drain_timeout=1)
+        handlers = dict((signum, signal.getsignal(signum)) for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT))
+        seen = {}
+
+        def operate():
+            wait_until(lambda: len(supervisor.generation) == 2)
+            seen["old"] = list(supervisor.generation)
+            os.kill(os.getpid(), signal.SIGHUP)
+            wait_until(lambda: supervisor.generation != seen["old"])
+            seen["new"] = list(supervisor.generation)
+            wait_until(lambda: all(proc.poll() is not None for proc in seen["old"]))
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        thread = threading.Thread(target=operate, daemon=True)
+        thread.start()
+        try:
+            supervisor.run()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        thread.join()
+        self.assertEqual(supervisor.spawned, 4)
+        self.assertEqual(len(seen["new"]), 2)
+        # 旧工作进程收到SIGTERM后正常退出，新工作进程在监管进程停止时退出
+        self.assertEqual([proc.returncode for proc in seen["old"]], [0, 0])
+        self.assertEqual([proc.returncode for proc in seen["new"]], [0, 0])
+        self.assertEqual(supervisor.retiring, [])
+
+    def test_retire_kill_after_deadline(self):
+        supervisor = self.start(FakeSupervisor(1, drain_timeout=0.2, mode="stubborn"))
+        supervisor.kill_grace = 0
+        proc = supervisor.generation[0]
+        supervisor.retire([proc])
+        supervisor.generation = []
+        supervisor.reap()
+        # 忽略SIGTERM的旧工作进程在截止时间之前保持运行
+        self.assertIsNone(proc.poll())
+        wait_until(lambda: supervisor.reap() or not supervisor.retiring, timeout=5)
+        self.assertEqual(proc.returncode, -signal.SIGKILL)
+
+    def test_crash_backoff(self):
+        supervisor = self.start(FakeSupervisor(1, drain_timeout=1))
+        supervisor.restart_delay = 0.2
+        supervisor.mode = "crash"
+        supervisor.generation[0].terminate()
+        supervisor.generation[0].wait()
+        started = time.time()
+        while time.time() - started < 1.6:
+            supervisor.reap()
+            time.sleep(0.02)
+        # 等待时间依次为0.2，0.4，0.8秒，没有退避时每次reap都会重新拉起
+        self.assertEqual(supervisor.spawned, 1 + 3)
+        self.assertEqual(supervisor.failures[0], 4)
+
+    def test_restarted_worker_ready(self):
+        supervisor = self.start(FakeSupervisor(1, drain_timeout=1))
+        supervisor.stable_time = 0
+        old = supervisor.generation[0]
+        old.terminate()
+        old.wait()
+        supervisor.reap()
+        self.assertIsNot(supervisor.generation[0], old)
+        self.assertIn(0, supervisor.starting)
+        wait_until(lambda: supervisor.reap() or 0 not in supervisor.starting)
+        self.assertIn(0, supervisor.ready_at)
+        self.assertEqual(supervisor.failures[0], 0)
+        # 就绪后稳定运行过的工作进程再次退出时立即重新拉起
+        supervisor.generation[0].terminate()
+        supervisor.generation[0].wait()
+        supervisor.reap()
+        self.assertEqual(supervisor.spawned, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()